@@ -14,14 +14,54 @@ class Settings(BaseSettings):
     
     # 数据库设置
     database_url: str = "sqlite:///./database/shangfen_api.db"
+    read_database_url: Optional[str] = None  # 报表只读连接（为空时与 database_url 相同）
+    database_pool_size: int = 5  # 主库连接池大小（文件数据库）
+    database_max_overflow: int = 10  # 主库连接池允许临时超出的连接数
+    read_pool_size: int = 5  # 报表只读连接池大小
     
     # 安全设置
     secret_key: str = "your-secret-key-here-change-in-production"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     
+    # 密码哈希设置
+    bcrypt_rounds: int = 12  # bcrypt 成本因子，修改后用户下次登录时自动重新哈希
+    password_hash_workers: int = 4  # 同时进行的哈希计算数
+    password_hash_max_pending: int = 8  # 最多排队的哈希请求数，超出时直接拒绝（另受连接池容量限制）
+    password_hash_queue_timeout: float = 5.0  # 排队等待超时（秒）
+    
+    # API密钥设置
+    api_key_header: str = "X-API-Key"  # 程序化客户端携带密钥的请求头
+    api_key_cache_ttl: float = 30.0  # 已认证身份的缓存时间（秒），吊销后最迟在此时间后失效
+    api_key_cache_size: int = 10000  # 身份缓存最大条目数
+    
     # API设置
     shangfen_api_url: str = "https://shangfen622.info/api/v2"
+    catalog_upstream_ttl: float = 300.0  # 上游服务目录缓存时间（秒）
+    
+    # 模板设置
+    template_bytecode_cache_dir: str = "database/template_cache"  # 模板字节码缓存目录，为空时不启用
+    template_fragment_ttl: float = 3600.0  # 片段缓存时间（秒）
+    template_fragment_cache_size: int = 256  # 片段缓存最大条目数
+    
+    # 富通支付设置（可用环境变量 FUTOON_PID / FUTOON_KEY / FUTOON_API_URL 覆盖）
+    futoon_pid: str = "2208"
+    futoon_key: str = "2m57wWbSnqs52ZmQMMpLUxLel6wXSzup"
+    futoon_api_url: str = "https://futoon.org/mapi.php"
+    futoon_query_url: str = "https://futoon.org/api.php"
+    futoon_timeout: float = 10.0  # 单次调用截止时间（秒）
+    futoon_connect_timeout: float = 3.0  # 建立连接超时（秒）
+    futoon_max_connections: int = 20  # 连接池上限
+    futoon_max_keepalive: int = 10  # 保持的空闲长连接数
+    futoon_keepalive_expiry: float = 30.0  # 空闲长连接保留时间（秒）
+    
+    # 支付对账设置
+    payment_reconcile_interval_seconds: float = 300.0  # 对账间隔（秒），为 0 时不启动
+    payment_reconcile_min_age_seconds: float = 300.0  # 创建超过多久仍未回调的订单才查询
+    payment_reconcile_batch_size: int = 200  # 每轮最多查询的订单数
+    payment_reconcile_concurrency: int = 5  # 同时进行的网关查询数
+    payment_reconcile_rate: float = 10.0  # 每秒最多发起的网关查询数
+    payment_intent_expire_hours: float = 24.0  # 超过多久仍未支付的订单标记为过期
     
     # 会员等级设置
     member_levels: dict = {
@@ -34,6 +74,26 @@ class Settings(BaseSettings):
     # 分页设置
     items_per_page: int = 20
     
+    # 返佣后台任务设置
+    commission_worker_interval: float = 2.0  # 空闲时轮询间隔（秒）
+    commission_batch_size: int = 200  # 每批处理的订单数
+    
+    # 钱包快照汇总间隔（秒）
+    wallet_rollup_interval: float = 60.0
+    
+    # 冷数据归档设置
+    archive_database_path: str = "database/shangfen_archive.db"  # 归档库路径（ATTACH 为 archive），为空时不挂载
+    archive_after_days: int = 180  # 下单超过该天数且已结算的订单移入归档库
+    archive_batch_size: int = 500  # 每批归档的订单数（每批单独提交，避免长时间持有写锁）
+    
+    # 在线备份设置
+    backup_dir: str = "database/backups"  # 备份目录
+    backup_interval_hours: float = 24.0  # 定时备份间隔（小时），为 0 时不启动定时备份
+    backup_pages_per_step: int = 256  # 每步复制的页数
+    backup_step_sleep: float = 0.005  # 每步之间暂停的秒数，让出数据库锁
+    backup_keep_last: int = 7  # 保留最近的备份份数（主库和归档库同一时间戳的备份算一份）
+    backup_keep_daily_days: int = 30  # 最近多少天内每天保留一份
+    
     class Config:
         env_file = ".env"
 
@@ -1,11 +1,14 @@
 """
 数据库配置和初始化
 """
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, MetaData, inspect, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import text
 import os
+import weakref
+from typing import Optional
 
 from app.config import settings
 
@@ -13,13 +16,81 @@ from app.config import settings
 os.makedirs("database", exist_ok=True)
 
 # 创建数据库引擎
+def _pool_options(url: str) -> dict:
+    """文件数据库使用固定大小的连接池，内存库沿用默认连接池"""
+    target = make_url(url)
+    if target.get_backend_name() == "sqlite" and target.database in (None, "", ":memory:"):
+        return {}
+    return {"pool_size": settings.database_pool_size, "max_overflow": settings.database_max_overflow}
+
 engine = create_engine(
     settings.database_url,
-    connect_args={"check_same_thread": False}  # SQLite特定设置
+    connect_args={"check_same_thread": False},  # SQLite特定设置
+    **_pool_options(settings.database_url)
 )
 
+# 归档库挂载名，冷数据表位于 archive.<表名>
+ARCHIVE_SCHEMA = "archive"
+
+# 已挂载归档库的引擎，未挂载的引擎不读取归档数据
+archive_engines = weakref.WeakSet()
+
+def attach_archive(target_engine, path: str) -> None:
+    """为引擎的每个新连接挂载归档库"""
+    @event.listens_for(target_engine, "connect")
+    def _attach(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (path,))
+    archive_engines.add(target_engine)
+
+if settings.archive_database_path and engine.dialect.name == "sqlite":
+    attach_archive(engine, settings.archive_database_path)
+
+def _is_file_sqlite(target_engine) -> bool:
+    return target_engine.dialect.name == "sqlite" and target_engine.url.database not in (None, "", ":memory:")
+
+if _is_file_sqlite(engine):
+    @event.listens_for(engine, "connect")
+    def _enable_wal(dbapi_connection, connection_record):
+        """WAL 模式下读不阻塞写，报表只读连接可以读取一致的快照"""
+        dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+def create_read_engine(url: str, pool_size: int = 5, archive_path: Optional[str] = None):
+    """创建报表只读引擎：独立连接池，连接设为 query_only，每个会话读取一个 WAL 快照"""
+    target = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        pool_size=pool_size,
+        max_overflow=0
+    )
+    if archive_path:
+        attach_archive(target, archive_path)
+
+    @event.listens_for(target, "connect")
+    def _read_only(dbapi_connection, connection_record):
+        # 由 SQLAlchemy 控制事务边界，见下方 begin 事件
+        dbapi_connection.isolation_level = None
+        dbapi_connection.execute("PRAGMA query_only = ON")
+
+    @event.listens_for(target, "begin")
+    def _begin_snapshot(conn):
+        # 显式开启读事务，同一个会话内的多条查询读取同一个快照
+        conn.exec_driver_sql("BEGIN")
+
+    return target
+
+# 报表只读引擎不占用下单、支付回调使用的连接；内存数据库无法共享，直接使用主引擎
+if _is_file_sqlite(engine):
+    read_engine = create_read_engine(
+        settings.read_database_url or settings.database_url,
+        pool_size=settings.read_pool_size,
+        archive_path=settings.archive_database_path or None
+    )
+else:
+    read_engine = engine
+
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 # 创建基础模型类
 Base = declarative_base()
@@ -35,10 +106,112 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db():
+    """获取只读数据库会话（管理后台、代理报表使用）"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def add_missing_columns():
+    """为已存在的表补加模型中新增的列（create_all 不会修改已有表）
+
+    只处理可为空的列，SQLite 的 ALTER TABLE ADD COLUMN 不支持非空且无默认值的列。
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+                print(f"✅ 已为 {table.name} 添加列 {column.name}")
+
+MONEY_MIGRATION_KEY = "money_minor_units"
+MONEY_SCALE_KEY = "money_wallet_scale_4"
+
+# 曾按分（scale=2）存储、现改为万分之一元（scale=4）的列
+RESCALED_MONEY_COLUMNS = [
+    ("users", "balance"), ("users", "total_consumed"), ("users", "total_cashback"),
+    ("wallet_entries", "amount"), ("wallet_snapshots", "balance"),
+]
+
+def rescale_money_columns():
+    """余额、钱包流水和快照从分改为万分之一元（只执行一次）
+
+    订单扣款、返现和返佣都是4位小数，按分记账会把不足一分的金额舍掉。
+    尚未转换为整数的旧库由 migrate_money_columns 直接按新精度转换，这里只记录标记。
+    """
+    with engine.begin() as conn:
+        done = {
+            key: value for key, value in conn.execute(
+                text("SELECT setting_key, setting_value FROM settings WHERE setting_key IN (:minor, :scale)"),
+                {"minor": MONEY_MIGRATION_KEY, "scale": MONEY_SCALE_KEY}
+            )
+        }
+        if done.get(MONEY_SCALE_KEY) == "1":
+            return
+        
+        if done.get(MONEY_MIGRATION_KEY) == "1":
+            for table_name, column_name in RESCALED_MONEY_COLUMNS:
+                conn.execute(text(
+                    f'UPDATE {table_name} SET "{column_name}" = "{column_name}" * 100 WHERE "{column_name}" IS NOT NULL'
+                ))
+            print("✅ 余额和钱包流水已改为4位小数")
+        
+        conn.execute(text("""
+            INSERT OR REPLACE INTO settings (setting_key, setting_value, description, updated_at)
+            VALUES (:key, '1', '余额和钱包流水已改为4位小数', datetime('now'))
+        """), {"key": MONEY_SCALE_KEY})
+
+def migrate_money_columns():
+    """把金额列从小数转换为整数最小单位（只执行一次，完成后在 settings 中记录标记）"""
+    from app.models.money import Money
+    
+    with engine.begin() as conn:
+        done = conn.execute(
+            text("SELECT setting_value FROM settings WHERE setting_key = :key"),
+            {"key": MONEY_MIGRATION_KEY}
+        ).scalar()
+        if done == "1":
+            return
+        
+        for table in Base.metadata.sorted_tables:
+            for column in table.columns:
+                if isinstance(column.type, Money):
+                    factor = 10 ** column.type.scale
+                    conn.execute(text(
+                        f'UPDATE {table.name} SET "{column.name}" = CAST(ROUND("{column.name}" * {factor}) AS INTEGER) '
+                        f'WHERE "{column.name}" IS NOT NULL'
+                    ))
+        
+        conn.execute(text("""
+            INSERT OR REPLACE INTO settings (setting_key, setting_value, description, updated_at)
+            VALUES (:key, '1', '金额已转换为整数最小单位', datetime('now'))
+        """), {"key": MONEY_MIGRATION_KEY})
+    print("✅ 金额列已转换为整数最小单位")
+
 async def init_db():
     """初始化数据库表"""
     # 创建所有表
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    rescale_money_columns()
+    migrate_money_columns()
+    if engine in archive_engines:
+        from app.services import archive
+        archive.create_archive_tables(engine)
+    
+    # create_all 不会为已存在的表补建索引，这里逐个检查补建
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
     
     # 插入默认数据
     db = SessionLocal()
@@ -48,14 +221,14 @@ async def init_db():
         count = result.scalar()
         
         if count == 0:
-            # 插入默认会员等级
+            # 插入默认会员等级（min_consumption 以分为单位）
             db.execute(text("""
                 INSERT INTO member_levels (id, name, min_consumption, cashback_rate, max_orders, status, created_at) 
                 VALUES 
-                (1, '普通会员', 0.00, 0.0200, 100, 1, datetime('now')),
-                (2, 'VIP会员', 100.00, 0.1000, 1000, 1, datetime('now')),
-                (3, '钻石会员', 500.00, 0.1500, 5000, 1, datetime('now')),
-                (4, '至尊会员', 2000.00, 0.2000, 10000, 1, datetime('now'))
+                (1, '普通会员', 0, 0.0200, 100, 1, datetime('now')),
+                (2, 'VIP会员', 10000, 0.1000, 1000, 1, datetime('now')),
+                (3, '钻石会员', 50000, 0.1500, 5000, 1, datetime('now')),
+                (4, '至尊会员', 200000, 0.2000, 10000, 1, datetime('now'))
             """))
             
             # 插入默认设置
@@ -71,6 +244,41 @@ async def init_db():
             print("✅ Shangfen API数据库初始化完成")
         else:
             print("✅ Shangfen API数据库已存在，跳过初始化")
+        
+        # 旧数据没有邀请关系闭包表时自动重建
+        closure_count = db.execute(text("SELECT COUNT(*) FROM invite_closure")).scalar()
+        user_count = db.execute(text("SELECT COUNT(*) FROM users")).scalar()
+        if closure_count == 0 and user_count > 0:
+            from app.services import invite_graph
+            rows = invite_graph.rebuild(db)
+            db.commit()
+            print(f"✅ 邀请关系闭包表已重建，共 {rows} 行")
+        
+        # 代理统计快照为空时从明细数据重建
+        stats_count = db.execute(text("SELECT COUNT(*) FROM agent_stats")).scalar()
+        if stats_count == 0 and user_count > 0:
+            from app.services import agent_stats
+            agent_stats.rebuild(db)
+            db.commit()
+            print("✅ 代理统计快照已重建")
+        
+        # 钱包流水为空时为已有余额写入期初流水
+        entry_count = db.execute(text("SELECT COUNT(*) FROM wallet_entries")).scalar()
+        if entry_count == 0 and user_count > 0:
+            from app.services import wallet
+            rows = wallet.bootstrap(db)
+            wallet.rollup(db)
+            db.commit()
+            print(f"✅ 钱包期初流水已写入，共 {rows} 条")
+        
+        # 经营汇总为空时按订单明细重建
+        rollup_count = db.execute(text("SELECT COUNT(*) FROM revenue_rollups")).scalar()
+        order_count = db.execute(text("SELECT COUNT(*) FROM orders")).scalar()
+        if rollup_count == 0 and order_count > 0:
+            from app.services import revenue_rollup
+            rows = revenue_rollup.rebuild(db)
+            db.commit()
+            print(f"✅ 经营汇总已重建，共 {rows} 个订单")
             
     except Exception as e:
         print(f"❌ 数据库初始化失败: {e}")
@@ -4,3 +4,11 @@ from .order import Order, CashbackRecord
 from .member_level import MemberLevel
 from .service_price import ServicePrice
 from .recharge_record import RechargeRecord
+from .commission import CommissionRecord, CommissionConfig, CommissionSettlement
+from .invite_closure import InviteClosure
+from .agent_stats import AgentStats
+from .outbox import OutboxEvent
+from .wallet import WalletEntry, WalletSnapshot
+from .revenue_rollup import FxRate, RevenueRollup
+from .api_key import ApiKey
+from .payment_intent import PaymentIntent
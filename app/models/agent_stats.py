@@ -0,0 +1,33 @@
+"""
+代理统计快照模型
+"""
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.database import Base
+from app.models.money import Money
+
+class AgentStats(Base):
+    """代理统计快照（在注册、下单、返佣时增量维护）"""
+    __tablename__ = "agent_stats"
+    
+    agent_id = Column(Integer, ForeignKey("users.id"), primary_key=True)  # 代理ID
+    total_invitees = Column(Integer, default=0)  # 直接邀请用户数
+    active_invitees = Column(Integer, default=0)  # 有订单的直接邀请用户数
+    total_commission = Column(Money(4), default=0)  # 累计返佣
+    monthly_commission = Column(Money(4), default=0)  # 当月返佣
+    stats_month = Column(String(7), nullable=True)  # 当月返佣对应的月份 (YYYY-MM)
+    total_consumption = Column(Money(4), default=0)  # 直接下级累计消费
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    def to_dict(self) -> dict:
+        """转换为字典"""
+        return {
+            "agent_id": self.agent_id,
+            "total_invitees": self.total_invitees,
+            "active_invitees": self.active_invitees,
+            "total_commission": float(self.total_commission),
+            "monthly_commission": float(self.monthly_commission),
+            "stats_month": self.stats_month,
+            "total_consumption": float(self.total_consumption),
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
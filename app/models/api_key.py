@@ -0,0 +1,30 @@
+"""
+API密钥模型
+"""
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.database import Base
+
+class ApiKey(Base):
+    """用户API密钥（只保存哈希，明文仅在创建时返回一次）"""
+    __tablename__ = "api_keys"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    name = Column(String(100), nullable=False, default="")  # 备注名称
+    prefix = Column(String(16), nullable=False, unique=True, index=True)  # 公开前缀，用于查找
+    key_hash = Column(String(64), nullable=False)  # 完整密钥的 SHA-256
+    created_at = Column(DateTime, default=func.now())
+    last_used_at = Column(DateTime)  # 最近一次校验通过的时间（缓存命中时不更新）
+    revoked_at = Column(DateTime)  # 吊销时间，非空即失效
+
+    def to_dict(self) -> dict:
+        """转换为字典（不含哈希）"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "prefix": self.prefix,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "last_used_at": self.last_used_at.isoformat() if self.last_used_at else None,
+            "revoked_at": self.revoked_at.isoformat() if self.revoked_at else None
+        }
@@ -1,10 +1,11 @@
 """
 返佣相关模型
 """
-from sqlalchemy import Column, Integer, String, DateTime, DECIMAL, Text, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, DECIMAL, Text, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
+from app.models.money import Money
 
 class CommissionRecord(Base):
     """返佣记录模型"""
@@ -16,18 +17,24 @@ class CommissionRecord(Base):
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)  # 订单ID
     commission_type = Column(String(20), nullable=False)  # 返佣类型: direct(直接), indirect(间接)
     commission_rate = Column(DECIMAL(5, 4), nullable=False)  # 返佣比例
-    order_amount = Column(DECIMAL(10, 4), nullable=False)  # 订单金额
-    commission_amount = Column(DECIMAL(10, 4), nullable=False)  # 返佣金额
+    order_amount = Column(Money(4), nullable=False)  # 订单金额
+    commission_amount = Column(Money(4), nullable=False)  # 返佣金额
     status = Column(String(20), default="pending")  # 状态: pending, paid, cancelled
     description = Column(Text, nullable=True)  # 描述
     created_at = Column(DateTime, default=func.now())
     paid_at = Column(DateTime, nullable=True)  # 支付时间
+    settlement_batch_id = Column(Integer, ForeignKey("commission_settlements.id"), nullable=True, index=True)  # 结算批次
     
     # 关系
     agent = relationship("User", foreign_keys=[agent_id], back_populates="commission_records")
     consumer = relationship("User", foreign_keys=[consumer_id])
     order = relationship("Order")
     
+    __table_args__ = (
+        Index("ix_commission_records_agent_created", "agent_id", "created_at", "id"),  # 返佣列表游标分页
+        Index("uq_commission_records_order_agent", "order_id", "agent_id", unique=True),  # 同一订单对同一代理只返佣一次
+    )
+    
     def to_dict(self) -> dict:
         """转换为字典"""
         return {
@@ -42,7 +49,42 @@ class CommissionRecord(Base):
             "status": self.status,
             "description": self.description,
             "created_at": self.created_at.isoformat() if self.created_at else None,
-            "paid_at": self.paid_at.isoformat() if self.paid_at else None
+            "paid_at": self.paid_at.isoformat() if self.paid_at else None,
+            "settlement_batch_id": self.settlement_batch_id
+        }
+
+class CommissionSettlement(Base):
+    """返佣结算批次模型"""
+    __tablename__ = "commission_settlements"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    agent_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # 结算条件：代理ID（为空表示全部代理）
+    start_date = Column(DateTime, nullable=True)  # 结算条件：返佣创建时间起
+    end_date = Column(DateTime, nullable=True)  # 结算条件：返佣创建时间止（不含）
+    commission_type = Column(String(20), nullable=True)  # 结算条件：返佣类型
+    record_count = Column(Integer, default=0)  # 结算记录数
+    total_amount = Column(Money(4), default=0)  # 结算总金额
+    status = Column(String(20), default="settled")  # 状态: settled(已结算), reversed(已撤销)
+    operator_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # 操作人
+    note = Column(Text, nullable=True)  # 备注
+    created_at = Column(DateTime, default=func.now())
+    reversed_at = Column(DateTime, nullable=True)  # 撤销时间
+    
+    def to_dict(self) -> dict:
+        """转换为字典"""
+        return {
+            "id": self.id,
+            "agent_id": self.agent_id,
+            "start_date": self.start_date.isoformat() if self.start_date else None,
+            "end_date": self.end_date.isoformat() if self.end_date else None,
+            "commission_type": self.commission_type,
+            "record_count": self.record_count,
+            "total_amount": float(self.total_amount or 0),
+            "status": self.status,
+            "operator_id": self.operator_id,
+            "note": self.note,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "reversed_at": self.reversed_at.isoformat() if self.reversed_at else None
         }
 
 class CommissionConfig(Base):
@@ -0,0 +1,30 @@
+"""
+邀请关系闭包表模型
+"""
+from sqlalchemy import Column, Integer, ForeignKey, Index
+from app.database import Base
+
+class InviteClosure(Base):
+    """邀请关系闭包表
+
+    每个用户与其所有上级（含自身，depth=0）各存一行，
+    子树、祖先链、按层级统计都可以通过一条带索引的查询完成。
+    """
+    __tablename__ = "invite_closure"
+    
+    ancestor_id = Column(Integer, ForeignKey("users.id"), primary_key=True)  # 上级ID
+    descendant_id = Column(Integer, ForeignKey("users.id"), primary_key=True)  # 下级ID
+    depth = Column(Integer, nullable=False)  # 层级距离，0表示自身
+    
+    __table_args__ = (
+        Index("ix_invite_closure_ancestor_depth", "ancestor_id", "depth"),
+        Index("ix_invite_closure_descendant_depth", "descendant_id", "depth"),
+    )
+    
+    def to_dict(self) -> dict:
+        """转换为字典"""
+        return {
+            "ancestor_id": self.ancestor_id,
+            "descendant_id": self.descendant_id,
+            "depth": self.depth
+        }
@@ -4,6 +4,7 @@
 from sqlalchemy import Column, Integer, String, DateTime, DECIMAL
 from sqlalchemy.sql import func
 from app.database import Base
+from app.models.money import Money
 
 class MemberLevel(Base):
     """会员等级模型"""
@@ -11,7 +12,7 @@ class MemberLevel(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(50), nullable=False)
-    min_consumption = Column(DECIMAL(10, 2), default=0.00)
+    min_consumption = Column(Money(2), default=0)
     cashback_rate = Column(DECIMAL(5, 4), default=0.0000)
     max_orders = Column(Integer, default=1000)
     status = Column(Integer, default=1)
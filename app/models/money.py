@@ -0,0 +1,57 @@
+"""
+金额类型
+
+金额在数据库中以整数最小单位存储（scale=2 为分，scale=4 为万分之一元），
+读取时还原为 Decimal。SQL 中的 SUM 等聚合在整数上计算，结果精确。
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Optional, Union
+
+from sqlalchemy import Integer
+from sqlalchemy.types import TypeDecorator
+
+Amount = Union[Decimal, int, float, str]
+
+
+def quantize(value: Optional[Amount], scale: int = 2) -> Decimal:
+    """把金额四舍五入到指定小数位"""
+    if value is None:
+        value = 0
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return value.quantize(Decimal(1).scaleb(-scale), rounding=ROUND_HALF_UP)
+
+
+def to_minor(value: Optional[Amount], scale: int = 2) -> int:
+    """金额转换为整数最小单位"""
+    return int(quantize(value, scale).scaleb(scale))
+
+
+def from_minor(value: Optional[int], scale: int = 2) -> Decimal:
+    """整数最小单位还原为金额"""
+    return Decimal(int(value or 0)).scaleb(-scale)
+
+
+class Money(TypeDecorator):
+    """以整数最小单位存储的金额列"""
+
+    impl = Integer
+    cache_ok = True
+
+    def __init__(self, scale: int = 2):
+        super().__init__()
+        self.scale = scale
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return to_minor(value, self.scale)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return from_minor(value, self.scale)
+
+    def coerce_compared_value(self, op, value):
+        # 与金额列比较、运算的字面量按同样的最小单位绑定
+        return self
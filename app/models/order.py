@@ -1,10 +1,11 @@
 """
 订单相关模型
 """
-from sqlalchemy import Column, Integer, String, DateTime, DECIMAL, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, DECIMAL, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
+from app.models.money import Money
 
 class Order(Base):
     """订单模型"""
@@ -20,11 +21,13 @@ class Order(Base):
     interval_minutes = Column(Integer, default=0)
     comments = Column(Text, nullable=True)
     status = Column(String(50), default="pending")
-    charge = Column(DECIMAL(10, 4), default=0.0000)
+    charge = Column(Money(4), default=0)
+    upstream_unit_cost = Column(Money(4), nullable=True)  # 下单时的API单价快照（为空表示早于快照的旧订单）
     start_count = Column(Integer, default=0)
     remains = Column(Integer, default=0)
     currency = Column(String(10), default="USD")
     external_order_id = Column(Integer, nullable=True)
+    rolled_up_at = Column(DateTime, nullable=True)  # 计入经营汇总的时间（为空表示尚未汇总）
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
@@ -32,6 +35,10 @@ class Order(Base):
     user = relationship("User", back_populates="orders")
     cashback_records = relationship("CashbackRecord", back_populates="order")
     
+    __table_args__ = (
+        Index("ix_orders_user_created", "user_id", "created_at"),  # 按用户统计/查询订单
+    )
+    
     def to_dict(self) -> dict:
         """转换为字典"""
         return {
@@ -61,7 +68,7 @@ class CashbackRecord(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
-    amount = Column(DECIMAL(10, 4), nullable=False)
+    amount = Column(Money(4), nullable=False)
     rate = Column(DECIMAL(5, 4), nullable=False)
     created_at = Column(DateTime, default=func.now())
     
@@ -69,6 +76,10 @@ class CashbackRecord(Base):
     user = relationship("User", back_populates="cashback_records")
     order = relationship("Order", back_populates="cashback_records")
     
+    __table_args__ = (
+        Index("ix_cashback_records_order_id", "order_id"),  # 按订单汇总、归档
+    )
+    
     def to_dict(self) -> dict:
         """转换为字典"""
         return {
@@ -0,0 +1,39 @@
+"""
+事务发件箱模型
+"""
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index, UniqueConstraint
+from sqlalchemy.sql import func
+from app.database import Base
+
+class OutboxEvent(Base):
+    """发件箱事件（与业务数据同一事务写入，由后台任务异步消费）"""
+    __tablename__ = "outbox_events"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    event_type = Column(String(50), nullable=False)  # 事件类型，如 order_created
+    aggregate_id = Column(Integer, nullable=False)  # 关联业务ID（如订单ID）
+    payload = Column(Text, nullable=True)  # 附加数据(JSON)
+    status = Column(String(20), default="pending")  # 状态: pending, done, failed
+    attempts = Column(Integer, default=0)  # 已尝试次数
+    last_error = Column(Text, nullable=True)  # 最近一次错误
+    created_at = Column(DateTime, default=func.now())
+    processed_at = Column(DateTime, nullable=True)  # 处理完成时间
+    
+    __table_args__ = (
+        UniqueConstraint("event_type", "aggregate_id", name="uq_outbox_events_type_aggregate"),  # 同一订单只产生一次事件
+        Index("ix_outbox_events_status_id", "status", "id"),
+    )
+    
+    def to_dict(self) -> dict:
+        """转换为字典"""
+        return {
+            "id": self.id,
+            "event_type": self.event_type,
+            "aggregate_id": self.aggregate_id,
+            "payload": self.payload,
+            "status": self.status,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "processed_at": self.processed_at.isoformat() if self.processed_at else None
+        }
@@ -0,0 +1,43 @@
+"""
+支付意图模型
+"""
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from app.database import Base
+from app.models.money import Money
+
+class PaymentIntent(Base):
+    """在线支付订单：下单时创建为 pending，回调或对账确认到账后只会转为 paid 一次"""
+    __tablename__ = "payment_intents"
+
+    id = Column(Integer, primary_key=True)
+    out_trade_no = Column(String(64), nullable=False, unique=True)  # 商户订单号
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    amount = Column(Money(4), nullable=False)
+    payment_method = Column(String(50), nullable=False, default="futoon")
+    payment_type = Column(String(20))  # wechat / alipay
+    status = Column(String(20), nullable=False, default="pending")  # pending/paid/failed/expired
+    trade_no = Column(String(64))  # 网关订单号
+    recharge_record_id = Column(Integer, ForeignKey("recharge_records.id"))  # 入账后的充值记录
+    created_at = Column(DateTime, default=func.now())
+    paid_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_payment_intents_status_created", "status", "created_at"),
+    )
+
+    def to_dict(self) -> dict:
+        """转换为字典"""
+        return {
+            "id": self.id,
+            "out_trade_no": self.out_trade_no,
+            "user_id": self.user_id,
+            "amount": float(self.amount),
+            "payment_method": self.payment_method,
+            "payment_type": self.payment_type,
+            "status": self.status,
+            "trade_no": self.trade_no,
+            "recharge_record_id": self.recharge_record_id,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "paid_at": self.paid_at.isoformat() if self.paid_at else None
+        }
@@ -1,10 +1,11 @@
 """
 充值记录模型
 """
-from sqlalchemy import Column, Integer, String, DateTime, DECIMAL, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
+from app.models.money import Money
 
 class RechargeRecord(Base):
     """充值记录模型"""
@@ -12,7 +13,7 @@ class RechargeRecord(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    amount = Column(DECIMAL(10, 4), nullable=False)
+    amount = Column(Money(4), nullable=False)
     payment_method = Column(String(50), nullable=False)
     status = Column(String(50), default="completed")
     created_at = Column(DateTime, default=func.now())
@@ -0,0 +1,58 @@
+"""
+经营汇总相关模型
+"""
+from sqlalchemy import Column, Integer, String, DateTime, DECIMAL, Index, UniqueConstraint
+from sqlalchemy.sql import func
+from app.database import Base
+from app.models.money import Money
+
+class FxRate(Base):
+    """汇率（按生效时间取最近一条）"""
+    __tablename__ = "fx_rates"
+
+    id = Column(Integer, primary_key=True)
+    base_currency = Column(String(10), nullable=False, default="USD")  # 基础货币
+    quote_currency = Column(String(10), nullable=False, default="CNY")  # 报价货币
+    rate = Column(DECIMAL(12, 6), nullable=False)  # 1 基础货币 = rate 报价货币
+    effective_at = Column(DateTime, nullable=False, default=func.now())  # 生效时间
+    created_at = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index("ix_fx_rates_pair_effective", "base_currency", "quote_currency", "effective_at"),
+    )
+
+    def to_dict(self) -> dict:
+        """转换为字典"""
+        return {
+            "id": self.id,
+            "base_currency": self.base_currency,
+            "quote_currency": self.quote_currency,
+            "rate": float(self.rate),
+            "effective_at": self.effective_at.isoformat() if self.effective_at else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
+
+class RevenueRollup(Base):
+    """按小时/天汇总的收入、成本、返现、返佣
+
+    dimension 为 service 时 dimension_id 是服务ID，记录该服务订单的全部指标；
+    dimension 为 agent 时 dimension_id 是代理ID，记录代理获得返佣的订单数、订单金额和返佣。
+    """
+    __tablename__ = "revenue_rollups"
+
+    id = Column(Integer, primary_key=True)
+    granularity = Column(String(10), nullable=False)  # 粒度: hour, day
+    bucket_start = Column(DateTime, nullable=False)  # 时间桶起点
+    dimension = Column(String(20), nullable=False)  # 维度: service, agent
+    dimension_id = Column(Integer, nullable=False)  # 服务ID或代理ID
+    order_count = Column(Integer, default=0)  # 订单数
+    revenue = Column(Money(4), default=0)  # 订单收入（人民币）
+    upstream_cost = Column(Money(4), default=0)  # 上游成本（按汇率换算为人民币）
+    cashback = Column(Money(4), default=0)  # 返现
+    commission = Column(Money(4), default=0)  # 返佣
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("granularity", "dimension", "dimension_id", "bucket_start", name="uq_revenue_rollups_bucket"),
+        Index("ix_revenue_rollups_range", "granularity", "dimension", "bucket_start"),  # 按时间范围查询
+    )
@@ -1,9 +1,10 @@
 """
 服务价格映射模型
 """
-from sqlalchemy import Column, Integer, String, DECIMAL, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Boolean
 from sqlalchemy.sql import func
 from app.database import Base
+from app.models.money import Money
 
 class ServicePrice(Base):
     """服务价格映射表"""
@@ -12,8 +13,8 @@ class ServicePrice(Base):
     id = Column(Integer, primary_key=True, index=True)
     service_id = Column(Integer, nullable=False, unique=True, index=True)  # API服务ID
     service_name = Column(String(255), nullable=False)  # 服务名称
-    api_price = Column(DECIMAL(10, 4), nullable=False)  # API价格（成本价）
-    customer_price = Column(DECIMAL(10, 4), nullable=False)  # 客户价格（销售价）
+    api_price = Column(Money(4), nullable=False)  # API价格（成本价）
+    customer_price = Column(Money(4), nullable=False)  # 客户价格（销售价）
     min_quantity = Column(Integer, default=1)  # 最小数量
     max_quantity = Column(Integer, default=10000)  # 最大数量
     is_active = Column(Boolean, default=True)  # 是否启用
@@ -1,20 +1,18 @@
 """
 用户相关模型
 """
-from sqlalchemy import Column, Integer, String, DateTime, DECIMAL, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, DECIMAL, Boolean, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
-from passlib.context import CryptContext
+from app.models.money import Money
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from fastapi import Request, HTTPException, status
 from typing import Optional
 
 from app.config import settings
-
-# 密码加密上下文
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.services.passwords import pwd_context, password_hasher
 
 class User(Base):
     """用户模型"""
@@ -25,9 +23,9 @@ class User(Base):
     username = Column(String(100), nullable=False)
     password_hash = Column(String(255), nullable=False)
     member_level = Column(Integer, default=1)
-    balance = Column(DECIMAL(10, 2), default=0.00)
-    total_consumed = Column(DECIMAL(10, 2), default=0.00)
-    total_cashback = Column(DECIMAL(10, 2), default=0.00)
+    balance = Column(Money(4), default=0)  # 钱包流水余额的缓存，与流水同精度（按整数直接复制）
+    total_consumed = Column(Money(4), default=0)
+    total_cashback = Column(Money(4), default=0)
     api_key = Column(String(255), nullable=True)
     status = Column(Integer, default=1)
     
@@ -38,9 +36,9 @@ class User(Base):
     agent_level = Column(Integer, default=0)  # 代理等级 (0=普通用户, 1=一级代理, 2=二级代理...)
     direct_commission_rate = Column(DECIMAL(5, 4), default=0.0000)  # 直接邀请返佣比例
     indirect_commission_rate = Column(DECIMAL(5, 4), default=0.0000)  # 间接邀请返佣比例
-    total_direct_commission = Column(DECIMAL(10, 2), default=0.00)  # 直接邀请总返佣
-    total_indirect_commission = Column(DECIMAL(10, 2), default=0.00)  # 间接邀请总返佣
-    total_commission = Column(DECIMAL(10, 2), default=0.00)  # 总返佣
+    total_direct_commission = Column(Money(4), default=0)  # 直接邀请总返佣
+    total_indirect_commission = Column(Money(4), default=0)  # 间接邀请总返佣
+    total_commission = Column(Money(4), default=0)  # 总返佣
     
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
@@ -54,6 +52,10 @@ class User(Base):
     inviter = relationship("User", remote_side=[id], backref="invitees")  # 邀请人
     commission_records = relationship("CommissionRecord", back_populates="agent", lazy="dynamic", foreign_keys="CommissionRecord.agent_id")  # 返佣记录
     
+    __table_args__ = (
+        Index("ix_users_inviter_created", "inviter_id", "created_at", "id"),  # 邀请列表游标分页
+    )
+    
     def verify_password(self, password: str) -> bool:
         """验证密码"""
         return pwd_context.verify(password, self.password_hash)
@@ -119,6 +121,13 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 async def get_current_user(request: Request) -> Optional[User]:
     """获取当前用户"""
     from app.database import SessionLocal
+    from app.config import settings
+    from app.services import api_keys
+    
+    # 程序化客户端在 /api/ 接口上使用API密钥，不走会话
+    key = request.headers.get(settings.api_key_header)
+    if api_keys.is_api_request(request.url.path, bool(key)):
+        return api_keys.authenticate(key)
     
     # 从会话中获取用户ID
     user_id = request.session.get("user_id")
@@ -136,12 +145,28 @@ async def authenticate_user(email: str, password: str) -> Optional[User]:
     """验证用户"""
     from app.database import SessionLocal
     
+    # 只读出校验所需字段后立即归还连接，等待哈希线程池期间不占用连接池
     db = SessionLocal()
     try:
-        user = db.query(User).filter(User.email == email, User.status == 1).first()
-        if user and user.verify_password(password):
-            return user
+        account = db.query(User.id, User.password_hash).filter(User.email == email, User.status == 1).first()
+    finally:
+        db.close()
+    if not account:
         return None
+    
+    # 在密码哈希线程池中校验，成本因子变化时顺便更新哈希
+    valid, new_hash = await password_hasher.verify_and_update(password, account.password_hash)
+    if not valid:
+        return None
+    
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == account.id, User.status == 1).first()
+        if user and new_hash:
+            user.password_hash = new_hash
+            db.commit()
+            db.refresh(user)
+        return user
     finally:
         db.close()
 
@@ -151,35 +176,51 @@ async def create_user(email: str, username: str, password: str, invite_code: str
     import secrets
     import string
     
+    # 先检查邮箱并查找邀请人，归还连接后再计算密码哈希
     db = SessionLocal()
     try:
         # 检查邮箱是否已存在
-        existing_user = db.query(User).filter(User.email == email).first()
-        if existing_user:
+        if db.query(User.id).filter(User.email == email).first():
             return None
         
         # 查找邀请人
         inviter_id = None
         if invite_code:
-            inviter = db.query(User).filter(User.invite_code == invite_code).first()
-            if inviter:
-                inviter_id = inviter.id
-        
-        # 生成邀请码
-        def generate_invite_code():
-            return ''.join(secrets.choices(string.ascii_uppercase + string.digits, k=8))
+            inviter_id = db.query(User.id).filter(User.invite_code == invite_code).scalar()
+    finally:
+        db.close()
+    
+    # 生成邀请码
+    def generate_invite_code():
+        return ''.join(secrets.choices(string.ascii_uppercase + string.digits, k=8))
+    
+    # 密码哈希在线程池中计算（繁忙时抛出 PasswordHasherBusy）
+    password_hash = await password_hasher.hash(password)
+    
+    db = SessionLocal()
+    try:
+        # 计算哈希期间可能已有同邮箱注册
+        if db.query(User.id).filter(User.email == email).first():
+            return None
         
         # 创建新用户
         user = User(
             email=email,
             username=username,
-            password_hash=User.hash_password(password),
+            password_hash=password_hash,
             member_level=1,
             inviter_id=inviter_id,
             invite_code=generate_invite_code()
         )
         
         db.add(user)
+        db.flush()
+        
+        # 维护邀请关系闭包表和代理统计
+        from app.services import invite_graph, agent_stats
+        invite_graph.add_user(db, user.id, inviter_id)
+        agent_stats.on_user_registered(db, user.id, inviter_id)
+        
         db.commit()
         db.refresh(user)
         return user
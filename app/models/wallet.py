@@ -0,0 +1,44 @@
+"""
+钱包流水相关模型
+"""
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from app.database import Base
+from app.models.money import Money
+
+class WalletEntry(Base):
+    """钱包流水（只追加，不修改）"""
+    __tablename__ = "wallet_entries"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)  # 用户ID
+    amount = Column(Money(4), nullable=False)  # 变动金额（入账为正，扣款为负；与订单、返佣同为4位小数）
+    entry_type = Column(String(30), nullable=False)  # 类型: opening, recharge, admin_recharge, order, cashback, commission, commission_adjust
+    ref_id = Column(Integer, nullable=True)  # 关联业务ID（订单ID、充值记录ID等）
+    description = Column(String(255), nullable=True)  # 描述
+    created_at = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index("ix_wallet_entries_user_id_id", "user_id", "id"),  # 按用户读取快照之后的流水
+    )
+
+    def to_dict(self) -> dict:
+        """转换为字典"""
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "amount": float(self.amount),
+            "entry_type": self.entry_type,
+            "ref_id": self.ref_id,
+            "description": self.description,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
+
+class WalletSnapshot(Base):
+    """钱包余额快照（定期由流水汇总）"""
+    __tablename__ = "wallet_snapshots"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)  # 用户ID
+    balance = Column(Money(4), default=0)  # 截至 last_entry_id 的余额
+    last_entry_id = Column(Integer, default=0)  # 已汇总的最后一条流水ID
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
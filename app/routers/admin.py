@@ -2,20 +2,22 @@
 管理员路由
 """
 from fastapi import APIRouter, Request, Depends, HTTPException, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models.user import get_current_user, User
 from app.models.order import Order
 from app.models.service_price import ServicePrice
 from app.config import settings
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
+from datetime import datetime, timedelta
 from typing import Optional
-from sqlalchemy import text
+from sqlalchemy import text, func
+from app.models.revenue_rollup import FxRate
+from app.services import wallet, fx, revenue_rollup, export, archive, backup, api_keys, payment_reconcile, catalog
+from app.templating import templates
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 
 def check_admin_permission(user: User) -> bool:
     """检查管理员权限"""
@@ -25,7 +27,7 @@ def check_admin_permission(user: User) -> bool:
     return user.email in admin_emails or user.member_level >= 4
 
 @router.get("/lxmjdh", response_class=HTMLResponse)
-async def admin_dashboard(request: Request, db: Session = Depends(get_db)):
+async def admin_dashboard(request: Request, db: Session = Depends(get_read_db)):
     """管理员控制台"""
     # 检查用户是否已登录
     user = await get_current_user(request)
@@ -38,9 +40,10 @@ async def admin_dashboard(request: Request, db: Session = Depends(get_db)):
     
     # 获取统计数据
     total_users = db.query(User).count()
-    total_orders = db.query(Order).count()
-    pending_orders = db.query(Order).filter(Order.status == "pending").count()
-    completed_orders = db.query(Order).filter(Order.status == "completed").count()
+    # 订单数包含已归档的订单（归档部分使用缓存值）
+    total_orders = archive.count(db, Order)
+    pending_orders = archive.count(db, Order, status="pending")
+    completed_orders = archive.count(db, Order, status="completed")
     
     # 获取所有用户
     users = db.query(User).order_by(User.created_at.desc()).limit(50).all()
@@ -84,10 +87,9 @@ async def update_service_price(
         service_price.customer_price = Decimal(str(new_price))
         db.commit()
         
-        # 计算利润（按1:7.3汇率换算）
-        EXCHANGE_RATE = 7.3
-        api_price_rmb = float(service_price.api_price) * EXCHANGE_RATE
-        profit = float(service_price.customer_price) - api_price_rmb
+        # 计算利润（按当前汇率换算）
+        api_price_rmb = service_price.api_price * fx.get_rate(db)
+        profit = service_price.customer_price - api_price_rmb
         profit_rate = (profit / api_price_rmb) * 100 if api_price_rmb > 0 else 0
         
         return {
@@ -133,10 +135,9 @@ async def update_service_price(
             db.add(new_service_price)
             db.commit()
             
-            # 计算利润（按1:7.3汇率换算）
-            EXCHANGE_RATE = 7.3
-            api_price_rmb = float(new_service_price.api_price) * EXCHANGE_RATE
-            profit = float(new_service_price.customer_price) - api_price_rmb
+            # 计算利润（按当前汇率换算）
+            api_price_rmb = new_service_price.api_price * fx.get_rate(db)
+            profit = new_service_price.customer_price - api_price_rmb
             profit_rate = (profit / api_price_rmb) * 100 if api_price_rmb > 0 else 0
             
             return {
@@ -168,14 +169,82 @@ async def recharge_user_balance(
     if not target_user:
         raise HTTPException(status_code=404, detail="用户不存在")
     
-    # 更新用户余额
-    target_user.balance = Decimal(str(target_user.balance)) + Decimal(str(amount))
+    # 更新用户余额（写入钱包流水）
+    wallet.post(db, target_user.id, Decimal(str(amount)), wallet.ADMIN_RECHARGE, admin_user.id, f"管理员 {admin_user.username} 充值")
+    wallet.sync_balances(db, [target_user.id])
     db.commit()
     
     return {"success": True, "message": f"用户 {target_user.username} 余额已增加 ¥{amount}"}
 
+@router.get("/lxmjdh/wallet/reconcile")
+async def reconcile_wallet(request: Request, full: bool = False, db: Session = Depends(get_read_db)):
+    """钱包对账：比较用户余额与钱包流水"""
+    # 检查管理员权限
+    admin_user = await get_current_user(request)
+    if not admin_user or not check_admin_permission(admin_user):
+        raise HTTPException(status_code=403, detail="权限不足")
+    
+    return {"success": True, "data": wallet.reconcile(db, full=full)}
+
+@router.get("/lxmjdh/backup/status")
+async def backup_status(request: Request, db: Session = Depends(get_read_db)):
+    """数据库备份状态：最近一次备份结果（主库和归档库）和现有备份文件"""
+    # 检查管理员权限
+    admin_user = await get_current_user(request)
+    if not admin_user or not check_admin_permission(admin_user):
+        raise HTTPException(status_code=403, detail="权限不足")
+    
+    return {
+        "success": True,
+        "last_backup": backup.load_status(db),
+        "interval_hours": settings.backup_interval_hours,
+        "backups": [
+            {"name": item["name"], "size": item["size"], "created_at": item["created_at"].isoformat()}
+            for item in backup.list_backups()
+        ]
+    }
+
+@router.post("/lxmjdh/backup/run")
+async def run_backup_now(request: Request):
+    """立即执行一次在线备份"""
+    # 检查管理员权限
+    admin_user = await get_current_user(request)
+    if not admin_user or not check_admin_permission(admin_user):
+        raise HTTPException(status_code=403, detail="权限不足")
+    
+    status = await backup.backup_worker.trigger()
+    if status["success"]:
+        files = ", ".join(item["file"] for item in status["files"])
+        return {"success": True, "message": f"备份完成: {files}", "data": status}
+    return {"success": False, "message": f"备份失败: {status['error']}", "data": status}
+
+@router.get("/lxmjdh/payments/reconcile")
+async def payment_reconcile_status(request: Request, db: Session = Depends(get_read_db)):
+    """最近一次支付对账报告"""
+    # 检查管理员权限
+    admin_user = await get_current_user(request)
+    if not admin_user or not check_admin_permission(admin_user):
+        raise HTTPException(status_code=403, detail="权限不足")
+    
+    return {
+        "success": True,
+        "last_report": payment_reconcile.load_report(db),
+        "interval_seconds": settings.payment_reconcile_interval_seconds
+    }
+
+@router.post("/lxmjdh/payments/reconcile/run")
+async def run_payment_reconcile(request: Request):
+    """立即执行一轮支付对账"""
+    # 检查管理员权限
+    admin_user = await get_current_user(request)
+    if not admin_user or not check_admin_permission(admin_user):
+        raise HTTPException(status_code=403, detail="权限不足")
+    
+    report = await payment_reconcile.payment_reconcile_worker.run_once()
+    return {"success": True, "message": f"对账完成：检查 {report['checked']} 笔，补入账 {report['credited']} 笔", "data": report}
+
 @router.get("/lxmjdh/users", response_class=HTMLResponse)
-async def manage_users(request: Request, db: Session = Depends(get_db)):
+async def manage_users(request: Request, db: Session = Depends(get_read_db)):
     """用户管理页面"""
     # 检查管理员权限
     user = await get_current_user(request)
@@ -213,6 +282,7 @@ async def update_user_level(
     # 更新会员等级
     target_user.member_level = member_level
     db.commit()
+    api_keys.principal_cache.clear()  # 已缓存的API身份按新资料重新加载
     
     return {"success": True, "message": f"用户 {target_user.username} 会员等级已更新为 {member_level}"}
 
@@ -248,6 +318,7 @@ async def update_user_info(
         target_user.api_key = f"custom_commission:{custom_commission}"
     
     db.commit()
+    api_keys.principal_cache.clear()  # 已缓存的API身份按新资料重新加载
     
     return {"success": True, "message": f"用户 {target_user.username} 信息已更新"}
 
@@ -275,6 +346,7 @@ async def delete_user(
     # 软删除：将状态设置为禁用
     target_user.status = 0
     db.commit()
+    api_keys.principal_cache.clear()  # 已缓存的API身份按新资料重新加载
     
     return {"success": True, "message": f"用户 {target_user.username} 已删除"}
 
@@ -380,6 +452,7 @@ async def test_api_connection(
             from app.services.appfuwu_client import appfuwu_client
             # 临时设置API密钥进行测试
             await appfuwu_client.set_api_key(api_key)
+            catalog.invalidate()
             
             # 测试获取服务列表
             services = await appfuwu_client.get_services()
@@ -397,48 +470,73 @@ async def test_api_connection(
     except Exception as e:
         return {"success": False, "message": f"API连接测试失败: {str(e)}"}
 
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    """解析 YYYY-MM-DD 格式的日期"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"日期格式错误: {value}")
+
+def _date_range(start_date: Optional[str], end_date: Optional[str]):
+    """解析查询日期范围（含结束日），默认最近30天"""
+    end = _parse_date(end_date) or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = _parse_date(start_date) or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=400, detail="开始日期不能晚于结束日期")
+    return start, end + timedelta(days=1)
+
 @router.get("/lxmjdh/profit-analysis", response_class=HTMLResponse)
-async def profit_analysis_page(request: Request, db: Session = Depends(get_db)):
+async def profit_analysis_page(
+    request: Request,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
     """利润分析页面"""
     # 检查管理员权限
     user = await get_current_user(request)
     if not user or not check_admin_permission(user):
         raise HTTPException(status_code=403, detail="权限不足")
     
-    # 获取所有服务价格信息
-    service_prices = db.query(ServicePrice).filter(ServicePrice.is_active == True).all()
-    
-    # 汇率设置：1美元 = 7.3人民币
-    EXCHANGE_RATE = 7.3
+    start, end = _date_range(start_date, end_date)
     
-    # 计算利润数据
-    profit_data = []
-    total_profit = 0
-    total_api_cost_rmb = 0  # API成本价换算成人民币
-    total_customer_revenue = 0
+    # 汇率：取 fx_rates 当前生效的美元兑人民币汇率
+    exchange_rate = fx.get_rate(db)
     
-    for sp in service_prices:
-        api_price_usd = float(sp.api_price)  # API价格（美元）
-        api_price_rmb = api_price_usd * EXCHANGE_RATE  # 换算成人民币
-        customer_price = float(sp.customer_price)  # 客户价格（人民币）
-        profit = customer_price - api_price_rmb  # 利润 = 客户价格 - 换算后的成本价
-        profit_rate = (profit / api_price_rmb) * 100 if api_price_rmb > 0 else 0
+    def profit_rows():
+        """计算服务利润明细（金额为 Decimal，直接运算）；模板片段缓存命中时不会调用"""
+        service_prices = db.query(ServicePrice).filter(ServicePrice.is_active == True).all()
+        profit_data = []
         
-        profit_data.append({
-            "service_id": sp.service_id,
-            "service_name": sp.service_name,
-            "api_price_usd": api_price_usd,  # 原始API价格（美元）
-            "api_price_rmb": api_price_rmb,  # 换算后的API价格（人民币）
-            "customer_price": customer_price,
-            "profit": profit,
-            "profit_rate": profit_rate,
-            "min_quantity": sp.min_quantity,
-            "max_quantity": sp.max_quantity
-        })
-        
-        total_api_cost_rmb += api_price_rmb
-        total_customer_revenue += customer_price
-        total_profit += profit
+        for sp in service_prices:
+            api_price_usd = sp.api_price  # API价格（美元）
+            api_price_rmb = api_price_usd * exchange_rate  # 换算成人民币
+            customer_price = sp.customer_price  # 客户价格（人民币）
+            profit = customer_price - api_price_rmb  # 利润 = 客户价格 - 换算后的成本价
+            profit_rate = (profit / api_price_rmb) * 100 if api_price_rmb > 0 else 0
+            
+            profit_data.append({
+                "service_id": sp.service_id,
+                "service_name": sp.service_name,
+                "api_price_usd": api_price_usd,  # 原始API价格（美元）
+                "api_price_rmb": api_price_rmb,  # 换算后的API价格（人民币）
+                "customer_price": customer_price,
+                "profit": profit,
+                "profit_rate": profit_rate,
+                "min_quantity": sp.min_quantity,
+                "max_quantity": sp.max_quantity
+            })
+        return profit_data
+    
+    # 合计在数据库中按整数最小单位求和
+    total_api_usd, total_customer_revenue = db.query(
+        func.coalesce(func.sum(ServicePrice.api_price), 0),
+        func.coalesce(func.sum(ServicePrice.customer_price), 0)
+    ).filter(ServicePrice.is_active == True).one()
+    total_api_cost_rmb = total_api_usd * exchange_rate  # API成本价换算成人民币
+    total_profit = total_customer_revenue - total_api_cost_rmb
     
     # 计算总体利润率
     overall_profit_rate = (total_profit / total_api_cost_rmb) * 100 if total_api_cost_rmb > 0 else 0
@@ -447,9 +545,130 @@ async def profit_analysis_page(request: Request, db: Session = Depends(get_db)):
         "request": request,
         "title": "利润分析",
         "user": user,
-        "profit_data": profit_data,
+        "profit_rows": profit_rows,
+        # 服务利润明细只随价格表和汇率变化
+        "profit_version": f"{catalog.price_signature(db)}:{exchange_rate}",
         "total_profit": total_profit,
         "total_api_cost": total_api_cost_rmb,  # 使用换算后的成本价
         "total_customer_revenue": total_customer_revenue,
-        "overall_profit_rate": overall_profit_rate
+        "overall_profit_rate": overall_profit_rate,
+        "exchange_rate": exchange_rate,
+        "realized": revenue_rollup.query(db, start, end),
+        "start_date": start.strftime("%Y-%m-%d"),
+        "end_date": (end - timedelta(days=1)).strftime("%Y-%m-%d")
     })
+
+@router.get("/lxmjdh/profit-analysis/data")
+async def profit_analysis_data(
+    request: Request,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    granularity: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """按日期范围读取经营汇总（收入、上游成本、返现、返佣、利润）"""
+    # 检查管理员权限
+    user = await get_current_user(request)
+    if not user or not check_admin_permission(user):
+        raise HTTPException(status_code=403, detail="权限不足")
+    
+    if granularity not in (None, revenue_rollup.HOUR, revenue_rollup.DAY):
+        raise HTTPException(status_code=400, detail="granularity 只能是 hour 或 day")
+    start, end = _date_range(start_date, end_date)
+    
+    return {"success": True, "data": revenue_rollup.query(db, start, end, granularity)}
+
+@router.post("/lxmjdh/profit-analysis/rebuild")
+async def rebuild_profit_rollups(request: Request, db: Session = Depends(get_db)):
+    """按订单明细重建经营汇总（汇率修正后使用）"""
+    # 检查管理员权限
+    user = await get_current_user(request)
+    if not user or not check_admin_permission(user):
+        raise HTTPException(status_code=403, detail="权限不足")
+    
+    try:
+        orders = revenue_rollup.rebuild(db)
+        db.commit()
+        return {"success": True, "message": f"经营汇总已重建，共 {orders} 个订单"}
+    except Exception as e:
+        db.rollback()
+        return {"success": False, "message": f"重建失败: {str(e)}"}
+
+@router.get("/lxmjdh/fx-rates")
+async def list_fx_rates(request: Request, db: Session = Depends(get_read_db)):
+    """汇率列表"""
+    # 检查管理员权限
+    user = await get_current_user(request)
+    if not user or not check_admin_permission(user):
+        raise HTTPException(status_code=403, detail="权限不足")
+    
+    rates = db.query(FxRate).order_by(FxRate.effective_at.desc(), FxRate.id.desc()).limit(100).all()
+    return {
+        "success": True,
+        "current_rate": float(fx.get_rate(db)),
+        "data": [rate.to_dict() for rate in rates]
+    }
+
+@router.post("/lxmjdh/fx-rates")
+async def create_fx_rate(
+    request: Request,
+    rate: str = Form(...),
+    effective_date: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """新增美元兑人民币汇率（不填生效日期则立即生效）
+
+    只影响之后计入汇总的订单，需要修正历史数据时调用重建接口。
+    """
+    # 检查管理员权限
+    user = await get_current_user(request)
+    if not user or not check_admin_permission(user):
+        raise HTTPException(status_code=403, detail="权限不足")
+    
+    try:
+        value = Decimal(rate)
+    except InvalidOperation:
+        raise HTTPException(status_code=400, detail=f"汇率格式错误: {rate}")
+    effective_at = _parse_date(effective_date)
+    
+    try:
+        record = fx.set_rate(db, value, effective_at)
+        db.commit()
+        return {"success": True, "message": f"汇率已设置为 1 USD = {value} CNY", "data": record.to_dict()}
+    except ValueError as e:
+        db.rollback()
+        return {"success": False, "message": str(e)}
+
+@router.get("/lxmjdh/export/{name}")
+async def export_data(
+    request: Request,
+    name: str,
+    format: str = "csv",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    user_id: Optional[int] = None
+):
+    """流式导出订单、返佣、充值、返现记录（CSV 或 NDJSON）
+
+    user_id 对返佣记录按代理筛选，其余按用户筛选；end_date 包含当天。
+    """
+    # 检查管理员权限
+    user = await get_current_user(request)
+    if not user or not check_admin_permission(user):
+        raise HTTPException(status_code=403, detail="权限不足")
+    
+    if name not in export.EXPORTS:
+        raise HTTPException(status_code=404, detail=f"不支持的导出类型: {name}")
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail="format 只能是 csv 或 ndjson")
+    start = _parse_date(start_date)
+    end = _parse_date(end_date)
+    if end:
+        end += timedelta(days=1)
+    
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d%H%M%S')}.{format}"
+    return StreamingResponse(
+        export.stream(name, format, start, end, user_id),
+        media_type=export.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -3,20 +3,25 @@
 """
 from fastapi import APIRouter, Request, Depends, HTTPException, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from sqlalchemy import text, desc
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models.user import get_current_user, User
-from app.models.commission import CommissionRecord, CommissionConfig
+from app.models.commission import CommissionRecord, CommissionConfig, CommissionSettlement
 from app.models.order import Order
+from app.services import invite_graph, agent_stats, commission_settlement
+from app.services.commission_rules import invalidate_rate_table, LevelRule
+from app.services.commission_simulator import run_simulation_in_thread
+from pydantic import BaseModel
+from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import Optional, List
+from typing import Optional, List, Dict
+import asyncio
 import secrets
 import string
+from app.templating import templates
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 
 def check_admin_permission(user: User) -> bool:
     """检查管理员权限"""
@@ -28,7 +33,7 @@ def generate_invite_code() -> str:
     return ''.join(secrets.choices(string.ascii_uppercase + string.digits, k=8))
 
 @router.get("/admin/agents", response_class=HTMLResponse)
-async def agents_management(request: Request, db: Session = Depends(get_db)):
+async def agents_management(request: Request, db: Session = Depends(get_read_db)):
     """代理管理页面"""
     # 检查管理员权限
     user = await get_current_user(request)
@@ -83,6 +88,7 @@ async def set_agent(
             target_user.invite_code = generate_invite_code()
         
         db.commit()
+        invalidate_rate_table()
         
         return {
             "success": True,
@@ -119,6 +125,7 @@ async def update_agent_commission(
         agent.indirect_commission_rate = Decimal(str(indirect_rate))
         
         db.commit()
+        invalidate_rate_table()
         
         return {
             "success": True,
@@ -129,8 +136,49 @@ async def update_agent_commission(
         db.rollback()
         return {"success": False, "message": f"更新失败: {str(e)}"}
 
+@router.post("/admin/agents/set-inviter")
+async def set_inviter(
+    request: Request,
+    user_id: int = Form(...),
+    inviter_id: Optional[int] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """修改用户的邀请人（整棵下级随之移动）"""
+    # 检查管理员权限
+    admin_user = await get_current_user(request)
+    if not admin_user or not check_admin_permission(admin_user):
+        raise HTTPException(status_code=403, detail="权限不足")
+    
+    # 查找目标用户
+    target_user = db.query(User).filter(User.id == user_id).first()
+    if not target_user:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    
+    if inviter_id and not db.query(User).filter(User.id == inviter_id).first():
+        raise HTTPException(status_code=404, detail="邀请人不存在")
+    
+    try:
+        old_inviter_id = target_user.inviter_id
+        invite_graph.move_subtree(db, user_id, inviter_id or None)
+        
+        # 新旧邀请人的直接下级发生变化，重算其统计快照
+        agent_stats.rebuild(db, [old_inviter_id, inviter_id])
+        db.commit()
+        
+        return {
+            "success": True,
+            "message": f"用户 {target_user.username} 的邀请人已更新"
+        }
+        
+    except ValueError as e:
+        db.rollback()
+        return {"success": False, "message": str(e)}
+    except Exception as e:
+        db.rollback()
+        return {"success": False, "message": f"更新失败: {str(e)}"}
+
 @router.get("/admin/agents/commission-records", response_class=HTMLResponse)
-async def commission_records(request: Request, agent_id: Optional[int] = None, db: Session = Depends(get_db)):
+async def commission_records(request: Request, agent_id: Optional[int] = None, db: Session = Depends(get_read_db)):
     """返佣记录页面"""
     # 检查管理员权限
     user = await get_current_user(request)
@@ -157,8 +205,103 @@ async def commission_records(request: Request, agent_id: Optional[int] = None, d
         "selected_agent_id": agent_id
     })
 
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    """解析 YYYY-MM-DD 格式的日期"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"日期格式错误: {value}")
+
+@router.post("/admin/agents/commission-settlements")
+async def settle_commissions(
+    request: Request,
+    agent_id: Optional[int] = Form(None),
+    start_date: Optional[str] = Form(None),
+    end_date: Optional[str] = Form(None),
+    commission_type: Optional[str] = Form(None),
+    note: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """批量结算待结算返佣（按代理、日期范围、返佣类型筛选）"""
+    # 检查管理员权限
+    admin_user = await get_current_user(request)
+    if not admin_user or not check_admin_permission(admin_user):
+        raise HTTPException(status_code=403, detail="权限不足")
+    
+    if commission_type and commission_type not in ("direct", "indirect"):
+        raise HTTPException(status_code=400, detail="返佣类型错误")
+    
+    # 结束日期包含当天
+    start = _parse_date(start_date)
+    end = _parse_date(end_date)
+    if end:
+        end += timedelta(days=1)
+    
+    try:
+        batch = commission_settlement.settle(
+            db,
+            agent_id=agent_id or None,
+            start_date=start,
+            end_date=end,
+            commission_type=commission_type or None,
+            operator_id=admin_user.id,
+            note=note
+        )
+        db.commit()
+        
+        return {
+            "success": True,
+            "message": f"已结算 {batch.record_count} 条返佣，共 {float(batch.total_amount):.2f}",
+            "batch": batch.to_dict(),
+            "agents": commission_settlement.get_batch_summary(db, batch.id)
+        }
+        
+    except ValueError as e:
+        db.rollback()
+        return {"success": False, "message": str(e)}
+    except Exception as e:
+        db.rollback()
+        return {"success": False, "message": f"结算失败: {str(e)}"}
+
+@router.get("/admin/agents/commission-settlements")
+async def commission_settlements(request: Request, limit: int = 50, db: Session = Depends(get_read_db)):
+    """结算批次列表"""
+    # 检查管理员权限
+    user = await get_current_user(request)
+    if not user or not check_admin_permission(user):
+        raise HTTPException(status_code=403, detail="权限不足")
+    
+    batches = db.query(CommissionSettlement).order_by(desc(CommissionSettlement.id)).limit(max(1, min(limit, 200))).all()
+    return {"success": True, "batches": [batch.to_dict() for batch in batches]}
+
+@router.post("/admin/agents/commission-settlements/{batch_id}/reverse")
+async def reverse_commission_settlement(request: Request, batch_id: int, db: Session = Depends(get_db)):
+    """撤销结算批次"""
+    # 检查管理员权限
+    admin_user = await get_current_user(request)
+    if not admin_user or not check_admin_permission(admin_user):
+        raise HTTPException(status_code=403, detail="权限不足")
+    
+    try:
+        batch = commission_settlement.reverse(db, batch_id)
+        db.commit()
+        
+        return {
+            "success": True,
+            "message": f"结算批次 {batch.id} 已撤销"
+        }
+        
+    except ValueError as e:
+        db.rollback()
+        return {"success": False, "message": str(e)}
+    except Exception as e:
+        db.rollback()
+        return {"success": False, "message": f"撤销失败: {str(e)}"}
+
 @router.get("/admin/agents/commission-config", response_class=HTMLResponse)
-async def commission_config(request: Request, db: Session = Depends(get_db)):
+async def commission_config(request: Request, db: Session = Depends(get_read_db)):
     """返佣配置页面"""
     # 检查管理员权限
     user = await get_current_user(request)
@@ -202,6 +345,7 @@ async def update_commission_config(
         config.max_levels = max_levels
         
         db.commit()
+        invalidate_rate_table()
         
         return {
             "success": True,
@@ -212,8 +356,58 @@ async def update_commission_config(
         db.rollback()
         return {"success": False, "message": f"更新失败: {str(e)}"}
 
+class SimulateLevelRate(BaseModel):
+    agent_level: int
+    direct_rate: Decimal
+    indirect_rate: Decimal
+    max_levels: int = 3
+
+class SimulateAgentRate(BaseModel):
+    agent_id: int
+    direct_rate: Optional[Decimal] = None
+    indirect_rate: Optional[Decimal] = None
+
+class SimulateRequest(BaseModel):
+    levels: List[SimulateLevelRate] = []
+    agents: List[SimulateAgentRate] = []
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    top: int = 100
+
+@router.post("/admin/agents/commission-config/simulate")
+async def simulate_commission_config(
+    request: Request,
+    body: SimulateRequest
+):
+    """模拟修改返佣配置后的返佣差异（只读，不写返佣记录）"""
+    # 检查管理员权限
+    admin_user = await get_current_user(request)
+    if not admin_user or not check_admin_permission(admin_user):
+        raise HTTPException(status_code=403, detail="权限不足")
+    
+    levels = {
+        item.agent_level: LevelRule(
+            direct_rate=item.direct_rate,
+            indirect_rate=item.indirect_rate,
+            max_levels=item.max_levels
+        )
+        for item in body.levels
+    }
+    agent_overrides: Dict[int, Dict] = {
+        item.agent_id: item.model_dump(exclude={"agent_id"}, exclude_none=True)
+        for item in body.agents
+    }
+    
+    # 计算量大，放到线程池中执行，不阻塞事件循环；线程内使用自己的只读会话
+    result = await asyncio.to_thread(
+        run_simulation_in_thread, levels, agent_overrides,
+        body.start_date, body.end_date, max(1, min(body.top, 1000))
+    )
+    
+    return {"success": True, "data": result}
+
 @router.get("/admin/agents/invite-tree", response_class=HTMLResponse)
-async def invite_tree(request: Request, agent_id: Optional[int] = None, db: Session = Depends(get_db)):
+async def invite_tree(request: Request, agent_id: Optional[int] = None, db: Session = Depends(get_read_db)):
     """邀请树页面"""
     # 检查管理员权限
     user = await get_current_user(request)
@@ -227,27 +421,8 @@ async def invite_tree(request: Request, agent_id: Optional[int] = None, db: Sess
         if not root_agent:
             raise HTTPException(status_code=404, detail="代理不存在")
         
-        # 递归获取邀请树
-        def get_invite_tree(user_id: int, level: int = 0) -> dict:
-            user = db.query(User).filter(User.id == user_id).first()
-            if not user:
-                return None
-            
-            invitees = db.query(User).filter(User.inviter_id == user_id).all()
-            children = []
-            
-            for invitee in invitees:
-                child_tree = get_invite_tree(invitee.id, level + 1)
-                if child_tree:
-                    children.append(child_tree)
-            
-            return {
-                "user": user,
-                "level": level,
-                "children": children
-            }
-        
-        tree_data = get_invite_tree(agent_id)
+        # 通过闭包表一次取出整棵子树
+        tree_data = invite_graph.build_tree(invite_graph.get_subtree(db, agent_id), agent_id)
     else:
         tree_data = None
     
@@ -3,24 +3,25 @@
 """
 from fastapi import APIRouter, Request, Depends, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse, Response
-from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload, load_only
 from sqlalchemy import desc, func
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models.user import get_current_user, User
 from app.models.commission import CommissionRecord
 from app.models.order import Order
+from app.services import agent_stats, archive
+from app.services.pagination import cursor_column, keyset_filter, encode_cursor, cached_total, total_count_cache
 from decimal import Decimal
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import qrcode
 import io
 import base64
+from app.templating import templates
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 
 @router.get("/agent", response_class=HTMLResponse)
-async def agent_page(request: Request, db: Session = Depends(get_db)):
+async def agent_page(request: Request, db: Session = Depends(get_read_db)):
     """代理页面"""
     # 检查用户是否已登录
     user = await get_current_user(request)
@@ -80,7 +81,7 @@ async def generate_qr_code(request: Request, db: Session = Depends(get_db)):
     }
 
 @router.get("/agent/stats")
-async def get_agent_stats_api(request: Request, db: Session = Depends(get_db)):
+async def get_agent_stats_api(request: Request, db: Session = Depends(get_read_db)):
     """获取代理统计信息API"""
     # 检查用户是否已登录
     user = await get_current_user(request)
@@ -106,87 +107,171 @@ async def get_agent_stats_api(request: Request, db: Session = Depends(get_db)):
     }
 
 @router.get("/agent/invitees")
-async def get_invitees_api(request: Request, page: int = 1, limit: int = 10, db: Session = Depends(get_db)):
-    """获取邀请用户列表API"""
+async def get_invitees_api(request: Request, cursor: Optional[str] = None, limit: int = 10, db: Session = Depends(get_read_db)):
+    """获取邀请用户列表API（游标分页）"""
     # 检查用户是否已登录
     user = await get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="未登录")
     
-    # 计算偏移量
-    offset = (page - 1) * limit
+    limit = max(1, min(limit, 100))
     
-    # 获取邀请用户
-    invitees = db.query(User).filter(
-        User.inviter_id == user.id
-    ).order_by(desc(User.created_at)).offset(offset).limit(limit).all()
-    
-    # 获取总数
-    total_count = db.query(User).filter(User.inviter_id == user.id).count()
+    # 单条聚合查询取出当前页及每个用户的统计
+    invitee_list, next_cursor, has_more = get_invitee_page(db, user.id, cursor, limit)
     
-    # 计算每个用户的统计信息
-    invitee_list = []
-    for invitee in invitees:
-        # 订单统计
-        total_orders = db.query(Order).filter(Order.user_id == invitee.id).count()
-        total_consumed = db.query(func.sum(Order.charge)).filter(
-            Order.user_id == invitee.id
-        ).scalar() or Decimal('0')
-        
-        # 返佣统计
-        total_commission = db.query(func.sum(CommissionRecord.commission_amount)).filter(
-            CommissionRecord.agent_id == user.id,
-            CommissionRecord.consumer_id == invitee.id
-        ).scalar() or Decimal('0')
-        
-        invitee_list.append({
-            "id": invitee.id,
-            "username": invitee.username,
-            "email": invitee.email,
-            "is_agent": invitee.is_agent,
-            "agent_level": invitee.agent_level,
-            "created_at": invitee.created_at.isoformat() if invitee.created_at else None,
-            "total_orders": total_orders,
-            "total_consumed": float(total_consumed),
-            "total_commission": float(total_commission)
-        })
+    # 总数使用缓存值，不在每页重复count
+    total_count = cached_total(("invitees", user.id), db.query(User).filter(User.inviter_id == user.id))
     
     return {
         "success": True,
         "invitees": invitee_list,
         "pagination": {
-            "page": page,
             "limit": limit,
-            "total": total_count,
-            "pages": (total_count + limit - 1) // limit
+            "next_cursor": next_cursor,
+            "has_more": has_more,
+            "total": total_count
         }
     }
 
 @router.get("/agent/commissions")
-async def get_commissions_api(request: Request, page: int = 1, limit: int = 10, db: Session = Depends(get_db)):
-    """获取返佣记录API"""
+async def get_commissions_api(request: Request, cursor: Optional[str] = None, limit: int = 10, db: Session = Depends(get_read_db)):
+    """获取返佣记录API（游标分页）"""
     # 检查用户是否已登录
     user = await get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="未登录")
     
-    # 计算偏移量
-    offset = (page - 1) * limit
+    limit = max(1, min(limit, 100))
+    
+    # 单条联表查询取出当前页及消费者、订单信息
+    commission_list, next_cursor, has_more = get_commission_page(db, user.id, cursor, limit)
+    
+    # 总数使用缓存值，不在每页重复count（包含已归档的返佣记录）
+    total_count = total_count_cache.get_or_set(
+        ("commissions", user.id),
+        lambda: archive.count(db, CommissionRecord, agent_id=user.id)
+    )
+    
+    return {
+        "success": True,
+        "commissions": commission_list,
+        "pagination": {
+            "limit": limit,
+            "next_cursor": next_cursor,
+            "has_more": has_more,
+            "total": total_count
+        }
+    }
+
+
+async def get_agent_stats(agent_id: int, db: Session) -> Dict[str, Any]:
+    """获取代理统计信息（读取增量维护的统计快照）"""
+    return agent_stats.get_stats(db, agent_id)
+
+
+def get_invitee_page(db: Session, agent_id: int, cursor: Optional[str], limit: int):
+    """获取一页邀请用户及其订单、返佣统计（单条SQL）"""
+    # 每个邀请用户的统计使用关联子查询，只针对当前页的行计算（包含已归档数据）
+    orders = archive.history(db, Order)
+    commissions = archive.history(db, CommissionRecord)
+    total_orders = db.query(func.count(orders.id)).filter(
+        orders.user_id == User.id
+    ).correlate(User).scalar_subquery()
+    total_consumed = db.query(func.coalesce(func.sum(orders.charge), 0)).filter(
+        orders.user_id == User.id
+    ).correlate(User).scalar_subquery()
+    total_commission = db.query(func.coalesce(func.sum(commissions.commission_amount), 0)).filter(
+        commissions.agent_id == agent_id,
+        commissions.consumer_id == User.id
+    ).correlate(User).scalar_subquery()
+    
+    query = db.query(
+        User.id,
+        User.username,
+        User.email,
+        User.is_agent,
+        User.agent_level,
+        User.created_at,
+        cursor_column(User.created_at).label("created_at_raw"),
+        total_orders.label("total_orders"),
+        total_consumed.label("total_consumed"),
+        total_commission.label("total_commission")
+    ).filter(User.inviter_id == agent_id)
+    if cursor:
+        query = query.filter(keyset_filter(User.created_at, User.id, cursor))
+    
+    # 多取一条用于判断是否还有下一页
+    rows = query.order_by(desc(User.created_at), desc(User.id)).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1].created_at_raw, rows[-1].id) if has_more else None
+    
+    invitee_list = [{
+        "id": row.id,
+        "username": row.username,
+        "email": row.email,
+        "is_agent": row.is_agent,
+        "agent_level": row.agent_level,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "total_orders": row.total_orders,
+        "total_consumed": float(row.total_consumed),
+        "total_commission": float(row.total_commission)
+    } for row in rows]
+    
+    return invitee_list, next_cursor, has_more
+
+
+def _fetch_commission_rows(db: Session, records, agent_id: int, cursor: Optional[str], limit: int):
+    """读取一页返佣记录（records 为返佣模型或合并归档库的实体），多取一条用于判断是否还有下一页"""
+    query = db.query(records, cursor_column(records.created_at)).options(
+        load_only(
+            records.id,
+            records.consumer_id,
+            records.order_id,
+            records.commission_type,
+            records.commission_rate,
+            records.order_amount,
+            records.commission_amount,
+            records.status,
+            records.created_at,
+            records.paid_at
+        ),
+        joinedload(records.consumer).load_only(User.id, User.username, User.email),
+        joinedload(records.order).load_only(Order.id, Order.service_name, Order.quantity)
+    ).filter(records.agent_id == agent_id)
+    if cursor:
+        query = query.filter(keyset_filter(records.created_at, records.id, cursor))
+    return query.order_by(desc(records.created_at), desc(records.id)).limit(limit + 1).all()
+
+
+def get_commission_page(db: Session, agent_id: int, cursor: Optional[str], limit: int):
+    """获取一页返佣记录及消费者、订单信息（单条联表SQL）"""
+    rows = _fetch_commission_rows(db, CommissionRecord, agent_id, cursor, limit)
+    
+    # 热库本页不满，或已翻到归档水位线之前时，合并归档库重新读取本页
+    watermark = archive.get_watermark(db)
+    if watermark is not None and (len(rows) <= limit or rows[-1][0].created_at < watermark):
+        rows = _fetch_commission_rows(db, archive.history(db, CommissionRecord), agent_id, cursor, limit)
     
-    # 获取返佣记录
-    commissions = db.query(CommissionRecord).filter(
-        CommissionRecord.agent_id == user.id
-    ).order_by(desc(CommissionRecord.created_at)).offset(offset).limit(limit).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1][1], rows[-1][0].id) if has_more else None
     
-    # 获取总数
-    total_count = db.query(CommissionRecord).filter(CommissionRecord.agent_id == user.id).count()
+    # 已归档返佣对应的订单也在归档库中
+    archived_orders = {}
+    missing = [commission.order_id for commission, _ in rows if commission.order is None]
+    if missing and watermark is not None:
+        orders = archive.history(db, Order)
+        archived_orders = {
+            row.id: row for row in db.query(orders.id, orders.service_name, orders.quantity).filter(
+                orders.id.in_(missing)
+            )
+        }
     
-    # 添加详细信息
     commission_list = []
-    for commission in commissions:
-        consumer = db.query(User).filter(User.id == commission.consumer_id).first()
-        order = db.query(Order).filter(Order.id == commission.order_id).first()
-        
+    for commission, _ in rows:
+        consumer = commission.consumer
+        order = commission.order or archived_orders.get(commission.order_id)
         commission_list.append({
             "id": commission.id,
             "commission_type": commission.commission_type,
@@ -208,50 +293,4 @@ async def get_commissions_api(request: Request, page: int = 1, limit: int = 10,
             }
         })
     
-    return {
-        "success": True,
-        "commissions": commission_list,
-        "pagination": {
-            "page": page,
-            "limit": limit,
-            "total": total_count,
-            "pages": (total_count + limit - 1) // limit
-        }
-    }
-
-
-async def get_agent_stats(agent_id: int, db: Session) -> Dict[str, Any]:
-    """获取代理统计信息"""
-    # 总邀请用户数
-    total_invitees = db.query(User).filter(User.inviter_id == agent_id).count()
-    
-    # 活跃邀请用户数（有订单的用户）
-    active_invitees = db.query(User).join(Order).filter(
-        User.inviter_id == agent_id
-    ).distinct().count()
-    
-    # 总返佣金额
-    total_commission = db.query(func.sum(CommissionRecord.commission_amount)).filter(
-        CommissionRecord.agent_id == agent_id
-    ).scalar() or Decimal('0')
-    
-    # 本月返佣金额
-    from datetime import datetime, timedelta
-    this_month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    monthly_commission = db.query(func.sum(CommissionRecord.commission_amount)).filter(
-        CommissionRecord.agent_id == agent_id,
-        CommissionRecord.created_at >= this_month_start
-    ).scalar() or Decimal('0')
-    
-    # 总下级消费金额
-    total_consumption = db.query(func.sum(Order.charge)).join(User).filter(
-        User.inviter_id == agent_id
-    ).scalar() or Decimal('0')
-    
-    return {
-        'total_invitees': total_invitees,
-        'active_invitees': active_invitees,
-        'total_commission': total_commission,
-        'monthly_commission': monthly_commission,
-        'total_consumption': total_consumption
-    }
+    return commission_list, next_cursor, has_more
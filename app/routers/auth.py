@@ -1,16 +1,17 @@
 """
 认证路由
 """
-from fastapi import APIRouter, Request, Form, HTTPException, status
+from fastapi import APIRouter, Request, Form, HTTPException, Depends, status
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models.user import authenticate_user, create_user, get_current_user
+from app.services.passwords import PasswordHasherBusy
+from app.services import api_keys
 from app.config import settings
+from app.templating import templates
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 
 @router.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request):
@@ -32,7 +33,14 @@ async def login(
     password: str = Form(...)
 ):
     """处理登录"""
-    user = await authenticate_user(email, password)
+    try:
+        user = await authenticate_user(email, password)
+    except PasswordHasherBusy:
+        return templates.TemplateResponse("auth/login.html", {
+            "request": request,
+            "title": "用户登录",
+            "error": "登录请求过多，请稍后再试"
+        }, status_code=503)
     if not user:
         return templates.TemplateResponse("auth/login.html", {
             "request": request,
@@ -79,7 +87,14 @@ async def register(
             "error": "两次输入的密码不一致"
         })
     
-    user = await create_user(email, username, password, invite_code)
+    try:
+        user = await create_user(email, username, password, invite_code)
+    except PasswordHasherBusy:
+        return templates.TemplateResponse("auth/register.html", {
+            "request": request,
+            "title": "用户注册",
+            "error": "注册请求过多，请稍后再试"
+        }, status_code=503)
     if not user:
         return templates.TemplateResponse("auth/register.html", {
             "request": request,
@@ -101,3 +116,44 @@ async def logout(request: Request):
     """退出登录"""
     request.session.clear()
     return RedirectResponse(url="/auth/login", status_code=302)
+
+@router.get("/api-keys")
+async def list_api_keys(request: Request, db: Session = Depends(get_db)):
+    """列出当前用户的API密钥"""
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="请先登录")
+    
+    return {"success": True, "data": [key.to_dict() for key in api_keys.list_keys(db, user.id)]}
+
+@router.post("/api-keys")
+async def create_api_key(
+    request: Request,
+    name: str = Form(""),
+    db: Session = Depends(get_db)
+):
+    """创建API密钥，明文只在此返回一次"""
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="请先登录")
+    
+    try:
+        record, key = api_keys.generate(db, user.id, name.strip()[:100])
+        db.commit()
+        return {"success": True, "message": "API密钥已创建，请立即保存，之后无法再次查看", "key": key, "data": record.to_dict()}
+    except Exception as e:
+        db.rollback()
+        return {"success": False, "message": f"创建失败: {str(e)}"}
+
+@router.post("/api-keys/{key_id}/revoke")
+async def revoke_api_key(request: Request, key_id: int, db: Session = Depends(get_db)):
+    """吊销API密钥"""
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="请先登录")
+    
+    if not api_keys.revoke(db, user.id, key_id):
+        raise HTTPException(status_code=404, detail="API密钥不存在")
+    db.commit()
+    
+    return {"success": True, "message": "API密钥已吊销"}
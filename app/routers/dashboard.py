@@ -2,18 +2,40 @@
 控制台路由
 """
 from fastapi import APIRouter, Request, Depends, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models.user import get_current_user, User
 from app.models.order import Order
-from app.models.service_price import ServicePrice
 from app.config import settings
-from app.services.appfuwu_client import appfuwu_client
+from app.services import archive, catalog
+from typing import Optional
+from app.templating import templates
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """按 Accept-Encoding 的编码和 q 值判断是否接受 gzip
+
+    q=0 表示拒绝；未单独列出 gzip 时按 * 的 q 值处理。
+    """
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = 0.0
+        qualities[coding] = q
+    q = qualities.get("gzip", qualities.get("x-gzip", qualities.get("*", 0.0)))
+    return q > 0
 
 @router.get("/dashboard", response_class=HTMLResponse)
 async def dashboard(request: Request, db: Session = Depends(get_db)):
@@ -24,15 +46,10 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
         return RedirectResponse(url="/auth/login", status_code=302)
     
     # 获取用户统计信息
-    total_orders = db.query(Order).filter(Order.user_id == user.id).count()
-    pending_orders = db.query(Order).filter(
-        Order.user_id == user.id, 
-        Order.status == "pending"
-    ).count()
-    completed_orders = db.query(Order).filter(
-        Order.user_id == user.id, 
-        Order.status == "completed"
-    ).count()
+    # 订单数包含已归档的订单
+    total_orders = archive.count(db, Order, user_id=user.id)
+    pending_orders = archive.count(db, Order, user_id=user.id, status="pending")
+    completed_orders = archive.count(db, Order, user_id=user.id, status="completed")
     
     # 获取最近订单（最多3条）
     recent_orders = db.query(Order).filter(Order.user_id == user.id).order_by(Order.created_at.desc()).limit(3).all()
@@ -43,43 +60,8 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
         "cashback_rate": 0.02
     })
     
-    # 从APPFUWU API获取服务数据
-    try:
-        # 获取所有平台的服务
-        platform_services = await appfuwu_client.get_services_by_platform()
-        
-        # 获取客户价格映射
-        service_prices = db.query(ServicePrice).filter(ServicePrice.is_active == True).all()
-        price_map = {sp.service_id: sp for sp in service_prices}
-        
-        # 更新所有平台的服务价格为客户价格
-        for platform, services_list in platform_services.items():
-            for service in services_list:
-                service_id = service.get("id")
-                if service_id in price_map:
-                    # 使用客户价格和自定义服务名称
-                    service["price"] = float(price_map[service_id].customer_price)
-                    service["api_price"] = float(price_map[service_id].api_price)  # 保留API价格用于参考
-                    service["name"] = price_map[service_id].service_name  # 使用数据库中的自定义名称
-                else:
-                    # 如果没有设置客户价格，使用API价格
-                    service["api_price"] = service.get("price", 0)
-        
-        services = platform_services
-        
-    except Exception as e:
-        print(f"获取服务失败: {e}")
-        services = {
-            "douyin": [],
-            "xiaoshou": [],
-            "hudie": [],
-            "toutiao": [],
-            "weibo": [],
-            "wechat": [],
-            "bilibili": [],
-            "xiaohongshu": [],
-            "meituan": []
-        }
+    # 服务目录与用户无关，页面只带版本号，由前端按版本请求 /admin/catalog
+    current_catalog = await catalog.get_catalog(db)
     
     return templates.TemplateResponse("admin/dashboard.html", {
         "request": request,
@@ -90,5 +72,30 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
         "completed_orders": completed_orders,
         "recent_orders": recent_orders,
         "member_level_info": member_level_info,
-        "services": services
+        "catalog_version": current_catalog.version
     })
+
+@router.get("/catalog")
+async def service_catalog(request: Request, v: Optional[str] = None, db: Session = Depends(get_db)):
+    """服务目录 JSON（ETag 协商缓存，支持 gzip）"""
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="未登录")
+    
+    current = await catalog.get_catalog(db)
+    etag = f'"{current.version}"'
+    headers = {
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+        # 按当前版本号请求的地址内容不会再变，其余情况每次协商
+        "Cache-Control": "private, max-age=31536000, immutable" if v == current.version else "private, no-cache",
+    }
+    
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    
+    if _accepts_gzip(request.headers.get("accept-encoding", "")):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=current.gzipped, media_type="application/json", headers=headers)
+    return Response(content=current.body, media_type="application/json", headers=headers)
@@ -9,6 +9,7 @@ from app.models.user import get_current_user, User
 from app.models.order import Order
 from app.models.service_price import ServicePrice
 from app.services.appfuwu_client import appfuwu_client
+from app.services import wallet
 from pydantic import BaseModel
 from typing import Optional
 from decimal import Decimal
@@ -49,13 +50,14 @@ async def submit_order(
         raise HTTPException(status_code=400, detail="服务价格未设置")
     
     # 计算订单总价（客户价格）
-    customer_total_price = Decimal(str(service_price.customer_price)) * order_data.quantity
+    customer_total_price = service_price.customer_price * order_data.quantity
     
-    # 检查用户余额是否足够
-    if user.balance < customer_total_price:
+    # 检查用户余额是否足够（以钱包流水为准）
+    current_balance = wallet.get_balance(db, user.id)
+    if current_balance < customer_total_price:
         raise HTTPException(
             status_code=400, 
-            detail=f"余额不足，需要 ¥{customer_total_price}，当前余额 ¥{user.balance}"
+            detail=f"余额不足，需要 ¥{customer_total_price}，当前余额 ¥{current_balance:.2f}"
         )
     
     try:
@@ -71,10 +73,6 @@ async def submit_order(
         if not api_result.get("success", False):
             raise HTTPException(status_code=400, detail=f"API订单提交失败: {api_result.get('message', '未知错误')}")
         
-        # 扣除用户余额（客户价格）
-        user.balance = user.balance - customer_total_price
-        user.total_consumed = user.total_consumed + customer_total_price
-        
         # 计算用户返现（基于会员等级）
         from app.config import settings
         member_level_info = settings.member_levels.get(user.member_level, {
@@ -83,8 +81,12 @@ async def submit_order(
         })
         cashback_rate = Decimal(str(member_level_info["cashback_rate"]))
         cashback_amount = customer_total_price * cashback_rate
-        user.total_cashback = user.total_cashback + cashback_amount
-        user.balance = user.balance + cashback_amount  # 返现直接加到余额
+        
+        # 累计消费和返现（get_current_user 返回的用户不在当前会话中，直接更新）
+        db.query(User).filter(User.id == user.id).update({
+            User.total_consumed: User.total_consumed + customer_total_price,
+            User.total_cashback: User.total_cashback + cashback_amount
+        }, synchronize_session=False)
         
         # 在本地数据库创建订单记录
         order = Order(
@@ -96,12 +98,17 @@ async def submit_order(
             comments=order_data.comments,  # 保存评论内容
             status="pending",
             charge=customer_total_price,  # 记录客户支付的价格
+            upstream_unit_cost=service_price.api_price,  # 记录下单时的API成本价，汇总不受之后调价影响
             external_order_id=api_result.get("order_id")
         )
         
         db.add(order)
         db.flush()  # 获取订单ID
         
+        # 更新邀请人的代理统计
+        from app.services import agent_stats
+        agent_stats.on_order_created(db, order, user.inviter_id)
+        
         # 创建返现记录
         from app.models.order import CashbackRecord
         cashback_record = CashbackRecord(
@@ -111,16 +118,15 @@ async def submit_order(
             rate=cashback_rate
         )
         db.add(cashback_record)
-        db.flush()  # 刷新但不提交，确保数据在内存中
         
-        # 计算代理返佣
-        try:
-            from app.services.commission_service import CommissionService
-            commission_service = CommissionService(db)
-            await commission_service.calculate_commission(order)
-        except Exception as e:
-            print(f"返佣计算失败: {e}")
-            # 返佣计算失败不影响订单创建
+        # 扣款和返现写入钱包流水，返现直接加到余额
+        wallet.post(db, user.id, -customer_total_price, wallet.ORDER, order.id, f"订单 {order.id} 扣款")
+        wallet.post(db, user.id, cashback_amount, wallet.CASHBACK, order.id, f"订单 {order.id} 返现")
+        wallet.sync_balances(db, [user.id])
+        
+        # 写入返佣事件，由后台任务异步计算代理返佣（与订单同一事务）
+        from app.services.commission_worker import publish_order_created
+        publish_order_created(db, order)
         
         # 最后提交所有更改
         db.commit()
@@ -3,18 +3,21 @@
 """
 from fastapi import APIRouter, Request, Depends, HTTPException, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models.user import get_current_user, User
 from app.models.recharge_record import RechargeRecord
+from app.models.money import quantize
 from decimal import Decimal
 from pydantic import BaseModel
 from typing import Optional
-from app.services.futoon_pay import FutoonPay, FutoonPayConfig
+import secrets
+import time
+from app.services.futoon_pay import get_futoon_client
+from app.services import wallet, payments
+from app.templating import templates
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 
 @router.get("/recharge", response_class=HTMLResponse)
 async def recharge_page(request: Request, db: Session = Depends(get_db)):
@@ -63,9 +66,6 @@ async def submit_recharge(
     # 这里可以集成真实的支付接口
     # 目前先模拟支付成功，直接增加余额
     try:
-        # 增加用户余额
-        user.balance = Decimal(str(user.balance)) + Decimal(str(amount))
-        
         # 创建充值记录
         recharge_record = RechargeRecord(
             user_id=user.id,
@@ -75,12 +75,17 @@ async def submit_recharge(
         )
         
         db.add(recharge_record)
+        db.flush()
+        
+        # 增加用户余额（写入钱包流水）
+        wallet.post(db, user.id, Decimal(str(amount)), wallet.RECHARGE, recharge_record.id, f"{payment_method} 充值")
+        wallet.sync_balances(db, [user.id])
         db.commit()
         
         return {
             "success": True, 
             "message": f"充值成功！已到账 ¥{amount}",
-            "new_balance": float(user.balance)
+            "new_balance": float(wallet.get_balance(db, user.id))
         }
     except Exception as e:
         db.rollback()
@@ -105,14 +110,6 @@ class CreatePaymentResponse(BaseModel):
     message: str
 
 
-def _build_futoon_client() -> FutoonPay:
-    import os
-    pid = os.getenv("FUTOON_PID", "2208")
-    key = os.getenv("FUTOON_KEY", "2m57wWbSnqs52ZmQMMpLUxLel6wXSzup")
-    api_url = os.getenv("FUTOON_API_URL", "https://futoon.org/mapi.php")
-    return FutoonPay(FutoonPayConfig(pid=pid, key=key, api_url=api_url))
-
-
 def _client_ip(request: Request) -> str:
     real_ip = request.headers.get("x-real-ip")
     if real_ip:
@@ -124,26 +121,31 @@ def _client_ip(request: Request) -> str:
 
 
 @router.post("/api/recharge/futoon/create", response_model=CreatePaymentResponse)
-async def create_futoon_payment(req: CreatePaymentRequest, request: Request):
+async def create_futoon_payment(req: CreatePaymentRequest, request: Request, db: Session = Depends(get_db)):
     """创建富通支付订单，返回支付链接/二维码。"""
-    if req.amount <= 0:
+    amount = quantize(req.amount, 2)
+    if amount <= 0:
         return CreatePaymentResponse(success=False, message="金额不正确")
 
     user = await get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="未登录")
 
-    out_trade_no = f"FT{user.id}{int(__import__('time').time()*1000)}"
+    out_trade_no = f"FT{user.id}{int(time.time() * 1000)}{secrets.randbelow(10000):04d}"
+
+    # 先落库再请求网关，回调到达时一定能找到订单
+    payments.create_intent(db, out_trade_no, user.id, amount, req.payment_type)
+    db.commit()
 
-    fp = _build_futoon_client()
+    fp = get_futoon_client()
     origin = str(request.base_url).rstrip("/")
     notify_url = f"{origin}/api/recharge/futoon/notify"
     return_url = f"{origin}/recharge"
 
-    result = fp.create_order(
+    result = await fp.create_order(
         out_trade_no=out_trade_no,
         name=req.remark or "账户充值",
-        money=req.amount,
+        money=str(amount),
         payment_type=req.payment_type,
         notify_url=notify_url,
         return_url=return_url,
@@ -152,6 +154,8 @@ async def create_futoon_payment(req: CreatePaymentRequest, request: Request):
     )
 
     if not result.get("success"):
+        payments.mark_failed(db, out_trade_no)
+        db.commit()
         return CreatePaymentResponse(success=False, message=result.get("message", "创建失败"))
 
     return CreatePaymentResponse(
@@ -166,41 +170,29 @@ async def create_futoon_payment(req: CreatePaymentRequest, request: Request):
 
 @router.get("/api/recharge/futoon/notify")
 async def futoon_notify(request: Request, db: Session = Depends(get_db)):
-    """富通支付异步回调（官方为GET），验签后给用户入账。"""
+    """富通支付异步回调（官方为GET），验签后按支付订单入账，重复回调不会重复入账。"""
     params = dict(request.query_params)
 
-    fp = _build_futoon_client()
-    valid = fp.verify_notify(params)
-    # 可根据需要强制 valid 为 True
+    fp = get_futoon_client()
+    if not fp.verify_notify(params):
+        return {"status": "fail"}
 
     out_trade_no = params.get("out_trade_no")
     trade_status = params.get("trade_status")
     money = params.get("money")
-    user_id = params.get("param")  # 我们把用户ID放在param里
 
-    if not out_trade_no or not money or not user_id:
+    if not out_trade_no or not money or trade_status != "TRADE_SUCCESS":
         return {"status": "fail"}
 
-    if trade_status == "TRADE_SUCCESS":
-        try:
-            # 给指定用户入账
-            target = db.query(User).filter(User.id == int(user_id)).first()
-            if not target:
-                return {"status": "fail"}
-            target.balance = Decimal(str(target.balance)) + Decimal(str(money))
-
-            # 记录充值记录
-            record = RechargeRecord(
-                user_id=target.id,
-                amount=Decimal(str(money)),
-                payment_method="futoon",
-                status="completed",
-            )
-            db.add(record)
-            db.commit()
-            return {"status": "success"}
-        except Exception:
-            db.rollback()
-            return {"status": "fail"}
+    try:
+        result = payments.settle(db, out_trade_no, Decimal(money), params.get("trade_no"),
+                                 f"富通支付 {out_trade_no}")
+        db.commit()
+    except Exception:
+        db.rollback()
+        return {"status": "fail"}
 
+    # 已入账的重复回调也应答成功，网关不再重试
+    if result in (payments.CREDITED, payments.ALREADY_PAID):
+        return {"status": "success"}
     return {"status": "fail"}
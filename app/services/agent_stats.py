@@ -0,0 +1,170 @@
+"""
+代理统计快照服务
+
+注册、下单、返佣时增量更新 agent_stats，代理页面读取时只需一次主键查询。
+"""
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import select, func, case, literal, delete, insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, aliased
+
+from app.models.agent_stats import AgentStats
+from app.models.commission import CommissionRecord
+from app.models.order import Order
+from app.models.user import User
+from app.services import archive
+
+
+def current_month() -> str:
+    """当前月份标识 (YYYY-MM)"""
+    return datetime.now().strftime("%Y-%m")
+
+
+def _month_start() -> datetime:
+    return datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _increment(db: Session, agent_id: int, invitees: int = 0, active: int = 0,
+               consumption: Decimal = Decimal("0"), commission: Decimal = Decimal("0")) -> None:
+    """对代理统计做增量更新（行不存在时插入）"""
+    month = current_month()
+    stmt = sqlite_insert(AgentStats).values(
+        agent_id=agent_id,
+        total_invitees=invitees,
+        active_invitees=active,
+        total_commission=commission,
+        monthly_commission=commission,
+        stats_month=month,
+        total_consumption=consumption
+    )
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[AgentStats.agent_id],
+        set_={
+            "total_invitees": AgentStats.total_invitees + excluded.total_invitees,
+            "active_invitees": AgentStats.active_invitees + excluded.active_invitees,
+            "total_commission": AgentStats.total_commission + excluded.total_commission,
+            # 跨月时当月返佣从本次金额重新累计
+            "monthly_commission": case(
+                (AgentStats.stats_month == month, AgentStats.monthly_commission + excluded.monthly_commission),
+                else_=excluded.monthly_commission
+            ),
+            "stats_month": month,
+            "total_consumption": AgentStats.total_consumption + excluded.total_consumption,
+            "updated_at": func.now()
+        }
+    )
+    db.execute(stmt)
+
+
+def on_user_registered(db: Session, user_id: int, inviter_id: Optional[int]) -> None:
+    """用户注册：创建自身统计行，邀请人邀请数+1"""
+    _increment(db, user_id)
+    if inviter_id:
+        _increment(db, inviter_id, invitees=1)
+
+
+def on_order_created(db: Session, order: Order, inviter_id: Optional[int]) -> None:
+    """用户下单：邀请人的下级消费累加，首单时活跃邀请数+1"""
+    if not inviter_id:
+        return
+    first_order = db.query(Order.id).filter(
+        Order.user_id == order.user_id,
+        Order.id != order.id
+    ).first() is None
+    if first_order and archive.reaches_archive(db):
+        orders = archive.history(db, Order)
+        first_order = db.query(orders.id).filter(orders.user_id == order.user_id).first() is None
+    _increment(db, inviter_id, active=1 if first_order else 0, consumption=order.charge or Decimal("0"))
+
+
+def on_commission(db: Session, agent_id: int, amount: Decimal) -> None:
+    """产生返佣：累计返佣和当月返佣累加"""
+    _increment(db, agent_id, commission=amount)
+
+
+def _stats_select(db: Session):
+    """从明细数据计算每个用户统计的查询（包含已归档的订单和返佣）"""
+    invitee = aliased(User)
+    month_start = _month_start()
+    orders = archive.history(db, Order)
+    commissions = archive.history(db, CommissionRecord)
+
+    total_invitees = select(func.count(invitee.id)).where(
+        invitee.inviter_id == User.id
+    ).correlate(User).scalar_subquery()
+    active_invitees = select(func.count(func.distinct(orders.user_id))).join(
+        invitee, invitee.id == orders.user_id
+    ).where(invitee.inviter_id == User.id).correlate(User).scalar_subquery()
+    total_commission = select(func.coalesce(func.sum(commissions.commission_amount), 0)).where(
+        commissions.agent_id == User.id,
+        commissions.status != "cancelled"
+    ).correlate(User).scalar_subquery()
+    month_commissions = archive.history(db, CommissionRecord, month_start)
+    monthly_commission = select(func.coalesce(func.sum(month_commissions.commission_amount), 0)).where(
+        month_commissions.agent_id == User.id,
+        month_commissions.status != "cancelled",
+        month_commissions.created_at >= month_start
+    ).correlate(User).scalar_subquery()
+    total_consumption = select(func.coalesce(func.sum(orders.charge), 0)).join(
+        invitee, invitee.id == orders.user_id
+    ).where(invitee.inviter_id == User.id).correlate(User).scalar_subquery()
+
+    return select(
+        User.id,
+        total_invitees,
+        active_invitees,
+        total_commission,
+        monthly_commission,
+        literal(current_month()),
+        total_consumption
+    )
+
+
+def rebuild(db: Session, agent_ids: Optional[Iterable[int]] = None) -> None:
+    """从明细数据重建统计快照（agent_ids 为空时重建全部）"""
+    source = _stats_select(db)
+    if agent_ids is not None:
+        agent_ids = [agent_id for agent_id in agent_ids if agent_id]
+        if not agent_ids:
+            return
+        db.execute(delete(AgentStats).where(AgentStats.agent_id.in_(agent_ids)))
+        source = source.where(User.id.in_(agent_ids))
+    else:
+        db.execute(delete(AgentStats))
+
+    db.execute(insert(AgentStats).from_select(
+        ["agent_id", "total_invitees", "active_invitees", "total_commission",
+         "monthly_commission", "stats_month", "total_consumption"],
+        source
+    ))
+
+
+def get_stats(db: Session, agent_id: int) -> Dict[str, Any]:
+    """读取代理统计（一次主键查询，快照缺失时从明细计算）"""
+    row = db.query(AgentStats).filter(AgentStats.agent_id == agent_id).first()
+    if row is None:
+        values = db.execute(_stats_select(db).where(User.id == agent_id)).first()
+        if values is None:
+            values = (agent_id, 0, 0, 0, 0, current_month(), 0)
+        row = AgentStats(
+            agent_id=agent_id,
+            total_invitees=values[1],
+            active_invitees=values[2],
+            total_commission=values[3],
+            monthly_commission=values[4],
+            stats_month=values[5],
+            total_consumption=values[6]
+        )
+
+    monthly_commission = row.monthly_commission if row.stats_month == current_month() else 0
+    return {
+        "total_invitees": row.total_invitees or 0,
+        "active_invitees": row.active_invitees or 0,
+        "total_commission": row.total_commission or Decimal("0"),
+        "monthly_commission": monthly_commission or Decimal("0"),
+        "total_consumption": row.total_consumption or Decimal("0")
+    }
@@ -0,0 +1,130 @@
+"""
+API密钥认证
+
+密钥格式为 tk_<前缀>_<随机串>。数据库只保存前缀（唯一索引，用于查找）和完整密钥的
+SHA-256，明文只在创建时返回一次。校验通过的身份按密钥哈希缓存一小段时间，
+程序化客户端的重复请求不再查询用户表；吊销时主动清除对应缓存。
+格式不符的密钥在计算哈希前直接拒绝；无效密钥不缓存，随机密钥无法挤掉缓存中的有效身份。
+"""
+import hashlib
+import hmac
+import re
+import secrets
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+from starlette.middleware.sessions import SessionMiddleware
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.api_key import ApiKey
+from app.models.user import User
+from app.services.cache import TTLCache
+
+KEY_PREFIX = "tk"
+PREFIX_BYTES = 6  # 前缀 12 个十六进制字符
+SECRET_BYTES = 32
+
+# tk_<12位十六进制前缀>_<token_urlsafe(32) 生成的 43 位随机串>
+_KEY_FORMAT = re.compile(rf"^{KEY_PREFIX}_(?P<prefix>[0-9a-f]{{{PREFIX_BYTES * 2}}})_[A-Za-z0-9_-]{{43}}$")
+
+# 密钥哈希 -> 已认证的用户（脱离会话的只读对象），只缓存校验通过的密钥
+principal_cache = TTLCache(ttl=settings.api_key_cache_ttl, maxsize=settings.api_key_cache_size)
+
+
+def hash_key(key: str) -> str:
+    """计算密钥哈希（密钥本身是高熵随机串，SHA-256 即可，无需慢哈希）"""
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def parse_prefix(key: str) -> Optional[str]:
+    """从密钥中取出前缀，格式不符返回None"""
+    match = _KEY_FORMAT.match(key)
+    return match.group("prefix") if match else None
+
+
+def generate(db: Session, user_id: int, name: str = "") -> Tuple[ApiKey, str]:
+    """为用户创建密钥，返回 (记录, 明文密钥)；调用方负责提交"""
+    while True:
+        prefix = secrets.token_hex(PREFIX_BYTES)
+        if not db.query(ApiKey.id).filter(ApiKey.prefix == prefix).first():
+            break
+    key = f"{KEY_PREFIX}_{prefix}_{secrets.token_urlsafe(SECRET_BYTES)}"
+    record = ApiKey(user_id=user_id, name=name, prefix=prefix, key_hash=hash_key(key))
+    db.add(record)
+    db.flush()
+    return record, key
+
+
+def list_keys(db: Session, user_id: int) -> List[ApiKey]:
+    """列出用户的全部密钥（含已吊销）"""
+    return db.query(ApiKey).filter(ApiKey.user_id == user_id).order_by(ApiKey.id.desc()).all()
+
+
+def revoke(db: Session, user_id: int, key_id: int) -> bool:
+    """吊销用户的密钥并清除身份缓存；调用方负责提交"""
+    record = db.query(ApiKey).filter(ApiKey.id == key_id, ApiKey.user_id == user_id).first()
+    if not record:
+        return False
+    if record.revoked_at is None:
+        record.revoked_at = datetime.utcnow()
+    principal_cache.delete(record.key_hash)
+    return True
+
+
+def authenticate(key: str) -> Optional[User]:
+    """校验密钥，返回对应的有效用户"""
+    prefix = parse_prefix(key)
+    if not prefix:
+        return None
+    digest = hash_key(key)
+    cached = principal_cache.get(digest)
+    if cached is not None:
+        return cached
+
+    user = _load_principal(prefix, digest)
+    if user is not None:
+        principal_cache.set(digest, user)
+    return user
+
+
+def _load_principal(prefix: str, digest: str) -> Optional[User]:
+    """按前缀查找密钥并比对哈希，通过时记录使用时间"""
+    db = SessionLocal()
+    try:
+        row = (
+            db.query(ApiKey, User)
+            .join(User, User.id == ApiKey.user_id)
+            .filter(ApiKey.prefix == prefix, ApiKey.revoked_at.is_(None), User.status == 1)
+            .first()
+        )
+        if not row or not hmac.compare_digest(row.ApiKey.key_hash, digest):
+            return None
+        row.ApiKey.last_used_at = datetime.utcnow()
+        db.commit()
+        db.refresh(row.User)
+        db.expunge(row.User)
+        return row.User
+    finally:
+        db.close()
+
+
+def is_api_request(path: str, header_present: bool) -> bool:
+    """是否按API密钥认证：仅 /api/ 路径且带了密钥请求头"""
+    return header_present and path.startswith("/api/")
+
+
+class ApiKeySessionMiddleware(SessionMiddleware):
+    """携带API密钥的 /api/ 请求跳过会话Cookie的解析和回写"""
+
+    _header = settings.api_key_header.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http" and is_api_request(
+            scope["path"], any(name == self._header for name, _ in scope["headers"])
+        ):
+            scope["session"] = {}
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
@@ -0,0 +1,221 @@
+"""
+冷数据归档服务
+
+orders、cashback_records、commission_records 只增不减。已结算且超过
+archive_after_days 的订单连同其返现、返佣记录分批移入挂载的归档库
+（archive.<表名>），热库只保留近期数据。
+
+settings 表的 archive_watermark 记录已归档数据的时间上界：查询的日期
+范围早于该时间（或不限日期的全量统计）时才合并归档库，否则只读热库。
+"""
+import time
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import Column, Index, MetaData, Table, delete, exists, func, insert, inspect, select, text, union_all
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, aliased
+
+from app.config import settings
+from app.database import ARCHIVE_SCHEMA, archive_engines
+from app.models.commission import CommissionRecord
+from app.models.order import Order, CashbackRecord
+from app.services.cache import TTLCache
+
+WATERMARK_KEY = "archive_watermark"
+
+# 参与归档的表：订单及其返现、返佣记录
+ARCHIVED_TABLES = [Order.__table__, CashbackRecord.__table__, CommissionRecord.__table__]
+
+archive_metadata = MetaData(schema=ARCHIVE_SCHEMA)
+
+
+def _cold_copy(table: Table) -> Table:
+    """复制表结构和索引（不含外键，被引用的表不在归档库中）"""
+    cold = Table(table.name, archive_metadata, *[
+        Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+        for column in table.c
+    ])
+    for index in table.indexes:
+        Index(index.name, *[cold.c[column.name] for column in index.columns], unique=index.unique)
+    return cold
+
+
+_archive_tables: Dict[str, Table] = {table.name: _cold_copy(table) for table in ARCHIVED_TABLES}
+
+# 归档行数按数据库引擎缓存，只在归档任务运行时变化，任务结束后清空
+_count_cache = TTLCache(ttl=60.0, maxsize=10000)
+
+
+def archive_table(table: Table) -> Table:
+    """热库表对应的归档表"""
+    return _archive_tables[table.name]
+
+
+def create_archive_tables(engine: Engine) -> None:
+    """在归档库中创建与热库结构相同的表和索引，并为已有的归档表补加新增的列"""
+    archive_metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in archive_metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name, schema=ARCHIVE_SCHEMA)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {ARCHIVE_SCHEMA}.{table.name} ADD COLUMN "{column.name}" {column_type}'))
+    for table in archive_metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def get_watermark(db: Session) -> Optional[datetime]:
+    """已归档数据的时间上界（从未归档或未挂载归档库时为空）
+
+    不做缓存：读库和写库是不同的引擎，按引擎缓存会让读库在归档推进后继续使用旧水位线；
+    这里只是 settings 表按唯一键读一行，开销可以忽略。
+    """
+    if db.get_bind() not in archive_engines:
+        return None
+    value = db.execute(
+        text("SELECT setting_value FROM settings WHERE setting_key = :key"), {"key": WATERMARK_KEY}
+    ).scalar()
+    return datetime.fromisoformat(value) if value else None
+
+
+def _save_watermark(db: Session, watermark: datetime) -> None:
+    db.execute(text("""
+        INSERT OR REPLACE INTO settings (setting_key, setting_value, description, updated_at)
+        VALUES (:key, :value, '已归档数据的时间上界', datetime('now'))
+    """), {"key": WATERMARK_KEY, "value": watermark.isoformat()})
+
+
+def reaches_archive(db: Session, start: Optional[datetime] = None) -> bool:
+    """从 start 开始的查询是否需要读取归档库（start 为空表示不限日期）"""
+    watermark = get_watermark(db)
+    return watermark is not None and (start is None or start < watermark)
+
+
+def history(db: Session, model, start: Optional[datetime] = None):
+    """返回可直接用于查询的实体：范围触及归档时为热库与归档库的 UNION ALL，否则为原模型"""
+    if not reaches_archive(db, start):
+        return model
+    table = model.__table__
+    cold = archive_table(table)
+    combined = union_all(
+        select(*table.c),
+        select(*[cold.c[column.name] for column in table.c])
+    ).subquery(table.name)
+    return aliased(model, combined)
+
+
+def history_table(db: Session, table: Table, start: Optional[datetime] = None):
+    """Core 查询使用的表，规则同 history()"""
+    if not reaches_archive(db, start):
+        return table
+    cold = archive_table(table)
+    return union_all(
+        select(*table.c),
+        select(*[cold.c[column.name] for column in table.c])
+    ).subquery(table.name)
+
+
+def _eligible_orders(db: Session, cutoff: datetime, after_id: int, limit: int) -> List[int]:
+    """已结算（返佣和经营汇总已完成、无待支付返佣）且早于 cutoff 的订单"""
+    pending_commission = exists().where(
+        CommissionRecord.order_id == Order.id,
+        CommissionRecord.status == "pending"
+    )
+    return [order_id for (order_id,) in db.query(Order.id).filter(
+        Order.id > after_id,
+        Order.created_at < cutoff,
+        Order.rolled_up_at != None,
+        ~pending_commission
+    ).order_by(Order.id).limit(limit)]
+
+
+def _move(db: Session, table: Table, key, ids: List[int]) -> int:
+    """把热库中 key IN ids 的行复制到归档库后删除"""
+    cold = archive_table(table)
+    columns = [column.name for column in table.c]
+    db.execute(insert(cold).from_select(columns, select(*[table.c[name] for name in columns]).where(key.in_(ids))))
+    return db.execute(delete(table).where(key.in_(ids))).rowcount
+
+
+@dataclass
+class ArchiveReport:
+    """归档结果"""
+    cutoff: str
+    batches: int = 0
+    orders: int = 0
+    cashback_records: int = 0
+    commission_records: int = 0
+    finished: bool = False
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def archive_settled(db: Session, older_than_days: Optional[int] = None, batch_size: Optional[int] = None,
+                    max_batches: Optional[int] = None, pause: float = 0.0) -> ArchiveReport:
+    """分批把已结算的旧订单及其返现、返佣记录移入归档库
+
+    每批在单独的短事务中完成（先写归档、再删热库），批与批之间可暂停，
+    不会长时间阻塞下单等写操作。
+    """
+    days = settings.archive_after_days if older_than_days is None else older_than_days
+    batch_size = batch_size or settings.archive_batch_size
+    cutoff = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+    report = ArchiveReport(cutoff=cutoff.isoformat())
+
+    # 先推进水位线再搬数据，保证读取端在数据移走前就开始合并归档库
+    watermark = get_watermark(db)
+    if watermark is None or watermark < cutoff:
+        _save_watermark(db, cutoff)
+        db.commit()
+
+    last_id = 0
+    while max_batches is None or report.batches < max_batches:
+        ids = _eligible_orders(db, cutoff, last_id, batch_size)
+        if not ids:
+            report.finished = True
+            break
+        try:
+            report.cashback_records += _move(db, CashbackRecord.__table__, CashbackRecord.__table__.c.order_id, ids)
+            report.commission_records += _move(db, CommissionRecord.__table__, CommissionRecord.__table__.c.order_id, ids)
+            report.orders += _move(db, Order.__table__, Order.__table__.c.id, ids)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        report.batches += 1
+        last_id = ids[-1]
+        if pause:
+            time.sleep(pause)
+
+    _count_cache.clear()
+    return report
+
+
+def count(db: Session, model, **filters) -> int:
+    """按等值条件统计热库与归档库的行数
+
+    归档部分在归档任务之间不会变化，按条件缓存，避免每次统计都扫描冷数据。
+    """
+    table = model.__table__
+    hot = db.execute(select(func.count()).select_from(table).where(
+        *[table.c[name] == value for name, value in filters.items()]
+    )).scalar()
+    if get_watermark(db) is None:
+        return hot
+
+    key = (db.get_bind(), table.name, tuple(sorted(filters.items())))
+    cold = _count_cache.get(key)
+    if cold is None:
+        cold_table = archive_table(table)
+        cold = db.execute(select(func.count()).select_from(cold_table).where(
+            *[cold_table.c[name] == value for name, value in filters.items()]
+        )).scalar()
+        _count_cache.set(key, cold)
+    return hot + cold
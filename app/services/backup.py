@@ -0,0 +1,243 @@
+"""
+在线数据库备份
+
+使用 SQLite 在线备份 API 每次复制少量页面，步骤之间让出数据库锁，
+备份期间下单等写操作不会被阻塞。备份写入临时文件，完整性检查通过后
+才改为正式文件名，并按保留策略清理旧备份。
+归档库（冷数据）与主库用同一时间戳一起备份，恢复时两个文件需成对还原。
+"""
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import engine
+
+STATUS_KEY = "backup_last_status"
+
+_BACKUP_NAME = re.compile(r"^(?P<stem>.+)_backup_(?P<ts>\d{14})\.db$")
+
+
+def _source_path() -> Optional[str]:
+    database = engine.url.database
+    if engine.dialect.name != "sqlite" or database in (None, "", ":memory:"):
+        return None
+    return database
+
+
+def _archive_path() -> Optional[str]:
+    """已挂载的归档库文件（冷数据与主库一起备份，恢复时需成对还原）"""
+    path = settings.archive_database_path
+    if not path or path == ":memory:" or not os.path.exists(path):
+        return None
+    return path
+
+
+def list_backups(backup_dir: Optional[str] = None) -> List[Dict]:
+    """列出备份文件，按时间倒序"""
+    backup_dir = backup_dir or settings.backup_dir
+    if not os.path.isdir(backup_dir):
+        return []
+    backups = []
+    for name in os.listdir(backup_dir):
+        match = _BACKUP_NAME.match(name)
+        if not match:
+            continue
+        path = os.path.join(backup_dir, name)
+        backups.append({
+            "name": name,
+            "path": path,
+            "size": os.path.getsize(path),
+            "created_at": datetime.strptime(match.group("ts"), "%Y%m%d%H%M%S")
+        })
+    return sorted(backups, key=lambda item: item["created_at"], reverse=True)
+
+
+def apply_retention(backup_dir: Optional[str] = None, keep_last: Optional[int] = None,
+                    keep_daily_days: Optional[int] = None, now: Optional[datetime] = None) -> List[str]:
+    """按保留策略删除旧备份，返回删除的文件名
+
+    同一时间戳的主库和归档库备份是一组，按组保留：保留最近 keep_last 组，
+    另外在最近 keep_daily_days 天内每天保留最新的一组。
+    """
+    keep_last = settings.backup_keep_last if keep_last is None else keep_last
+    keep_daily_days = settings.backup_keep_daily_days if keep_daily_days is None else keep_daily_days
+    now = now or datetime.now()
+    backups = list_backups(backup_dir)
+    timestamps = sorted({item["created_at"] for item in backups}, reverse=True)
+
+    keep = set(timestamps[:keep_last])
+    daily_since = (now - timedelta(days=keep_daily_days)).date()
+    seen_days = set()
+    for created_at in timestamps:
+        day = created_at.date()
+        if day >= daily_since and day not in seen_days:
+            seen_days.add(day)
+            keep.add(created_at)
+
+    removed = []
+    for item in backups:
+        if item["created_at"] not in keep:
+            os.remove(item["path"])
+            removed.append(item["name"])
+    return removed
+
+
+def _copy(source_path: str, backup_dir: str, timestamp: str, pages: int, sleep: float) -> Dict:
+    """把一个数据库分步复制到临时文件并做完整性检查"""
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    name = f"{stem}_backup_{timestamp}.db"
+    temp_path = os.path.join(backup_dir, name) + ".tmp"
+
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(temp_path)
+    try:
+        # 每步只复制少量页面，步骤之间暂停并释放读锁
+        source.backup(target, pages=pages, sleep=sleep)
+        integrity = target.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        target.close()
+        source.close()
+    return {"file": name, "temp_path": temp_path, "size": os.path.getsize(temp_path), "integrity": integrity}
+
+
+def run_backup(source_path: Optional[str] = None, backup_dir: Optional[str] = None,
+               pages: Optional[int] = None, sleep: Optional[float] = None,
+               archive_path: Optional[str] = None) -> Dict:
+    """执行一次在线备份并校验完整性，返回备份状态
+
+    未指定 source_path 时备份主库以及已挂载的归档库。两个文件使用同一时间戳，
+    全部通过完整性检查后才一起改为正式文件名。
+    """
+    if source_path is None:
+        source_path = _source_path()
+        archive_path = archive_path or _archive_path()
+    backup_dir = backup_dir or settings.backup_dir
+    pages = pages or settings.backup_pages_per_step
+    sleep = settings.backup_step_sleep if sleep is None else sleep
+    started = time.monotonic()
+    status = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "success": False,
+        "file": None,
+        "size": 0,
+        "integrity": None,
+        "files": [],
+        "duration_ms": 0,
+        "removed": [],
+        "error": None
+    }
+    if not source_path:
+        status["error"] = "当前数据库不是文件型 SQLite，无法备份"
+        return status
+
+    os.makedirs(backup_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    copies = []
+    try:
+        for path in [source_path] + ([archive_path] if archive_path else []):
+            copies.append(_copy(path, backup_dir, timestamp, pages, sleep))
+
+        status["files"] = [
+            {"file": item["file"], "size": item["size"], "integrity": item["integrity"]} for item in copies
+        ]
+        status["integrity"] = copies[0]["integrity"]
+        failed = [item for item in copies if item["integrity"] != "ok"]
+        if failed:
+            status["error"] = "完整性检查失败: " + "; ".join(f"{item['file']}: {item['integrity']}" for item in failed)
+        else:
+            for item in copies:
+                os.replace(item["temp_path"], os.path.join(backup_dir, item["file"]))
+            status.update(success=True, file=copies[0]["file"], size=copies[0]["size"])
+            status["removed"] = apply_retention(backup_dir)
+    except Exception as e:
+        status["error"] = str(e)
+    finally:
+        for item in copies:
+            if os.path.exists(item["temp_path"]):
+                os.remove(item["temp_path"])
+        # 复制中途失败时清理尚未记录的临时文件
+        for name in os.listdir(backup_dir):
+            if name.endswith(f"_backup_{timestamp}.db.tmp"):
+                os.remove(os.path.join(backup_dir, name))
+
+    status["duration_ms"] = int((time.monotonic() - started) * 1000)
+    return status
+
+
+def save_status(status: Dict) -> None:
+    """把最近一次备份状态写入 settings 表"""
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT OR REPLACE INTO settings (setting_key, setting_value, description, updated_at)
+            VALUES (:key, :value, '最近一次数据库备份状态', datetime('now'))
+        """), {"key": STATUS_KEY, "value": json.dumps(status, ensure_ascii=False)})
+
+
+def load_status(db) -> Optional[Dict]:
+    """读取最近一次备份状态"""
+    value = db.execute(
+        text("SELECT setting_value FROM settings WHERE setting_key = :key"), {"key": STATUS_KEY}
+    ).scalar()
+    return json.loads(value) if value else None
+
+
+class BackupWorker:
+    """后台定时备份"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    def run_once(self) -> Dict:
+        """执行一次备份并记录状态（在线程中执行，不阻塞事件循环）"""
+        status = run_backup()
+        save_status(status)
+        if not status["success"]:
+            print(f"数据库备份失败: {status['error']}")
+        return status
+
+    async def trigger(self) -> Dict:
+        """立即备份一次（同一时间只允许一个备份）"""
+        async with self._lock:
+            return await asyncio.to_thread(self.run_once)
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=settings.backup_interval_hours * 3600)
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping.is_set():
+                break
+            try:
+                await self.trigger()
+            except Exception as e:
+                print(f"数据库备份任务异常: {e}")
+
+    def start(self) -> None:
+        """启动后台任务（backup_interval_hours 为 0 时不启动）"""
+        if settings.backup_interval_hours <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台任务"""
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+
+
+# 全局任务实例
+backup_worker = BackupWorker()
@@ -0,0 +1,66 @@
+"""
+进程内缓存工具
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """带过期时间的简单进程内缓存（线程安全）"""
+
+    def __init__(self, ttl: float = 60.0, maxsize: int = 10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: Dict[Hashable, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """读取缓存，过期则返回默认值"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """写入缓存"""
+        with self._lock:
+            if len(self._data) >= self.maxsize and key not in self._data:
+                self._evict()
+            self._data[key] = (time.monotonic() + (ttl if ttl is not None else self.ttl), value)
+
+    def get_or_set(self, key: Hashable, factory: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """读取缓存，未命中时调用factory计算并写入"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    def delete(self, key: Hashable) -> None:
+        """删除缓存项"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def _evict(self) -> None:
+        """淘汰过期项，仍然满则淘汰最早过期的一半"""
+        now = time.monotonic()
+        for key in [k for k, (exp, _) in self._data.items() if exp < now]:
+            del self._data[key]
+        if len(self._data) >= self.maxsize:
+            ordered = sorted(self._data.items(), key=lambda kv: kv[1][0])
+            for key, _ in ordered[: len(ordered) // 2 or 1]:
+                del self._data[key]
+
+
+_MISSING = object()
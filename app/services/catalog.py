@@ -0,0 +1,120 @@
+"""
+服务目录
+
+目录与用户无关：上游服务列表按平台分类后，用客户价格和自定义名称覆盖。上游列表缓存
+catalog_upstream_ttl 秒；价格表按展示相关的列计算签名判断是否变化。
+版本号由上游目录哈希和价格签名共同决定，同一版本的 JSON 和 gzip 结果只生成一次，
+控制台按版本请求目录，客户端和浏览器缓存可直接复用。
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.service_price import ServicePrice
+from app.services.appfuwu_client import appfuwu_client
+from app.services.cache import TTLCache
+
+PLATFORMS = ("douyin", "xiaoshou", "hudie", "weibo", "xiaohongshu", "meituan")
+
+_upstream_cache = TTLCache(ttl=settings.catalog_upstream_ttl, maxsize=1)
+_payload_cache = TTLCache(ttl=24 * 3600, maxsize=8)
+_upstream_lock = asyncio.Lock()
+
+
+@dataclass
+class Catalog:
+    """某一版本的目录"""
+    version: str
+    body: bytes  # JSON
+    gzipped: bytes
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+async def _upstream() -> Tuple[str, Dict[str, List[Dict]]]:
+    """上游分类目录及其哈希（缓存，失败时返回空目录且不缓存）"""
+    cached = _upstream_cache.get("services")
+    if cached is not None:
+        return cached
+    async with _upstream_lock:
+        cached = _upstream_cache.get("services")
+        if cached is not None:
+            return cached
+        try:
+            services = await appfuwu_client.get_services_by_platform()
+        except Exception as e:
+            print(f"获取服务失败: {e}")
+            services = {platform: [] for platform in PLATFORMS}
+            return _digest("unavailable"), services
+        result = (_digest(json.dumps(services, sort_keys=True, ensure_ascii=False)), services)
+        _upstream_cache.set("services", result)
+        return result
+
+
+def price_signature(db: Session) -> str:
+    """价格表签名：任一价格新增、修改或停用都会改变
+
+    对影响展示的列逐行求哈希（updated_at 只精确到秒，同一秒内的两次修改无法区分）。
+    价格表只有数百行，只取这几列的开销远小于重新生成目录。
+    """
+    digest = hashlib.sha256()
+    rows = db.query(
+        ServicePrice.service_id, ServicePrice.service_name, ServicePrice.api_price, ServicePrice.customer_price,
+        ServicePrice.min_quantity, ServicePrice.max_quantity, ServicePrice.is_active
+    ).order_by(ServicePrice.id).all()
+    for row in rows:
+        digest.update(repr(tuple(row)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def _apply_prices(db: Session, platform_services: Dict[str, List[Dict]]) -> Dict[str, List[Dict]]:
+    """用客户价格和自定义名称覆盖上游数据（返回新字典，不修改缓存的上游数据）"""
+    service_prices = db.query(ServicePrice).filter(ServicePrice.is_active == True).all()
+    price_map = {sp.service_id: sp for sp in service_prices}
+
+    result = {}
+    for platform, services_list in platform_services.items():
+        items = []
+        for upstream in services_list:
+            service = dict(upstream)
+            service_id = service.get("id")
+            if service_id in price_map:
+                # 使用客户价格和自定义服务名称，保留API价格用于参考
+                service["price"] = float(price_map[service_id].customer_price)
+                service["api_price"] = float(price_map[service_id].api_price)
+                service["name"] = price_map[service_id].service_name
+            else:
+                # 如果没有设置客户价格，使用API价格
+                service["api_price"] = service.get("price", 0)
+            items.append(service)
+        result[platform] = items
+    return result
+
+
+async def get_catalog(db: Session) -> Catalog:
+    """获取当前版本的目录"""
+    upstream_hash, platform_services = await _upstream()
+    signature = price_signature(db)
+    key = (upstream_hash, signature)
+    catalog = _payload_cache.get(key)
+    if catalog is None:
+        version = _digest(f"{upstream_hash}:{signature}")[:16]
+        services = _apply_prices(db, platform_services)
+        body = json.dumps({"version": version, "services": services}, ensure_ascii=False,
+                          separators=(",", ":")).encode("utf-8")
+        catalog = Catalog(version=version, body=body, gzipped=gzip.compress(body, 6))
+        _payload_cache.set(key, catalog)
+    return catalog
+
+
+def invalidate() -> None:
+    """丢弃缓存的上游目录（修改API密钥等场景）"""
+    _upstream_cache.clear()
@@ -0,0 +1,310 @@
+"""
+返佣重算任务
+
+返佣比例或邀请关系被修正后，按订单ID顺序分批重新计算应得返佣，与已有返佣记录对比：
+缺失的补写、金额/比例/类型不一致的更新、不应存在的标记为 cancelled，
+并把差额批量累加到代理的返佣统计、余额和经营汇总。每批处理完与检查点一起提交，中断后可从检查点继续。
+已支付（paid）的记录不做修改，只在报告中列出。
+"""
+import json
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, exists, func, insert, select, text, update
+from sqlalchemy.orm import Session
+
+from app.models.commission import CommissionRecord
+from app.models.money import quantize
+from app.models.order import Order
+from app.models.outbox import OutboxEvent
+from app.models.user import User
+from app.services import agent_stats, archive, revenue_rollup, wallet
+from app.services.commission_rules import invalidate_rate_table
+from app.services.commission_service import CommissionService
+
+CHECKPOINT_KEY = "commission_recompute_checkpoint"
+
+# 返佣金额和比例的存储精度
+AMOUNT_PLACES = Decimal("0.0001")
+
+
+@dataclass
+class RecomputeReport:
+    """重算结果"""
+    dry_run: bool
+    start_after: int = 0
+    last_order_id: int = 0
+    orders_scanned: int = 0
+    chunks: int = 0
+    missing: int = 0  # 补写的记录
+    changed: int = 0  # 更新的记录
+    cancelled: int = 0  # 作废的记录
+    paid_conflicts: List[int] = field(default_factory=list)  # 已支付但与应得不一致的记录ID
+    agent_deltas: Dict[int, Decimal] = field(default_factory=dict)  # 每个代理的返佣差额
+    totals_fixed: int = 0  # 返佣统计与记录不一致而被修正的代理数
+    finished: bool = False
+
+    def to_dict(self) -> Dict:
+        return {
+            "dry_run": self.dry_run,
+            "start_after": self.start_after,
+            "last_order_id": self.last_order_id,
+            "orders_scanned": self.orders_scanned,
+            "chunks": self.chunks,
+            "missing": self.missing,
+            "changed": self.changed,
+            "cancelled": self.cancelled,
+            "paid_conflicts": self.paid_conflicts,
+            "total_delta": float(sum(self.agent_deltas.values(), Decimal("0"))),
+            "agent_deltas": {agent_id: float(delta) for agent_id, delta in self.agent_deltas.items() if delta},
+            "totals_fixed": self.totals_fixed,
+            "finished": self.finished
+        }
+
+
+def load_checkpoint(db: Session) -> int:
+    """读取上次处理到的订单ID"""
+    result = db.execute(
+        text("SELECT setting_value FROM settings WHERE setting_key = :key"),
+        {"key": CHECKPOINT_KEY}
+    ).first()
+    if not result or not result[0]:
+        return 0
+    return int(json.loads(result[0]).get("last_order_id", 0))
+
+
+def save_checkpoint(db: Session, last_order_id: Optional[int]) -> None:
+    """保存检查点（随当前事务提交），None 表示清除"""
+    if last_order_id is None:
+        db.execute(text("DELETE FROM settings WHERE setting_key = :key"), {"key": CHECKPOINT_KEY})
+        return
+    db.execute(text("""
+        INSERT OR REPLACE INTO settings (setting_key, setting_value, description, updated_at)
+        VALUES (:key, :value, '返佣重算检查点', CURRENT_TIMESTAMP)
+    """), {"key": CHECKPOINT_KEY, "value": json.dumps({"last_order_id": last_order_id})})
+
+
+def recompute_commissions(
+    db: Session,
+    chunk_size: int = 1000,
+    dry_run: bool = False,
+    restart: bool = False,
+    max_chunks: Optional[int] = None
+) -> RecomputeReport:
+    """按订单ID分批重算返佣
+
+    restart=True 时忽略检查点从头开始；dry_run=True 时只生成报告，不写任何数据。
+    max_chunks 用于限制本次运行的批数，未处理完的部分下次从检查点继续。
+    """
+    # 按最新的返佣配置重算
+    invalidate_rate_table()
+    start_after = 0 if restart or dry_run else load_checkpoint(db)
+    report = RecomputeReport(dry_run=dry_run, start_after=start_after, last_order_id=start_after)
+    service = CommissionService(db)
+
+    # 还在等待发件箱处理的订单交给返佣任务，避免与其并发写入
+    pending_event = exists().where(
+        OutboxEvent.aggregate_id == Order.id,
+        OutboxEvent.status == "pending"
+    )
+
+    while max_chunks is None or report.chunks < max_chunks:
+        orders = db.execute(
+            select(Order.id, Order.user_id, Order.charge).where(
+                Order.id > report.last_order_id,
+                ~pending_event
+            ).order_by(Order.id).limit(chunk_size)
+        ).all()
+        if not orders:
+            report.finished = True
+            break
+
+        touched = _recompute_chunk(db, service, orders, report)
+        report.chunks += 1
+        report.orders_scanned += len(orders)
+        report.last_order_id = orders[-1].id
+
+        if not dry_run:
+            if touched:
+                agent_stats.rebuild(db, touched)
+            save_checkpoint(db, report.last_order_id)
+            db.commit()
+
+    if report.finished:
+        report.totals_fixed = reconcile_totals(db, dry_run)
+        if not dry_run:
+            save_checkpoint(db, None)
+            db.commit()
+
+    return report
+
+
+def _recompute_chunk(db: Session, service: CommissionService, orders: list, report: RecomputeReport) -> List[int]:
+    """对比一批订单的应得返佣与已有记录并写入修正，返回受影响的代理ID"""
+    expected = {
+        (row["order_id"], row["agent_id"]): row
+        for row in service.build_commission_rows(orders)
+    }
+    stored = {
+        (record.order_id, record.agent_id): record
+        for record in db.execute(
+            select(
+                CommissionRecord.id,
+                CommissionRecord.order_id,
+                CommissionRecord.agent_id,
+                CommissionRecord.commission_type,
+                CommissionRecord.commission_rate,
+                CommissionRecord.commission_amount,
+                CommissionRecord.status
+            ).where(CommissionRecord.order_id.in_([order.id for order in orders]))
+        )
+    }
+
+    inserts: List[Dict] = []
+    updates: List[Dict] = []
+    cancels: List[int] = []
+    deltas: Dict[int, Dict[str, Decimal]] = {}
+    rollup_adjustments: List[Tuple[int, int, int, Decimal]] = []  # (订单ID, 代理ID, 订单数变化, 返佣变化)
+
+    def add_delta(agent_id: int, commission_type: str, amount: Decimal) -> None:
+        agent_deltas = deltas.setdefault(agent_id, {"direct": Decimal("0"), "indirect": Decimal("0")})
+        agent_deltas[commission_type] += amount
+
+    for key, row in expected.items():
+        row["commission_amount"] = row["commission_amount"].quantize(AMOUNT_PLACES)
+        record = stored.get(key)
+        if record is None:
+            inserts.append(row)
+            add_delta(row["agent_id"], row["commission_type"], row["commission_amount"])
+            rollup_adjustments.append((row["order_id"], row["agent_id"], 1, row["commission_amount"]))
+        elif _differs(record, row):
+            if record.status == "paid":
+                report.paid_conflicts.append(record.id)
+                continue
+            updates.append({
+                "b_id": record.id,
+                "b_type": row["commission_type"],
+                "b_rate": row["commission_rate"],
+                "b_order_amount": row["order_amount"],
+                "b_amount": row["commission_amount"],
+                "b_description": row["description"]
+            })
+            if record.status != "cancelled":
+                add_delta(record.agent_id, record.commission_type, -_amount(record.commission_amount))
+                rollup_adjustments.append((
+                    record.order_id, record.agent_id, 0, row["commission_amount"] - _amount(record.commission_amount)
+                ))
+            else:
+                rollup_adjustments.append((record.order_id, record.agent_id, 1, row["commission_amount"]))
+            add_delta(row["agent_id"], row["commission_type"], row["commission_amount"])
+
+    for key, record in stored.items():
+        if key in expected or record.status == "cancelled":
+            continue
+        if record.status == "paid":
+            report.paid_conflicts.append(record.id)
+            continue
+        cancels.append(record.id)
+        add_delta(record.agent_id, record.commission_type, -_amount(record.commission_amount))
+        rollup_adjustments.append((record.order_id, record.agent_id, -1, -_amount(record.commission_amount)))
+
+    report.missing += len(inserts)
+    report.changed += len(updates)
+    report.cancelled += len(cancels)
+    for agent_id, agent_deltas in deltas.items():
+        report.agent_deltas[agent_id] = (
+            report.agent_deltas.get(agent_id, Decimal("0")) + agent_deltas["direct"] + agent_deltas["indirect"]
+        )
+
+    if report.dry_run:
+        return list(deltas)
+
+    if inserts:
+        db.execute(insert(CommissionRecord), inserts)
+    if updates:
+        records = CommissionRecord.__table__
+        db.execute(
+            update(records).where(records.c.id == bindparam("b_id")).values(
+                commission_type=bindparam("b_type"),
+                commission_rate=bindparam("b_rate", type_=records.c.commission_rate.type),
+                order_amount=bindparam("b_order_amount", type_=records.c.order_amount.type),
+                commission_amount=bindparam("b_amount", type_=records.c.commission_amount.type),
+                description=bindparam("b_description"),
+                status="pending"
+            ),
+            updates
+        )
+    if cancels:
+        db.query(CommissionRecord).filter(CommissionRecord.id.in_(cancels)).update(
+            {CommissionRecord.status: "cancelled"}, synchronize_session=False
+        )
+    service.credit_agents(deltas, wallet.COMMISSION_ADJUST)
+    revenue_rollup.adjust_commissions(db, rollup_adjustments)
+    return list(deltas)
+
+
+def _amount(value) -> Decimal:
+    return quantize(value, 4)
+
+
+def _differs(record, row: Dict) -> bool:
+    """已有记录与应得返佣是否不一致（作废的记录视为不一致）"""
+    return (
+        record.status == "cancelled"
+        or record.commission_type != row["commission_type"]
+        or _amount(record.commission_rate) != _amount(row["commission_rate"])
+        or _amount(record.commission_amount) != row["commission_amount"]
+    )
+
+
+def reconcile_totals(db: Session, dry_run: bool = False) -> int:
+    """把代理的直接/间接/总返佣统计修正为返佣记录之和（不含已作废），返回修正的代理数
+
+    余额不做修正，余额的变动已在逐批修正时累加。
+    """
+    # 包含已归档的返佣记录
+    records = archive.history(db, CommissionRecord)
+    sums = {
+        (agent_id, commission_type): amount or Decimal("0")
+        for agent_id, commission_type, amount in db.query(
+            records.agent_id,
+            records.commission_type,
+            func.sum(records.commission_amount)
+        ).filter(records.status != "cancelled").group_by(
+            records.agent_id, records.commission_type
+        )
+    }
+    agent_ids = {agent_id for agent_id, _ in sums}
+
+    fixes: List[Dict] = []
+    for agent_id, direct, indirect, total in db.query(
+        User.id, User.total_direct_commission, User.total_indirect_commission, User.total_commission
+    ).filter((User.is_agent == True) | User.id.in_(agent_ids)):
+        expected: Tuple[Decimal, Decimal] = (
+            _amount(sums.get((agent_id, "direct"))),
+            _amount(sums.get((agent_id, "indirect")))
+        )
+        actual = (_amount(direct), _amount(indirect), _amount(total))
+        if actual != (expected[0], expected[1], expected[0] + expected[1]):
+            fixes.append({
+                "b_agent_id": agent_id,
+                "b_direct": expected[0],
+                "b_indirect": expected[1],
+                "b_total": expected[0] + expected[1]
+            })
+
+    if fixes and not dry_run:
+        users = User.__table__
+        money = users.c.total_commission.type
+        db.execute(
+            update(users).where(users.c.id == bindparam("b_agent_id")).values(
+                total_direct_commission=bindparam("b_direct", type_=money),
+                total_indirect_commission=bindparam("b_indirect", type_=money),
+                total_commission=bindparam("b_total", type_=money)
+            ),
+            fixes
+        )
+        agent_stats.rebuild(db, [fix["b_agent_id"] for fix in fixes])
+    return len(fixes)
+
@@ -0,0 +1,142 @@
+"""
+返佣规则引擎
+
+把返佣配置（按代理等级）和代理个人返佣比例编译成不可变的内存费率表，
+计算返佣时按邀请链查费率不再访问数据库。管理员修改配置后调用
+invalidate_rate_table() 使缓存失效。
+"""
+import threading
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.commission import CommissionConfig
+from app.models.user import User
+
+# 未配置时的默认返佣比例和层级
+DEFAULT_DIRECT_RATE = Decimal("0.05")
+DEFAULT_INDIRECT_RATE = Decimal("0.02")
+DEFAULT_MAX_LEVELS = 3
+
+# 费率表最长缓存时间（秒），多进程部署时其他进程靠它兜底刷新
+RATE_TABLE_MAX_AGE = 60.0
+
+
+@dataclass(frozen=True)
+class AgentRates:
+    """单个代理生效的返佣规则"""
+    direct_rate: Decimal
+    indirect_rate: Decimal
+    max_levels: int
+
+
+class RateTable:
+    """不可变的返佣费率表"""
+
+    def __init__(self, agents: Mapping[int, AgentRates], max_levels: int):
+        self._agents = MappingProxyType(dict(agents))
+        self.max_levels = max_levels
+        self.compiled_at = time.monotonic()
+
+    @property
+    def agents(self) -> Mapping[int, AgentRates]:
+        return self._agents
+
+    def lookup(self, agent_id: int, depth: int) -> Optional[Tuple[str, Decimal]]:
+        """查询代理在某个层级（1=直接邀请）上的返佣类型和比例，不返佣时返回None"""
+        rates = self._agents.get(agent_id)
+        if rates is None or depth < 1 or depth > rates.max_levels:
+            return None
+        if depth == 1:
+            return ("direct", rates.direct_rate) if rates.direct_rate > 0 else None
+        return ("indirect", rates.indirect_rate) if rates.indirect_rate > 0 else None
+
+    def rates_for_chain(self, agent_ids: Iterable[int]) -> List[Tuple[int, str, Decimal]]:
+        """按邀请链（由近到远）返回每个应返佣代理的 (代理ID, 返佣类型, 比例)"""
+        result = []
+        for depth, agent_id in enumerate(agent_ids, start=1):
+            rule = self.lookup(agent_id, depth)
+            if rule:
+                result.append((agent_id, rule[0], rule[1]))
+        return result
+
+
+@dataclass(frozen=True)
+class LevelRule:
+    """某个代理等级的返佣配置"""
+    direct_rate: Decimal
+    indirect_rate: Decimal
+    max_levels: int
+
+
+def load_level_rules(db: Session) -> Dict[int, LevelRule]:
+    """读取启用中的返佣配置，按代理等级索引"""
+    return {
+        config.agent_level: LevelRule(
+            direct_rate=Decimal(str(config.direct_rate)),
+            indirect_rate=Decimal(str(config.indirect_rate)),
+            max_levels=config.max_levels or DEFAULT_MAX_LEVELS
+        )
+        for config in db.query(CommissionConfig).filter(CommissionConfig.is_active == True).all()
+    }
+
+
+def load_agent_rows(db: Session) -> list:
+    """读取所有代理的等级和个人返佣比例"""
+    return db.query(
+        User.id, User.agent_level, User.direct_commission_rate, User.indirect_commission_rate
+    ).filter(User.is_agent == True).all()
+
+
+def build_rate_table(agent_rows: Iterable, levels: Mapping[int, LevelRule]) -> RateTable:
+    """由代理行和等级配置构建费率表
+
+    代理个人比例大于0时优先使用，否则使用其代理等级对应的返佣配置，
+    都没有时使用默认比例。
+    """
+    max_levels = max((rule.max_levels for rule in levels.values()), default=DEFAULT_MAX_LEVELS)
+
+    agents: Dict[int, AgentRates] = {}
+    for row in agent_rows:
+        rule = levels.get(row.agent_level)
+        direct_rate = Decimal(str(row.direct_commission_rate or 0))
+        indirect_rate = Decimal(str(row.indirect_commission_rate or 0))
+        agents[row.id] = AgentRates(
+            direct_rate=direct_rate if direct_rate > 0 else (rule.direct_rate if rule else DEFAULT_DIRECT_RATE),
+            indirect_rate=indirect_rate if indirect_rate > 0 else (rule.indirect_rate if rule else DEFAULT_INDIRECT_RATE),
+            max_levels=rule.max_levels if rule else max_levels
+        )
+
+    return RateTable(agents, max_levels)
+
+
+def compile_rate_table(db: Session) -> RateTable:
+    """从数据库编译费率表"""
+    return build_rate_table(load_agent_rows(db), load_level_rules(db))
+
+
+_rate_table: Optional[RateTable] = None
+_lock = threading.Lock()
+
+
+def get_rate_table(db: Session) -> RateTable:
+    """获取缓存的费率表，缺失或过期时重新编译"""
+    global _rate_table
+    table = _rate_table
+    if table is not None and time.monotonic() - table.compiled_at < RATE_TABLE_MAX_AGE:
+        return table
+    with _lock:
+        if _rate_table is None or time.monotonic() - _rate_table.compiled_at >= RATE_TABLE_MAX_AGE:
+            _rate_table = compile_rate_table(db)
+        return _rate_table
+
+
+def invalidate_rate_table() -> None:
+    """使费率表缓存失效（管理员修改返佣配置或代理比例后调用）"""
+    global _rate_table
+    with _lock:
+        _rate_table = None
@@ -1,12 +1,15 @@
 """
 返佣计算服务
 """
-from sqlalchemy.orm import Session
+from sqlalchemy import select, literal, insert, update, bindparam
+from sqlalchemy.orm import Session, aliased
 from app.models.user import User
 from app.models.commission import CommissionRecord
 from app.models.order import Order
+from app.services import invite_graph, agent_stats, commission_settlement, wallet
+from app.services.commission_rules import get_rate_table
 from decimal import Decimal
-from typing import List, Dict
+from typing import List, Dict, Iterable, Optional
 
 class CommissionService:
     """返佣计算服务"""
@@ -14,79 +17,146 @@ class CommissionService:
     def __init__(self, db: Session):
         self.db = db
     
-    async def calculate_commission(self, order: Order) -> List[CommissionRecord]:
-        """计算订单返佣"""
-        consumer = self.db.query(User).filter(User.id == order.user_id).first()
-        if not consumer:
-            return []
+    async def calculate_commission(self, order: Order) -> List[Dict]:
+        """计算订单返佣（写入返佣记录并给代理入账，由调用方提交事务）"""
+        rows = self.build_commission_rows([order])
+        self.apply_commission_rows(rows)
+        return rows
+    
+    def build_commission_rows(self, orders: List[Order]) -> List[Dict]:
+        """批量计算一组订单的返佣记录数据（不写库）"""
+        # 返佣比例来自缓存的费率表，一次递归查询取出所有消费者的邀请链
+        rate_table = get_rate_table(self.db)
+        invite_chains = self._get_invite_chains({order.user_id for order in orders}, rate_table.max_levels)
         
-        commission_records = []
+        rows = []
+        for order in orders:
+            chain_ids = [agent.id for agent in invite_chains.get(order.user_id, [])]
+            
+            # 为每个层级应返佣的代理计算返佣
+            for agent_id, commission_type, commission_rate in rate_table.rates_for_chain(chain_ids):
+                order_amount = order.charge or Decimal("0")
+                commission_amount = order_amount * commission_rate
+                
+                rows.append({
+                    "agent_id": agent_id,
+                    "consumer_id": order.user_id,
+                    "order_id": order.id,
+                    "commission_type": commission_type,
+                    "commission_rate": commission_rate,
+                    "order_amount": order_amount,
+                    "commission_amount": commission_amount,
+                    "status": "pending",
+                    "description": f"订单 {order.id} 的{commission_type}返佣"
+                })
         
-        # 获取邀请链
-        invite_chain = self._get_invite_chain(consumer)
+        return rows
+    
+    def apply_commission_rows(self, rows: List[Dict]) -> None:
+        """批量写入返佣记录，并按代理汇总后一次性累加返佣统计和余额"""
+        if not rows:
+            return
         
-        # 为每个层级的代理计算返佣
-        for level, agent in enumerate(invite_chain):
-            if not agent.is_agent:
-                continue
-            
-            # 确定返佣类型和比例
-            if level == 0:
-                commission_type = "direct"
-                commission_rate = Decimal("0.05")  # 直接邀请返佣 5%
-            else:
-                commission_type = "indirect"
-                commission_rate = Decimal("0.02")  # 间接邀请返佣 2%
-            
-            # 计算返佣金额
-            commission_amount = Decimal(str(order.charge)) * commission_rate
-            
-            # 创建返佣记录
-            commission_record = CommissionRecord(
-                agent_id=agent.id,
-                consumer_id=consumer.id,
-                order_id=order.id,
-                commission_type=commission_type,
-                commission_rate=commission_rate,
-                order_amount=order.charge,
-                commission_amount=commission_amount,
-                status="pending",
-                description=f"订单 {order.id} 的{commission_type}返佣"
-            )
-            
-            self.db.add(commission_record)
-            commission_records.append(commission_record)
-            
-            # 更新代理的返佣统计
-            if commission_type == "direct":
-                agent.total_direct_commission += commission_amount
-            else:
-                agent.total_indirect_commission += commission_amount
-            
-            agent.total_commission += commission_amount
-            
-            # 将返佣金额添加到代理余额
-            agent.balance += commission_amount
+        self.db.execute(insert(CommissionRecord), rows)
+        
+        # 按代理汇总直接/间接返佣
+        totals: Dict[int, Dict[str, Decimal]] = {}
+        for row in rows:
+            agent_totals = totals.setdefault(row["agent_id"], {"direct": Decimal("0"), "indirect": Decimal("0")})
+            agent_totals[row["commission_type"]] += row["commission_amount"]
         
-        self.db.commit()
-        return commission_records
+        self.credit_agents(totals)
+        for agent_id, agent_totals in totals.items():
+            agent_stats.on_commission(self.db, agent_id, agent_totals["direct"] + agent_totals["indirect"])
     
-    def _get_invite_chain(self, user: User, max_levels: int = 3) -> List[User]:
-        """获取邀请链"""
-        chain = []
-        current_user = user
-        level = 0
-        
-        while current_user.inviter_id and level < max_levels:
-            inviter = self.db.query(User).filter(User.id == current_user.inviter_id).first()
-            if not inviter:
-                break
-            
-            chain.append(inviter)
-            current_user = inviter
-            level += 1
+    def credit_agents(self, totals: Dict[int, Dict[str, Decimal]], entry_type: str = wallet.COMMISSION) -> None:
+        """按代理一次性累加返佣统计并写入钱包流水，totals 为 {代理ID: {"direct": 金额, "indirect": 金额}}（可为负数）"""
+        if not totals:
+            return
         
-        return chain
+        users = User.__table__
+        money = users.c.total_commission.type
+        self.db.execute(
+            update(users).where(users.c.id == bindparam("b_agent_id")).values(
+                total_direct_commission=users.c.total_direct_commission + bindparam("b_direct", type_=money),
+                total_indirect_commission=users.c.total_indirect_commission + bindparam("b_indirect", type_=money),
+                total_commission=users.c.total_commission + bindparam("b_total", type_=money)
+            ),
+            [
+                {
+                    "b_agent_id": agent_id,
+                    "b_direct": agent_totals["direct"],
+                    "b_indirect": agent_totals["indirect"],
+                    "b_total": agent_totals["direct"] + agent_totals["indirect"]
+                }
+                for agent_id, agent_totals in totals.items()
+            ]
+        )
+        
+        # 余额只追加钱包流水，再按流水刷新代理的余额缓存
+        wallet.post_many(self.db, [
+            {
+                "user_id": agent_id,
+                "amount": agent_totals["direct"] + agent_totals["indirect"],
+                "entry_type": entry_type,
+                "description": "代理返佣入账" if entry_type == wallet.COMMISSION else "返佣重算调整"
+            }
+            for agent_id, agent_totals in totals.items()
+            if agent_totals["direct"] + agent_totals["indirect"] != 0
+        ])
+        wallet.sync_balances(self.db, totals.keys())
+    
+    def _get_invite_chain(self, user_id: int, max_levels: Optional[int] = None) -> list:
+        """获取邀请链，按层级由近到远排序"""
+        return self._get_invite_chains([user_id], max_levels).get(user_id, [])
+    
+    def _get_invite_chains(self, user_ids: Iterable[int], max_levels: Optional[int] = None) -> Dict[int, list]:
+        """批量获取邀请链
+        
+        使用递归CTE一次查出所有消费者的上级，按层级由近到远排序。
+        未指定 max_levels 时使用费率表中的最大返佣层级。
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        
+        if max_levels is None:
+            max_levels = get_rate_table(self.db).max_levels
+        
+        consumer = aliased(User)
+        chain = select(
+            consumer.id.label("consumer_id"),
+            User.id,
+            User.inviter_id,
+            User.is_agent,
+            literal(1).label("depth")
+        ).join(consumer, consumer.inviter_id == User.id).where(
+            consumer.id.in_(user_ids)
+        ).cte("invite_chain", recursive=True)
+        
+        inviter = aliased(User)
+        chain = chain.union_all(
+            select(
+                chain.c.consumer_id,
+                inviter.id,
+                inviter.inviter_id,
+                inviter.is_agent,
+                chain.c.depth + 1
+            ).join(chain, inviter.id == chain.c.inviter_id).where(chain.c.depth < max_levels)
+        )
+        
+        rows = self.db.execute(
+            select(
+                chain.c.consumer_id,
+                chain.c.id,
+                chain.c.is_agent
+            ).where(chain.c.depth <= max_levels).order_by(chain.c.consumer_id, chain.c.depth)
+        ).all()
+        
+        chains: Dict[int, list] = {}
+        for row in rows:
+            chains.setdefault(row.consumer_id, []).append(row)
+        return chains
     
     def get_agent_stats(self, agent_id: int) -> Dict:
         """获取代理统计信息"""
@@ -94,15 +164,10 @@ class CommissionService:
         if not agent:
             return {}
         
-        # 获取直接邀请的用户数量
-        direct_invitees = self.db.query(User).filter(User.inviter_id == agent_id).count()
-        
-        # 获取间接邀请的用户数量（通过邀请链）
-        indirect_invitees = 0
-        direct_users = self.db.query(User).filter(User.inviter_id == agent_id).all()
-        for user in direct_users:
-            indirect_count = self.db.query(User).filter(User.inviter_id == user.id).count()
-            indirect_invitees += indirect_count
+        # 按层级统计下级数量（闭包表单条查询）
+        depth_counts = invite_graph.get_descendant_counts(self.db, agent_id, max_depth=2)
+        direct_invitees = depth_counts.get(1, 0)
+        indirect_invitees = depth_counts.get(2, 0)
         
         # 获取返佣记录统计
         total_commission_records = self.db.query(CommissionRecord).filter(
@@ -134,49 +199,20 @@ class CommissionService:
     
     def get_invite_tree(self, root_agent_id: int, max_depth: int = 3) -> Dict:
         """获取邀请树结构"""
-        def build_tree(user_id: int, depth: int = 0) -> Dict:
-            if depth >= max_depth:
-                return None
-            
-            user = self.db.query(User).filter(User.id == user_id).first()
-            if not user:
-                return None
-            
-            # 获取直接邀请的用户
-            invitees = self.db.query(User).filter(User.inviter_id == user_id).all()
-            
-            children = []
-            for invitee in invitees:
-                child_tree = build_tree(invitee.id, depth + 1)
-                if child_tree:
-                    children.append(child_tree)
-            
-            return {
-                "user": user,
-                "depth": depth,
-                "children": children,
-                "children_count": len(children)
-            }
-        
-        return build_tree(root_agent_id)
+        if max_depth <= 0:
+            return None
+        rows = invite_graph.get_subtree(self.db, root_agent_id, max_depth=max_depth - 1)
+        return invite_graph.build_tree(rows, root_agent_id)
     
     def pay_commission(self, commission_record_id: int) -> bool:
-        """支付返佣"""
-        commission_record = self.db.query(CommissionRecord).filter(
-            CommissionRecord.id == commission_record_id
-        ).first()
-        
-        if not commission_record or commission_record.status != "pending":
-            return False
-        
+        """支付返佣（单条记录也生成结算批次）"""
         try:
-            # 更新返佣记录状态
-            commission_record.status = "paid"
-            commission_record.paid_at = func.now()
-            
+            commission_settlement.settle(self.db, record_ids=[commission_record_id])
             self.db.commit()
             return True
             
+        except ValueError:
+            return False
         except Exception:
             self.db.rollback()
             return False
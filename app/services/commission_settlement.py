@@ -0,0 +1,119 @@
+"""
+返佣批量结算
+
+按代理、时间范围、返佣类型筛选待结算（pending）的返佣，一条 UPDATE 全部标记为已支付，
+并生成结算批次记录，可按批次审计和撤销。已有返佣被归档的批次不能撤销。
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import exists, func, select, update
+from sqlalchemy.orm import Session
+
+from app.models.commission import CommissionRecord, CommissionSettlement
+from app.services import archive
+
+
+def settle(
+    db: Session,
+    agent_id: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    commission_type: Optional[str] = None,
+    record_ids: Optional[List[int]] = None,
+    operator_id: Optional[int] = None,
+    note: Optional[str] = None
+) -> CommissionSettlement:
+    """结算符合条件的待结算返佣，返回结算批次（由调用方提交事务）
+
+    没有可结算的记录时抛出 ValueError。
+    """
+    batch = CommissionSettlement(
+        agent_id=agent_id,
+        start_date=start_date,
+        end_date=end_date,
+        commission_type=commission_type,
+        operator_id=operator_id,
+        note=note
+    )
+    db.add(batch)
+    db.flush()
+
+    conditions = [CommissionRecord.status == "pending"]
+    if agent_id:
+        conditions.append(CommissionRecord.agent_id == agent_id)
+    if start_date:
+        conditions.append(CommissionRecord.created_at >= start_date)
+    if end_date:
+        conditions.append(CommissionRecord.created_at < end_date)
+    if commission_type:
+        conditions.append(CommissionRecord.commission_type == commission_type)
+    if record_ids is not None:
+        conditions.append(CommissionRecord.id.in_(record_ids))
+
+    result = db.execute(
+        update(CommissionRecord).where(*conditions).values(
+            status="paid",
+            paid_at=func.now(),
+            settlement_batch_id=batch.id
+        ).execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.delete(batch)
+        db.flush()
+        raise ValueError("没有待结算的返佣")
+
+    count, total = db.query(
+        func.count(CommissionRecord.id),
+        func.coalesce(func.sum(CommissionRecord.commission_amount), 0)
+    ).filter(CommissionRecord.settlement_batch_id == batch.id).one()
+    batch.record_count = count
+    batch.total_amount = total
+    return batch
+
+
+def reverse(db: Session, batch_id: int) -> CommissionSettlement:
+    """撤销结算批次，批次内的返佣恢复为待结算（由调用方提交事务）"""
+    batch = db.query(CommissionSettlement).filter(CommissionSettlement.id == batch_id).first()
+    if batch is None:
+        raise ValueError("结算批次不存在")
+    if batch.status != "settled":
+        raise ValueError("结算批次已撤销")
+    if _has_archived_records(db, batch.id):
+        # 归档库只保存已结算的数据，撤销只能改热库中的记录，会造成批次部分撤销
+        raise ValueError("结算批次中有返佣已归档，不能撤销")
+
+    db.execute(
+        update(CommissionRecord).where(
+            CommissionRecord.settlement_batch_id == batch.id,
+            CommissionRecord.status == "paid"
+        ).values(
+            status="pending",
+            paid_at=None,
+            settlement_batch_id=None
+        ).execution_options(synchronize_session=False)
+    )
+    batch.status = "reversed"
+    batch.reversed_at = func.now()
+    return batch
+
+
+def _has_archived_records(db: Session, batch_id: int) -> bool:
+    """结算批次中是否有已移入归档库的返佣"""
+    if archive.get_watermark(db) is None:
+        return False
+    cold = archive.archive_table(CommissionRecord.__table__)
+    return db.execute(select(exists().where(cold.c.settlement_batch_id == batch_id))).scalar()
+
+
+def get_batch_summary(db: Session, batch_id: int) -> List[Dict]:
+    """按代理汇总结算批次内的返佣"""
+    rows = db.query(
+        CommissionRecord.agent_id,
+        func.count(CommissionRecord.id),
+        func.sum(CommissionRecord.commission_amount)
+    ).filter(CommissionRecord.settlement_batch_id == batch_id).group_by(CommissionRecord.agent_id).all()
+    return [
+        {"agent_id": agent_id, "record_count": count, "total_amount": float(total or 0)}
+        for agent_id, count, total in rows
+    ]
@@ -0,0 +1,197 @@
+"""
+返佣比例模拟（what-if）
+
+把历史订单和邀请关系加载成 NumPy 数组，在给定费率表下一次向量化计算
+每个代理应得的返佣，用于在修改返佣配置前评估影响。只读，不写返佣记录。
+统计区间触及已归档的数据时合并归档库中的订单。
+"""
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.database import ReadSessionLocal
+from app.models.order import Order
+from app.models.user import User
+from app.services import archive
+from app.services.commission_rules import (
+    LevelRule, RateTable, build_rate_table, load_agent_rows, load_level_rules
+)
+
+
+@dataclass
+class SimulationData:
+    """模拟所需的数组数据
+
+    用户按ID排序后以下标表示，下标 n 为哨兵节点（没有上级时指向它）。
+    """
+    user_ids: np.ndarray  # 排序后的用户ID，长度 n
+    parent: np.ndarray  # 每个用户上级的下标，长度 n+1
+    spend: np.ndarray  # 每个用户在统计区间内的消费总额，长度 n+1
+    order_count: int
+
+
+def load_simulation_data(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None) -> SimulationData:
+    """加载邀请关系和历史订单（按消费者汇总）"""
+    users = db.execute(select(User.id, User.inviter_id).order_by(User.id)).all()
+    n = len(users)
+    user_ids = np.fromiter((row[0] for row in users), dtype=np.int64, count=n)
+    inviter_ids = np.fromiter((row[1] or 0 for row in users), dtype=np.int64, count=n)
+
+    # 上级ID转换为下标，不存在的上级指向哨兵
+    parent = np.full(n + 1, n, dtype=np.int64)
+    if n:
+        pos = np.minimum(np.searchsorted(user_ids, inviter_ids), n - 1)
+        valid = (inviter_ids > 0) & (user_ids[pos] == inviter_ids)
+        parent[:n] = np.where(valid, pos, n)
+
+    # 返佣与订单金额成线性关系，按消费者汇总后再传播即可
+    orders = archive.history_table(db, Order.__table__, start)
+    query = select(orders.c.user_id, func.sum(orders.c.charge), func.count(orders.c.id)).group_by(orders.c.user_id)
+    if start:
+        query = query.where(orders.c.created_at >= start)
+    if end:
+        query = query.where(orders.c.created_at < end)
+    totals = db.execute(query).all()
+
+    spend = np.zeros(n + 1, dtype=np.float64)
+    order_count = 0
+    if totals and n:
+        consumer_ids = np.fromiter((row[0] for row in totals), dtype=np.int64, count=len(totals))
+        amounts = np.fromiter((float(row[1] or 0) for row in totals), dtype=np.float64, count=len(totals))
+        order_count = int(sum(row[2] for row in totals))
+        pos = np.minimum(np.searchsorted(user_ids, consumer_ids), n - 1)
+        valid = user_ids[pos] == consumer_ids
+        np.add.at(spend, pos[valid], amounts[valid])
+
+    return SimulationData(user_ids=user_ids, parent=parent, spend=spend, order_count=order_count)
+
+
+def _rate_arrays(data: SimulationData, table: RateTable):
+    """把费率表展开成按用户下标索引的数组"""
+    n = len(data.user_ids)
+    direct = np.zeros(n + 1, dtype=np.float64)
+    indirect = np.zeros(n + 1, dtype=np.float64)
+    max_levels = np.zeros(n + 1, dtype=np.int64)
+    if n and table.agents:
+        agent_ids = np.fromiter(table.agents.keys(), dtype=np.int64, count=len(table.agents))
+        rates = list(table.agents.values())
+        pos = np.minimum(np.searchsorted(data.user_ids, agent_ids), n - 1)
+        valid = data.user_ids[pos] == agent_ids
+        direct[pos[valid]] = np.array([float(r.direct_rate) for r in rates])[valid]
+        indirect[pos[valid]] = np.array([float(r.indirect_rate) for r in rates])[valid]
+        max_levels[pos[valid]] = np.array([r.max_levels for r in rates], dtype=np.int64)[valid]
+    return direct, indirect, max_levels
+
+
+def simulate(data: SimulationData, table: RateTable) -> np.ndarray:
+    """计算每个用户在费率表下应得的返佣总额（按用户下标）"""
+    n = len(data.user_ids)
+    direct, indirect, max_levels = _rate_arrays(data, table)
+    payout = np.zeros(n + 1, dtype=np.float64)
+
+    node = np.nonzero(data.spend[:n])[0]
+    amount = data.spend[node]
+    for depth in range(1, table.max_levels + 1):
+        # 沿邀请链上移一层，到达哨兵的分支不再继续
+        node = data.parent[node]
+        alive = node != n
+        if not alive.any():
+            break
+        node = node[alive]
+        amount = amount[alive]
+        rate = (direct if depth == 1 else indirect)[node] * (max_levels[node] >= depth)
+        payout += np.bincount(node, weights=amount * rate, minlength=n + 1)
+
+    return payout[:n]
+
+
+def run_simulation(
+    db: Session,
+    levels: Optional[Dict[int, LevelRule]] = None,
+    agent_overrides: Optional[Dict[int, Dict]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    top: int = 100
+) -> Dict:
+    """对比当前配置与拟修改配置下的返佣差异
+
+    levels 为拟修改的代理等级配置（未给出的等级沿用当前配置），
+    agent_overrides 为拟修改的代理个人比例 {代理ID: {"direct_rate":..., "indirect_rate":...}}。
+    """
+    started = time.perf_counter()
+
+    agent_rows = load_agent_rows(db)
+    current_levels = load_level_rules(db)
+    proposed_levels = dict(current_levels)
+    proposed_levels.update(levels or {})
+
+    proposed_rows = agent_rows
+    if agent_overrides:
+        proposed_rows = [
+            _override_row(row, agent_overrides[row.id]) if row.id in agent_overrides else row
+            for row in agent_rows
+        ]
+
+    data = load_simulation_data(db, start, end)
+    current = simulate(data, build_rate_table(agent_rows, current_levels))
+    proposed = simulate(data, build_rate_table(proposed_rows, proposed_levels))
+    delta = proposed - current
+
+    changed = np.nonzero(np.abs(delta) > 1e-9)[0]
+    changed = changed[np.argsort(-np.abs(delta[changed]))][:top]
+
+    return {
+        "order_count": data.order_count,
+        "total_current": round(float(current.sum()), 4),
+        "total_proposed": round(float(proposed.sum()), 4),
+        "total_delta": round(float(delta.sum()), 4),
+        "changed_agents": int(np.count_nonzero(np.abs(delta) > 1e-9)),
+        "agents": [
+            {
+                "agent_id": int(data.user_ids[i]),
+                "current": round(float(current[i]), 4),
+                "proposed": round(float(proposed[i]), 4),
+                "delta": round(float(delta[i]), 4)
+            }
+            for i in changed
+        ],
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
+
+def run_simulation_in_thread(
+    levels: Optional[Dict[int, LevelRule]] = None,
+    agent_overrides: Optional[Dict[int, Dict]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    top: int = 100
+) -> Dict:
+    """在独立的只读会话中执行 run_simulation（供线程池调用，会话不跨线程共享）"""
+    db = ReadSessionLocal()
+    try:
+        return run_simulation(db, levels, agent_overrides, start, end, top)
+    finally:
+        db.close()
+
+
+@dataclass(frozen=True)
+class _AgentRow:
+    id: int
+    agent_level: int
+    direct_commission_rate: object
+    indirect_commission_rate: object
+
+
+def _override_row(row, override: Dict) -> _AgentRow:
+    """用拟修改的个人比例替换代理行"""
+    return _AgentRow(
+        id=row.id,
+        agent_level=row.agent_level,
+        direct_commission_rate=override.get("direct_rate", row.direct_commission_rate),
+        indirect_commission_rate=override.get("indirect_rate", row.indirect_commission_rate)
+    )
@@ -0,0 +1,145 @@
+"""
+返佣异步计算（发件箱消费者）
+
+下单时只在同一事务里写入 order_created 事件，返佣由后台任务批量计算：
+批量插入返佣记录、按代理汇总后一次性累加统计，并累加经营汇总。以订单ID保证重试幂等。
+"""
+import asyncio
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.commission import CommissionRecord
+from app.models.order import Order
+from app.models.outbox import OutboxEvent
+from app.services.commission_service import CommissionService
+from app.services import revenue_rollup
+
+ORDER_CREATED = "order_created"
+
+# 单个事件最多重试次数，超过后标记为 failed 等待人工处理
+MAX_ATTEMPTS = 5
+
+
+def publish_order_created(db: Session, order: Order) -> None:
+    """写入订单创建事件（随调用方事务一起提交）"""
+    db.add(OutboxEvent(event_type=ORDER_CREATED, aggregate_id=order.id))
+
+
+def process_batch(db: Session, batch_size: Optional[int] = None) -> int:
+    """处理一批待计算返佣的订单事件，返回本批事件数"""
+    events = db.query(OutboxEvent).filter(
+        OutboxEvent.event_type == ORDER_CREATED,
+        OutboxEvent.status == "pending"
+    ).order_by(OutboxEvent.id).limit(batch_size or settings.commission_batch_size).all()
+    if not events:
+        return 0
+
+    event_ids = [event.id for event in events]
+    try:
+        _process_events(db, events)
+        db.commit()
+    except Exception:
+        db.rollback()
+        # 整批失败时逐条处理，隔离出问题的事件
+        for event_id in event_ids:
+            _process_single(db, event_id)
+    return len(event_ids)
+
+
+def _process_single(db: Session, event_id: int) -> None:
+    """单独处理一个事件，失败时记录错误并累加重试次数"""
+    event = db.get(OutboxEvent, event_id)
+    if event is None or event.status != "pending":
+        return
+    try:
+        _process_events(db, [event])
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        event = db.get(OutboxEvent, event_id)
+        event.attempts = (event.attempts or 0) + 1
+        event.last_error = str(e)[:1000]
+        if event.attempts >= MAX_ATTEMPTS:
+            event.status = "failed"
+        db.commit()
+        print(f"返佣计算失败 (订单 {event.aggregate_id}): {e}")
+
+
+def _process_events(db: Session, events: List[OutboxEvent]) -> None:
+    """计算并写入一批订单的返佣，同时把事件标记为完成"""
+    order_ids = [event.aggregate_id for event in events]
+
+    # 已有返佣记录的订单说明之前处理过，跳过以保证幂等
+    settled = {
+        order_id for (order_id,) in db.query(CommissionRecord.order_id).filter(
+            CommissionRecord.order_id.in_(order_ids)
+        ).distinct()
+    }
+    orders = [
+        order for order in db.query(Order).filter(Order.id.in_(order_ids)).all()
+        if order.id not in settled
+    ]
+
+    service = CommissionService(db)
+    service.apply_commission_rows(service.build_commission_rows(orders))
+
+    # 返佣写入后把订单计入经营汇总（已汇总的订单会被跳过）
+    revenue_rollup.record_orders(db, order_ids)
+
+    db.query(OutboxEvent).filter(OutboxEvent.id.in_([event.id for event in events])).update({
+        OutboxEvent.status: "done",
+        OutboxEvent.attempts: OutboxEvent.attempts + 1,
+        OutboxEvent.processed_at: func.now()
+    }, synchronize_session=False)
+
+
+class CommissionWorker:
+    """后台返佣计算任务"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    def run_once(self) -> int:
+        """处理一批事件（在线程池中执行，不阻塞事件循环）"""
+        db = SessionLocal()
+        try:
+            return process_batch(db)
+        finally:
+            db.close()
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                processed = await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                print(f"返佣任务异常: {e}")
+                processed = 0
+
+            # 本批未满说明已追上，等待下一轮
+            if processed < settings.commission_batch_size:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=settings.commission_worker_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def start(self) -> None:
+        """启动后台任务"""
+        if self._task is None or self._task.done():
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台任务"""
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+
+
+# 全局任务实例
+commission_worker = CommissionWorker()
@@ -6,11 +6,14 @@
 
 from __future__ import annotations
 
+import asyncio
 import hashlib
 import html
 from typing import Dict, Any, Optional
 
-import requests
+import httpx
+
+from app.config import settings
 
 
 class FutoonPayConfig:
@@ -28,17 +31,55 @@ class FutoonPayConfig:
         self.api_url = api_url
         self.query_url = query_url
 
+    @classmethod
+    def from_settings(cls) -> "FutoonPayConfig":
+        """从应用设置（环境变量 FUTOON_PID / FUTOON_KEY 等）读取"""
+        return cls(
+            pid=settings.futoon_pid,
+            key=settings.futoon_key,
+            api_url=settings.futoon_api_url,
+            query_url=settings.futoon_query_url,
+        )
+
+
+def build_http_client() -> httpx.AsyncClient:
+    """创建带连接池和长连接的 HTTP 客户端，整个进程共用一个"""
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(settings.futoon_timeout, connect=settings.futoon_connect_timeout),
+        limits=httpx.Limits(
+            max_connections=settings.futoon_max_connections,
+            max_keepalive_connections=settings.futoon_max_keepalive,
+            keepalive_expiry=settings.futoon_keepalive_expiry,
+        ),
+    )
+
 
 class FutoonPay:
-    """富通支付客户端"""
+    """富通支付客户端（异步，复用共享连接池）"""
 
     PAYMENT_TYPES = {
         "wechat": "wxpay",
         "alipay": "alipay",
     }
 
-    def __init__(self, config: FutoonPayConfig) -> None:
+    def __init__(self, config: FutoonPayConfig, http: Optional[httpx.AsyncClient] = None) -> None:
         self.config = config
+        self.http = http or build_http_client()
+
+    async def aclose(self) -> None:
+        """关闭连接池"""
+        await self.http.aclose()
+
+    async def _request_json(self, method: str, url: str, timeout: Optional[float], **kwargs) -> Any:
+        """发送请求并解析 JSON；timeout 是整个调用（含排队等连接）的截止时间"""
+        deadline = timeout if timeout is not None else settings.futoon_timeout
+
+        async def call() -> Any:
+            resp = await self.http.request(method, url, timeout=deadline, **kwargs)
+            resp.raise_for_status()
+            return resp.json()
+
+        return await asyncio.wait_for(call(), deadline)
 
     # -------- 核心：签名逻辑（与用户提供版本保持一致） --------
     def generate_sign(self, params: Dict[str, Any]) -> str:
@@ -67,7 +108,7 @@ class FutoonPay:
         return hashlib.md5(sign_string.encode("utf-8")).hexdigest()
 
     # -------- 下单 --------
-    def create_order(
+    async def create_order(
         self,
         *,
         out_trade_no: str,
@@ -79,7 +120,7 @@ class FutoonPay:
         client_ip: str,
         param: Optional[str] = None,
         device: str = "pc",
-        timeout: int = 10,
+        timeout: Optional[float] = None,
     ) -> Dict[str, Any]:
         if payment_type not in self.PAYMENT_TYPES:
             return {"success": False, "message": f"不支持的支付方式: {payment_type}"}
@@ -102,9 +143,9 @@ class FutoonPay:
         params["sign_type"] = "MD5"
 
         try:
-            resp = requests.post(self.config.api_url, data=params, timeout=timeout)
-            resp.raise_for_status()
-            data = resp.json()
+            data = await self._request_json("POST", self.config.api_url, timeout, data=params)
+        except asyncio.TimeoutError:
+            return {"success": False, "message": "网络请求失败: 请求超时"}
         except Exception as exc:  # 网络或解析异常
             return {"success": False, "message": f"网络请求失败: {exc}"}
 
@@ -128,7 +169,7 @@ class FutoonPay:
         return str(remote_sign) == str(local_sign)
 
     # -------- 查询订单 --------
-    def query_order(self, out_trade_no: str, timeout: int = 10) -> Dict[str, Any]:
+    async def query_order(self, out_trade_no: str, timeout: Optional[float] = None) -> Dict[str, Any]:
         params = {
             "act": "order",
             "pid": self.config.pid,
@@ -136,9 +177,9 @@ class FutoonPay:
             "out_trade_no": out_trade_no,
         }
         try:
-            resp = requests.get(self.config.query_url, params=params, timeout=timeout)
-            resp.raise_for_status()
-            data = resp.json()
+            data = await self._request_json("GET", self.config.query_url, timeout, params=params)
+        except asyncio.TimeoutError:
+            return {"success": False, "message": "网络请求失败: 请求超时"}
         except Exception as exc:
             return {"success": False, "message": f"网络请求失败: {exc}"}
 
@@ -147,3 +188,21 @@ class FutoonPay:
         return {"success": False, "message": data.get("msg", "查询失败")}
 
 
+# 进程共享的客户端，启动时创建，关闭时释放连接池
+_client: Optional[FutoonPay] = None
+
+
+def get_futoon_client() -> FutoonPay:
+    """获取共享客户端（未启动时按当前设置创建）"""
+    global _client
+    if _client is None:
+        _client = FutoonPay(FutoonPayConfig.from_settings())
+    return _client
+
+
+async def close_futoon_client() -> None:
+    """关闭共享客户端"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
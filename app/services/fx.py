@@ -0,0 +1,68 @@
+"""
+汇率服务
+
+上游 API 价格以美元计价，客户价格以人民币计价。汇率存放在 fx_rates 表，
+按生效时间取最近一条，历史订单按下单时的汇率换算成本。
+"""
+from bisect import bisect_right
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.revenue_rollup import FxRate
+
+# 汇率表为空时使用的默认汇率：1美元 = 7.3人民币
+DEFAULT_USD_CNY = Decimal("7.3")
+
+RateHistory = List[Tuple[datetime, Decimal]]
+
+
+def load_history(db: Session, base: str = "USD", quote: str = "CNY") -> RateHistory:
+    """读取某货币对的全部汇率，按生效时间升序"""
+    rows = db.query(FxRate.effective_at, FxRate.rate).filter(
+        FxRate.base_currency == base,
+        FxRate.quote_currency == quote
+    ).order_by(FxRate.effective_at, FxRate.id).all()
+    return [(effective_at, Decimal(rate)) for effective_at, rate in rows]
+
+
+def rate_at(history: RateHistory, at: Optional[datetime] = None) -> Decimal:
+    """取某一时刻生效的汇率，早于第一条记录时使用最早的汇率"""
+    if not history:
+        return DEFAULT_USD_CNY
+    if at is None:
+        return history[-1][1]
+    index = bisect_right([effective_at for effective_at, _ in history], at)
+    return history[max(index - 1, 0)][1]
+
+
+def get_rate(db: Session, at: Optional[datetime] = None, base: str = "USD", quote: str = "CNY") -> Decimal:
+    """读取某一时刻（默认当前）生效的汇率"""
+    query = db.query(FxRate.rate).filter(
+        FxRate.base_currency == base,
+        FxRate.quote_currency == quote
+    )
+    if at is not None:
+        query = query.filter(FxRate.effective_at <= at)
+    rate = query.order_by(FxRate.effective_at.desc(), FxRate.id.desc()).limit(1).scalar()
+    if rate is None and at is not None:
+        return rate_at(load_history(db, base, quote), at)
+    return Decimal(rate) if rate is not None else DEFAULT_USD_CNY
+
+
+def set_rate(db: Session, rate: Decimal, effective_at: Optional[datetime] = None,
+             base: str = "USD", quote: str = "CNY") -> FxRate:
+    """新增一条汇率（由调用方提交事务）"""
+    if rate <= 0:
+        raise ValueError("汇率必须大于0")
+    record = FxRate(
+        base_currency=base,
+        quote_currency=quote,
+        rate=rate,
+        effective_at=effective_at or datetime.utcnow()
+    )
+    db.add(record)
+    db.flush()
+    return record
@@ -0,0 +1,154 @@
+"""
+邀请关系图服务（基于闭包表）
+"""
+from sqlalchemy import select, func, literal, delete, insert, and_, true
+from sqlalchemy.orm import Session, aliased
+from app.models.user import User
+from app.models.invite_closure import InviteClosure
+from typing import Dict, List, Optional, Tuple
+
+# 重建闭包表时的最大层级（防止脏数据中的环导致无限递归）
+MAX_REBUILD_DEPTH = 64
+
+
+def add_user(db: Session, user_id: int, inviter_id: Optional[int] = None) -> None:
+    """新用户加入邀请图：写入自身及所有上级的闭包行"""
+    db.execute(insert(InviteClosure).values(ancestor_id=user_id, descendant_id=user_id, depth=0))
+    if inviter_id:
+        db.execute(insert(InviteClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(
+                InviteClosure.ancestor_id,
+                literal(user_id),
+                InviteClosure.depth + 1
+            ).where(InviteClosure.descendant_id == inviter_id)
+        ))
+
+
+def move_subtree(db: Session, user_id: int, new_inviter_id: Optional[int]) -> None:
+    """修改用户的邀请人，整棵子树随之移动"""
+    if new_inviter_id:
+        if new_inviter_id == user_id or is_descendant(db, new_inviter_id, user_id):
+            raise ValueError("不能把用户挂到自己或自己的下级名下")
+
+    subtree = select(InviteClosure.descendant_id).where(InviteClosure.ancestor_id == user_id)
+    old_ancestors = select(InviteClosure.ancestor_id).where(
+        InviteClosure.descendant_id == user_id,
+        InviteClosure.depth > 0
+    )
+
+    # 断开子树与原上级的所有关系
+    db.execute(delete(InviteClosure).where(
+        InviteClosure.descendant_id.in_(subtree),
+        InviteClosure.ancestor_id.in_(old_ancestors)
+    ))
+
+    # 新上级链 × 子树
+    if new_inviter_id:
+        upper = aliased(InviteClosure)
+        lower = aliased(InviteClosure)
+        db.execute(insert(InviteClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(
+                upper.ancestor_id,
+                lower.descendant_id,
+                upper.depth + lower.depth + 1
+            ).select_from(upper).join(lower, true()).where(
+                upper.descendant_id == new_inviter_id,
+                lower.ancestor_id == user_id
+            )
+        ))
+
+    db.query(User).filter(User.id == user_id).update(
+        {User.inviter_id: new_inviter_id}, synchronize_session=False
+    )
+
+
+def is_descendant(db: Session, user_id: int, ancestor_id: int) -> bool:
+    """判断 user_id 是否在 ancestor_id 的子树中"""
+    return db.query(InviteClosure).filter(
+        InviteClosure.ancestor_id == ancestor_id,
+        InviteClosure.descendant_id == user_id
+    ).first() is not None
+
+
+def get_subtree(db: Session, root_id: int, max_depth: Optional[int] = None) -> List[Tuple[User, int]]:
+    """获取子树中的所有用户及其相对层级（含根节点）"""
+    query = db.query(User, InviteClosure.depth).join(
+        InviteClosure, InviteClosure.descendant_id == User.id
+    ).filter(InviteClosure.ancestor_id == root_id)
+    if max_depth is not None:
+        query = query.filter(InviteClosure.depth <= max_depth)
+    return query.order_by(InviteClosure.depth, User.id).all()
+
+
+def get_descendant_counts(db: Session, root_id: int, max_depth: Optional[int] = None) -> Dict[int, int]:
+    """按层级统计下级数量，返回 {层级: 人数}（不含自身）"""
+    query = db.query(InviteClosure.depth, func.count()).filter(
+        InviteClosure.ancestor_id == root_id,
+        InviteClosure.depth > 0
+    )
+    if max_depth is not None:
+        query = query.filter(InviteClosure.depth <= max_depth)
+    return dict(query.group_by(InviteClosure.depth).all())
+
+
+def get_ancestors(db: Session, user_id: int, max_depth: Optional[int] = None) -> List[Tuple[User, int]]:
+    """获取上级链，按层级由近到远排序"""
+    query = db.query(User, InviteClosure.depth).join(
+        InviteClosure, InviteClosure.ancestor_id == User.id
+    ).filter(
+        InviteClosure.descendant_id == user_id,
+        InviteClosure.depth > 0
+    )
+    if max_depth is not None:
+        query = query.filter(InviteClosure.depth <= max_depth)
+    return query.order_by(InviteClosure.depth).all()
+
+
+def build_tree(rows: List[Tuple[User, int]], root_id: int) -> Optional[Dict]:
+    """把 get_subtree 的结果组装成嵌套树（不再查询数据库）"""
+    children_map: Dict[int, List[Dict]] = {}
+    root = None
+    for user, depth in rows:
+        node = {"user": user, "depth": depth, "children": []}
+        children_map.setdefault(user.inviter_id, []).append(node)
+        if user.id == root_id:
+            root = node
+
+    def attach(node: Dict) -> Dict:
+        node["children"] = [attach(child) for child in children_map.get(node["user"].id, [])]
+        node["children_count"] = len(node["children"])
+        return node
+
+    return attach(root) if root else None
+
+
+def rebuild(db: Session) -> int:
+    """根据 users.inviter_id 全量重建闭包表，返回写入的行数"""
+    db.execute(delete(InviteClosure))
+
+    chain = select(
+        User.id.label("ancestor_id"),
+        User.id.label("descendant_id"),
+        literal(0).label("depth")
+    ).cte("closure_rows", recursive=True)
+
+    child = aliased(User)
+    chain = chain.union_all(
+        select(
+            chain.c.ancestor_id,
+            child.id,
+            chain.c.depth + 1
+        ).join(child, child.inviter_id == chain.c.descendant_id).where(
+            and_(chain.c.depth < MAX_REBUILD_DEPTH, child.id != chain.c.ancestor_id)
+        )
+    )
+
+    db.execute(insert(InviteClosure).from_select(
+        ["ancestor_id", "descendant_id", "depth"],
+        select(chain.c.ancestor_id, chain.c.descendant_id, func.min(chain.c.depth)).group_by(
+            chain.c.ancestor_id, chain.c.descendant_id
+        )
+    ))
+    return db.query(InviteClosure).count()
@@ -0,0 +1,56 @@
+"""
+游标（keyset）分页工具
+
+按 (created_at, id) 倒序翻页，游标对客户端不透明。
+"""
+import base64
+import json
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import String, and_, or_, type_coerce
+
+from app.services.cache import TTLCache
+
+# 列表总数缓存（总数只作展示用，不需要每页精确计算）
+total_count_cache = TTLCache(ttl=60.0)
+
+
+def cursor_column(column):
+    """以数据库中存储的原始文本读取时间列
+
+    SQLite 中的时间以文本存储，且 func.now() 写入的值不带微秒，
+    直接用 datetime 参数比较会出现格式不一致，因此游标统一使用原始文本。
+    """
+    return type_coerce(column, String)
+
+
+def encode_cursor(created_at: Optional[str], row_id: int) -> str:
+    """生成游标"""
+    payload = json.dumps({"t": created_at, "i": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[str], int]:
+    """解析游标"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return payload["t"], int(payload["i"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+
+def keyset_filter(created_col, id_col, cursor: str):
+    """生成“位于游标之后”的过滤条件（按 created_at, id 倒序）"""
+    created_at, row_id = decode_cursor(cursor)
+    created_text = cursor_column(created_col)
+    return or_(
+        created_text < created_at,
+        and_(created_text == created_at, id_col < row_id)
+    )
+
+
+def cached_total(key, query) -> int:
+    """获取缓存的列表总数，未命中时执行count查询"""
+    return total_count_cache.get_or_set(key, query.count)
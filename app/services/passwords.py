@@ -0,0 +1,104 @@
+"""
+密码哈希服务
+
+bcrypt 每次计算耗时数百毫秒，直接在异步路由中调用会阻塞事件循环。
+这里把哈希和校验放到有界线程池中执行（bcrypt 计算时释放 GIL），
+并限制同时进行的计算数和排队数，超出时直接拒绝，避免登录高峰拖垮其他请求。
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from app.config import settings
+
+
+def build_context(rounds: int) -> CryptContext:
+    """按成本因子创建加密上下文，成本因子不同的旧哈希在登录时会被重新计算"""
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds
+    )
+
+
+# 密码加密上下文
+pwd_context = build_context(settings.bcrypt_rounds)
+
+
+class PasswordHasherBusy(Exception):
+    """排队的哈希请求过多或等待超时"""
+
+
+class PasswordHasher:
+    """在有界线程池中执行密码哈希，带并发上限和排队上限"""
+
+    def __init__(self, context: CryptContext, max_workers: int, max_pending: int, queue_timeout: float):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+
+    async def _run(self, func, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+
+        if self._semaphore.locked():
+            # 没有空闲名额时排队；排队数超过上限直接拒绝，不再继续堆积
+            if self._pending >= self.max_pending:
+                raise PasswordHasherBusy("密码校验请求过多")
+            self._pending += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise PasswordHasherBusy("密码校验排队超时")
+            finally:
+                self._pending -= 1
+        else:
+            await self._semaphore.acquire()
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        """计算密码哈希"""
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        """校验密码"""
+        return await self._run(self.context.verify, password, password_hash)
+
+    async def verify_and_update(self, password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+        """校验密码，成本因子变化时同时返回新哈希（否则为 None）"""
+        return await self._run(self.context.verify_and_update, password, password_hash)
+
+
+def admission_limit(max_pending: int, max_workers: int, pool_capacity: int) -> int:
+    """排队上限：计算中和排队中的请求合计不超过连接池容量
+
+    登录/注册在等待哈希时不占用连接，但每个放行的请求完成后都要再借一个连接写回结果，
+    合计不超过连接池容量就不会在借连接时阻塞事件循环。
+    """
+    return max(0, min(max_pending, pool_capacity - max_workers))
+
+
+# 全局实例
+password_hasher = PasswordHasher(
+    pwd_context,
+    max_workers=settings.password_hash_workers,
+    max_pending=admission_limit(
+        settings.password_hash_max_pending,
+        settings.password_hash_workers,
+        settings.database_pool_size + settings.database_max_overflow
+    ),
+    queue_timeout=settings.password_hash_queue_timeout
+)
@@ -0,0 +1,233 @@
+"""
+支付对账
+
+定期找出创建已久仍为 pending 的支付订单，并发查询网关（信号量限制并发数，
+按固定间隔发起请求限制速率）。网关确认已支付的订单走与回调相同的 payments.settle
+入账，重复确认不会重复入账；超过有效期仍未支付的订单标记为 expired。
+每轮的对账报告写入 settings 表。
+"""
+import asyncio
+import json
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.payment_intent import PaymentIntent
+from app.services import payments
+from app.services.futoon_pay import FutoonPay, get_futoon_client
+
+REPORT_KEY = "payment_reconcile_last_report"
+MAX_REPORT_ERRORS = 20
+
+
+@dataclass
+class ReconcileReport:
+    """对账结果"""
+    started_at: str
+    finished_at: Optional[str] = None
+    checked: int = 0
+    credited: int = 0
+    already_paid: int = 0
+    still_pending: int = 0
+    expired: int = 0
+    mismatched: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class RateLimiter:
+    """按固定间隔放行请求（rate 为每秒请求数，<=0 不限速）"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def stale_intents(older_than: datetime, limit: int) -> List[Dict]:
+    """取创建早于 older_than 的 pending 订单"""
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(PaymentIntent.out_trade_no, PaymentIntent.created_at)
+            .filter(PaymentIntent.status == payments.PENDING, PaymentIntent.created_at < older_than)
+            .order_by(PaymentIntent.created_at)
+            .limit(limit)
+            .all()
+        )
+        return [{"out_trade_no": row.out_trade_no, "created_at": row.created_at} for row in rows]
+    finally:
+        db.close()
+
+
+def _settle(out_trade_no: str, amount: Decimal, trade_no: Optional[str]) -> str:
+    """在独立会话中入账"""
+    db = SessionLocal()
+    try:
+        result = payments.settle(db, out_trade_no, amount, trade_no, f"支付对账 {out_trade_no}")
+        db.commit()
+        return result
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _expire(out_trade_no: str) -> bool:
+    """把仍为 pending 的订单标记为过期"""
+    db = SessionLocal()
+    try:
+        expired = payments.mark_failed(db, out_trade_no, payments.EXPIRED)
+        db.commit()
+        return expired
+    finally:
+        db.close()
+
+
+def save_report(report: ReconcileReport) -> None:
+    """把对账报告写入 settings 表"""
+    db = SessionLocal()
+    try:
+        db.execute(text("""
+            INSERT OR REPLACE INTO settings (setting_key, setting_value, description, updated_at)
+            VALUES (:key, :value, '最近一次支付对账报告', datetime('now'))
+        """), {"key": REPORT_KEY, "value": json.dumps(report.to_dict(), ensure_ascii=False)})
+        db.commit()
+    finally:
+        db.close()
+
+
+def load_report(db) -> Optional[Dict]:
+    """读取最近一次对账报告"""
+    value = db.execute(
+        text("SELECT setting_value FROM settings WHERE setting_key = :key"), {"key": REPORT_KEY}
+    ).scalar()
+    return json.loads(value) if value else None
+
+
+async def reconcile(client: Optional[FutoonPay] = None, now: Optional[datetime] = None,
+                    min_age_seconds: Optional[float] = None, expire_hours: Optional[float] = None,
+                    batch_size: Optional[int] = None, concurrency: Optional[int] = None,
+                    rate: Optional[float] = None) -> ReconcileReport:
+    """对一批超时未回调的订单向网关查询并入账"""
+    client = client or get_futoon_client()
+    now = now or datetime.utcnow()
+    min_age = settings.payment_reconcile_min_age_seconds if min_age_seconds is None else min_age_seconds
+    expire_hours = settings.payment_intent_expire_hours if expire_hours is None else expire_hours
+    batch_size = batch_size or settings.payment_reconcile_batch_size
+    semaphore = asyncio.Semaphore(concurrency or settings.payment_reconcile_concurrency)
+    limiter = RateLimiter(settings.payment_reconcile_rate if rate is None else rate)
+    expire_before = now - timedelta(hours=expire_hours)
+
+    report = ReconcileReport(started_at=now.isoformat())
+    intents = await asyncio.to_thread(stale_intents, now - timedelta(seconds=min_age), batch_size)
+
+    async def check(intent: Dict) -> None:
+        out_trade_no = intent["out_trade_no"]
+        async with semaphore:
+            await limiter.wait()
+            result = await client.query_order(out_trade_no)
+
+        info = result.get("order_info") or {}
+        if result.get("success") and str(info.get("status")) == "1":
+            try:
+                amount = Decimal(str(info.get("money")))
+            except InvalidOperation:
+                report.errors.append(f"{out_trade_no}: 网关返回金额无效 {info.get('money')}")
+                return
+            outcome = await asyncio.to_thread(_settle, out_trade_no, amount, info.get("trade_no"))
+            if outcome == payments.CREDITED:
+                report.credited += 1
+            elif outcome == payments.ALREADY_PAID:
+                report.already_paid += 1
+            else:
+                report.mismatched += 1
+                report.errors.append(f"{out_trade_no}: 入账失败 {outcome}")
+            return
+
+        # 网关查询失败（网络错误或订单不存在）或尚未支付：过期的关闭，其余下一轮再查
+        if intent["created_at"] < expire_before and await asyncio.to_thread(_expire, out_trade_no):
+            report.expired += 1
+        else:
+            report.still_pending += 1
+            if not result.get("success") and "网络请求失败" in result.get("message", ""):
+                report.errors.append(f"{out_trade_no}: {result['message']}")
+
+    outcomes = await asyncio.gather(*(check(intent) for intent in intents), return_exceptions=True)
+    for intent, outcome in zip(intents, outcomes):
+        if isinstance(outcome, Exception):
+            report.errors.append(f"{intent['out_trade_no']}: {outcome}")
+
+    report.checked = len(intents)
+    report.errors = report.errors[:MAX_REPORT_ERRORS]
+    report.finished_at = datetime.utcnow().isoformat()
+    return report
+
+
+class PaymentReconcileWorker:
+    """后台定时支付对账"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    async def run_once(self) -> Dict:
+        """执行一轮对账并保存报告（同一时间只允许一轮）"""
+        async with self._lock:
+            report = await reconcile()
+            await asyncio.to_thread(save_report, report)
+            if report.credited:
+                print(f"支付对账补入账 {report.credited} 笔")
+            return report.to_dict()
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=settings.payment_reconcile_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping.is_set():
+                break
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"支付对账任务异常: {e}")
+
+    def start(self) -> None:
+        """启动后台任务（payment_reconcile_interval_seconds 为 0 时不启动）"""
+        if settings.payment_reconcile_interval_seconds <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台任务"""
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+
+
+# 全局任务实例
+payment_reconcile_worker = PaymentReconcileWorker()
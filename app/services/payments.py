@@ -0,0 +1,94 @@
+"""
+在线支付入账
+
+下单时先写入 payment_intents（pending），网关回调和对账都通过 settle 入账。
+settle 用一条带状态条件的 UPDATE ... RETURNING 把订单从未支付转为 paid，只有抢到这次
+状态转换的调用才写充值记录和钱包流水，因此同一笔支付无论回调多少次只入账一次；
+重复回调只命中唯一索引上的一次更新和一次查询。
+"""
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.models.payment_intent import PaymentIntent
+from app.models.recharge_record import RechargeRecord
+from app.models.money import quantize
+from app.services import wallet
+
+PENDING = "pending"
+PAID = "paid"
+FAILED = "failed"  # 网关拒绝下单；若之后仍收到到账确认，照常入账
+EXPIRED = "expired"  # 对账超时仍未支付；同上，迟到的到账确认照常入账
+
+# settle 的结果
+CREDITED = "credited"
+ALREADY_PAID = "already_paid"
+UNKNOWN = "unknown"
+AMOUNT_MISMATCH = "amount_mismatch"
+
+
+def create_intent(db: Session, out_trade_no: str, user_id: int, amount: Decimal,
+                  payment_type: Optional[str] = None, payment_method: str = "futoon") -> PaymentIntent:
+    """创建待支付订单（由调用方提交事务）"""
+    intent = PaymentIntent(
+        out_trade_no=out_trade_no,
+        user_id=user_id,
+        amount=quantize(amount, 4),
+        payment_method=payment_method,
+        payment_type=payment_type,
+        status=PENDING,
+    )
+    db.add(intent)
+    db.flush()
+    return intent
+
+
+def mark_failed(db: Session, out_trade_no: str, status: str = FAILED) -> bool:
+    """把仍为 pending 的订单标记为失败或过期（由调用方提交事务）"""
+    result = db.execute(
+        update(PaymentIntent)
+        .where(PaymentIntent.out_trade_no == out_trade_no, PaymentIntent.status == PENDING)
+        .values(status=status)
+    )
+    return result.rowcount == 1
+
+
+def settle(db: Session, out_trade_no: str, amount: Decimal, trade_no: Optional[str] = None,
+           description: Optional[str] = None) -> str:
+    """确认到账并入账，同一订单只会成功一次（由调用方提交事务）"""
+    row = db.execute(
+        update(PaymentIntent)
+        .where(
+            PaymentIntent.out_trade_no == out_trade_no,
+            PaymentIntent.status != PAID,
+            PaymentIntent.amount == quantize(amount, 4),
+        )
+        .values(status=PAID, trade_no=trade_no, paid_at=datetime.utcnow())
+        .returning(PaymentIntent.id, PaymentIntent.user_id, PaymentIntent.amount, PaymentIntent.payment_method)
+        .execution_options(synchronize_session=False)
+    ).first()
+
+    if row is None:
+        status = db.query(PaymentIntent.status).filter(PaymentIntent.out_trade_no == out_trade_no).scalar()
+        if status is None:
+            return UNKNOWN
+        return ALREADY_PAID if status == PAID else AMOUNT_MISMATCH
+
+    record = RechargeRecord(
+        user_id=row.user_id,
+        amount=row.amount,
+        payment_method=row.payment_method,
+        status="completed",
+    )
+    db.add(record)
+    db.flush()
+    db.execute(
+        update(PaymentIntent).where(PaymentIntent.id == row.id).values(recharge_record_id=record.id)
+    )
+
+    wallet.post(db, row.user_id, row.amount, wallet.RECHARGE, record.id, description or f"在线支付 {out_trade_no}")
+    wallet.sync_balances(db, [row.user_id])
+    return CREDITED
@@ -0,0 +1,271 @@
+"""
+经营汇总服务
+
+订单返佣计算完成后，把订单收入、上游成本、返现、返佣按小时和天累加进
+revenue_rollups（按服务、按代理两个维度）。利润分析页按任意日期范围读取
+汇总行，不再扫描订单明细。orders.rolled_up_at 标记已汇总的订单，保证重试幂等。
+
+上游成本按订单上记录的下单时API单价（orders.upstream_unit_cost）计算，之后调整
+API价格不会改变历史成本，重建汇总的结果也与当时一致。早于该列的旧订单没有快照，
+只能按当前API价格估算。
+
+返佣重算修改已汇总订单的返佣时，用 adjust_commissions 把差额累加进汇总；结算和撤销
+只改变返佣的支付状态，不影响汇总。重建时跳过返佣事件尚未处理完的订单，由返佣任务处理后计入。
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, exists, func, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.models.commission import CommissionRecord
+from app.models.order import Order, CashbackRecord
+from app.models.outbox import OutboxEvent
+from app.models.revenue_rollup import RevenueRollup
+from app.models.service_price import ServicePrice
+from app.services import archive, fx
+
+HOUR = "hour"
+DAY = "day"
+SERVICE = "service"
+AGENT = "agent"
+
+# 查询范围不超过该天数时按小时返回趋势，否则按天
+HOURLY_MAX_DAYS = 3
+
+_METRICS = ("order_count", "revenue", "upstream_cost", "cashback", "commission")
+
+
+def _buckets(created_at: datetime) -> Tuple[Tuple[str, datetime], Tuple[str, datetime]]:
+    hour = created_at.replace(minute=0, second=0, microsecond=0)
+    return (HOUR, hour), (DAY, hour.replace(hour=0))
+
+
+def _upsert(db: Session, totals: Dict[Tuple, Dict]) -> None:
+    """把增量累加进汇总表（行不存在时插入）"""
+    stmt = sqlite_insert(RevenueRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[RevenueRollup.granularity, RevenueRollup.dimension,
+                        RevenueRollup.dimension_id, RevenueRollup.bucket_start],
+        set_={
+            **{name: getattr(RevenueRollup, name) + getattr(stmt.excluded, name) for name in _METRICS},
+            "updated_at": func.now()
+        }
+    )
+    db.execute(stmt, [
+        {
+            "granularity": granularity,
+            "bucket_start": bucket_start,
+            "dimension": dimension,
+            "dimension_id": dimension_id,
+            **values
+        }
+        for (granularity, bucket_start, dimension, dimension_id), values in totals.items()
+    ])
+
+
+def record_orders(db: Session, order_ids: Iterable[int], include_archive: bool = False) -> int:
+    """把尚未汇总的订单计入汇总表，返回计入的订单数（由调用方提交事务）
+
+    返佣取 commission_records 中未取消的记录，因此需在返佣写入之后调用。
+    include_archive=True（重建时使用）同时读取归档库中的订单，不检查汇总标记。
+    """
+    order_ids = list(set(order_ids))
+    if not order_ids:
+        return 0
+
+    orders_src = archive.history(db, Order) if include_archive else Order
+    cashback_src = archive.history(db, CashbackRecord) if include_archive else CashbackRecord
+    commission_src = archive.history(db, CommissionRecord) if include_archive else CommissionRecord
+
+    criteria = [orders_src.id.in_(order_ids)]
+    if not include_archive:
+        criteria.append(Order.rolled_up_at == None)
+    orders = db.query(
+        orders_src.id, orders_src.service_id, orders_src.quantity, orders_src.charge,
+        orders_src.upstream_unit_cost, orders_src.created_at
+    ).filter(*criteria).all()
+    if not orders:
+        return 0
+    pending_ids = [order.id for order in orders]
+
+    cashback = dict(db.query(cashback_src.order_id, func.sum(cashback_src.amount)).filter(
+        cashback_src.order_id.in_(pending_ids)
+    ).group_by(cashback_src.order_id).all())
+
+    commissions: Dict[int, List[Tuple[int, Decimal]]] = defaultdict(list)
+    for order_id, agent_id, amount in db.query(
+        commission_src.order_id, commission_src.agent_id, func.sum(commission_src.commission_amount)
+    ).filter(
+        commission_src.order_id.in_(pending_ids),
+        commission_src.status != "cancelled"
+    ).group_by(commission_src.order_id, commission_src.agent_id):
+        commissions[order_id].append((agent_id, amount or Decimal("0")))
+
+    # 没有单价快照的旧订单按当前API价格估算
+    legacy_services = {order.service_id for order in orders if order.upstream_unit_cost is None}
+    api_prices = dict(db.query(ServicePrice.service_id, ServicePrice.api_price).filter(
+        ServicePrice.service_id.in_(legacy_services)
+    ).all()) if legacy_services else {}
+    rates = fx.load_history(db)
+
+    totals: Dict[Tuple, Dict] = defaultdict(lambda: dict.fromkeys(_METRICS, 0))
+    now = datetime.utcnow()
+    for order in orders:
+        created_at = order.created_at or now
+        revenue = order.charge or Decimal("0")
+        unit_cost = order.upstream_unit_cost
+        if unit_cost is None:
+            unit_cost = api_prices.get(order.service_id) or Decimal("0")
+        cost = unit_cost * (order.quantity or 0) * fx.rate_at(rates, created_at)
+        order_commissions = commissions.get(order.id, [])
+        commission = sum((amount for _, amount in order_commissions), Decimal("0"))
+
+        for granularity, bucket_start in _buckets(created_at):
+            row = totals[(granularity, bucket_start, SERVICE, order.service_id)]
+            row["order_count"] += 1
+            row["revenue"] += revenue
+            row["upstream_cost"] += cost
+            row["cashback"] += cashback.get(order.id) or Decimal("0")
+            row["commission"] += commission
+
+            for agent_id, amount in order_commissions:
+                row = totals[(granularity, bucket_start, AGENT, agent_id)]
+                row["order_count"] += 1
+                row["revenue"] += revenue
+                row["commission"] += amount
+
+    _upsert(db, totals)
+    db.execute(
+        update(Order).where(Order.id.in_(pending_ids)).values(rolled_up_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    return len(pending_ids)
+
+
+def adjust_commissions(db: Session, adjustments: Iterable[Tuple[int, int, int, Decimal]]) -> None:
+    """把已汇总订单的返佣变动累加进汇总表（由调用方提交事务）
+
+    adjustments 为 (订单ID, 代理ID, 代理维度订单数变化, 返佣变化)：新增返佣记录为 +1，
+    作废为 -1，只改金额为 0。尚未汇总的订单跳过，计入时会读取最新的返佣记录。
+    """
+    adjustments = list(adjustments)
+    if not adjustments:
+        return
+    orders = {
+        order.id: order for order in db.query(Order.id, Order.service_id, Order.charge, Order.created_at).filter(
+            Order.id.in_({order_id for order_id, _, _, _ in adjustments}),
+            Order.rolled_up_at != None
+        )
+    }
+
+    totals: Dict[Tuple, Dict] = defaultdict(lambda: dict.fromkeys(_METRICS, 0))
+    now = datetime.utcnow()
+    for order_id, agent_id, order_delta, commission in adjustments:
+        order = orders.get(order_id)
+        if order is None:
+            continue
+        for granularity, bucket_start in _buckets(order.created_at or now):
+            totals[(granularity, bucket_start, SERVICE, order.service_id)]["commission"] += commission
+            row = totals[(granularity, bucket_start, AGENT, agent_id)]
+            row["order_count"] += order_delta
+            row["revenue"] += (order.charge or Decimal("0")) * order_delta
+            row["commission"] += commission
+    if totals:
+        _upsert(db, totals)
+
+
+def rebuild(db: Session, chunk_size: int = 1000) -> int:
+    """清空汇总表并按订单明细（含归档库）重建，返回计入的订单数（由调用方提交事务）
+
+    返佣事件仍待处理或已失败的订单不计入，保持未汇总状态，由返佣任务处理后计入。
+    """
+    db.execute(delete(RevenueRollup))
+    db.execute(update(Order).values(rolled_up_at=None).execution_options(synchronize_session=False))
+
+    orders = archive.history(db, Order)
+    unprocessed = exists().where(
+        OutboxEvent.aggregate_id == orders.id,
+        OutboxEvent.status.in_(("pending", "failed"))
+    )
+    total = 0
+    last_id = 0
+    while True:
+        ids = [order_id for (order_id,) in db.query(orders.id).filter(
+            orders.id > last_id,
+            ~unprocessed
+        ).order_by(orders.id).limit(chunk_size)]
+        if not ids:
+            break
+        total += record_orders(db, ids, include_archive=True)
+        last_id = ids[-1]
+    return total
+
+
+def _to_float(values: Dict) -> Dict:
+    result = {name: float(values[name] or 0) for name in _METRICS if name != "order_count"}
+    result["order_count"] = int(values["order_count"] or 0)
+    result["profit"] = float(
+        (values["revenue"] or 0) - (values["upstream_cost"] or 0)
+        - (values["cashback"] or 0) - (values["commission"] or 0)
+    )
+    return result
+
+
+def query(db: Session, start: datetime, end: datetime, granularity: Optional[str] = None,
+          top: int = 20) -> Dict:
+    """读取 [start, end) 范围内的汇总：总计、趋势、按服务和按代理排行
+
+    start/end 需对齐到天（按天汇总）或小时（按小时汇总）。
+    """
+    if granularity is None:
+        granularity = HOUR if end - start <= timedelta(days=HOURLY_MAX_DAYS) else DAY
+    sums = [func.coalesce(func.sum(getattr(RevenueRollup, name)), 0).label(name) for name in _METRICS]
+    in_range = (
+        RevenueRollup.granularity == granularity,
+        RevenueRollup.bucket_start >= start,
+        RevenueRollup.bucket_start < end
+    )
+
+    service_rows = db.query(RevenueRollup.bucket_start, *sums).filter(
+        *in_range, RevenueRollup.dimension == SERVICE
+    ).group_by(RevenueRollup.bucket_start).order_by(RevenueRollup.bucket_start).all()
+    series = [
+        {"bucket_start": row.bucket_start.isoformat(), **_to_float(row._mapping)}
+        for row in service_rows
+    ]
+    totals = dict.fromkeys(_METRICS, 0)
+    for row in service_rows:
+        for name in _METRICS:
+            totals[name] += row._mapping[name] or 0
+
+    by_service = db.query(
+        RevenueRollup.dimension_id, ServicePrice.service_name, *sums
+    ).outerjoin(
+        ServicePrice, ServicePrice.service_id == RevenueRollup.dimension_id
+    ).filter(
+        *in_range, RevenueRollup.dimension == SERVICE
+    ).group_by(RevenueRollup.dimension_id).order_by(sums[1].desc()).limit(top).all()
+
+    by_agent = db.query(RevenueRollup.dimension_id, *sums).filter(
+        *in_range, RevenueRollup.dimension == AGENT
+    ).group_by(RevenueRollup.dimension_id).order_by(sums[4].desc()).limit(top).all()
+
+    return {
+        "granularity": granularity,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "totals": _to_float(totals),
+        "series": series,
+        "services": [
+            {"service_id": row.dimension_id, "service_name": row.service_name, **_to_float(row._mapping)}
+            for row in by_service
+        ],
+        "agents": [
+            {"agent_id": row.dimension_id, **_to_float(row._mapping)}
+            for row in by_agent
+        ]
+    }
@@ -0,0 +1,204 @@
+"""
+钱包服务（只追加流水 + 余额快照）
+
+所有余额变动都写入 wallet_entries，不再直接改写 users.balance。
+当前余额 = 快照余额 + 快照之后的流水，后台定期把流水汇总进快照，
+保证读取余额只需扫描很短的尾部。users.balance 作为展示用的缓存，
+在写入流水的同一事务中按流水重新计算。
+"""
+import asyncio
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func, insert, select, update, literal
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, aliased
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.user import User
+from app.models.wallet import WalletEntry, WalletSnapshot
+
+# 流水类型
+OPENING = "opening"
+RECHARGE = "recharge"
+ADMIN_RECHARGE = "admin_recharge"
+ORDER = "order"
+CASHBACK = "cashback"
+COMMISSION = "commission"
+COMMISSION_ADJUST = "commission_adjust"
+
+
+def post(db: Session, user_id: int, amount: Decimal, entry_type: str,
+         ref_id: Optional[int] = None, description: Optional[str] = None) -> None:
+    """追加一条流水（由调用方提交事务）"""
+    db.execute(insert(WalletEntry).values(
+        user_id=user_id,
+        amount=amount,
+        entry_type=entry_type,
+        ref_id=ref_id,
+        description=description
+    ))
+
+
+def post_many(db: Session, entries: List[Dict]) -> None:
+    """批量追加流水，entries 为 {user_id, amount, entry_type, ref_id, description} 列表"""
+    if entries:
+        db.execute(insert(WalletEntry), [
+            {"ref_id": None, "description": None, **entry} for entry in entries
+        ])
+
+
+def balance_expr(user_id_col):
+    """按流水计算某个用户当前余额的SQL表达式（快照 + 快照之后的流水）"""
+    snapshot = aliased(WalletSnapshot)
+    snapshot_balance = select(snapshot.balance).where(snapshot.user_id == user_id_col).scalar_subquery()
+    snapshot_last_id = select(snapshot.last_entry_id).where(snapshot.user_id == user_id_col).scalar_subquery()
+    tail = select(func.sum(WalletEntry.amount)).where(
+        WalletEntry.user_id == user_id_col,
+        WalletEntry.id > func.coalesce(snapshot_last_id, 0)
+    ).scalar_subquery()
+    return func.coalesce(snapshot_balance, 0) + func.coalesce(tail, 0)
+
+
+def get_balance(db: Session, user_id: int) -> Decimal:
+    """读取用户当前余额（以流水为准）"""
+    value = db.execute(select(balance_expr(literal(user_id)))).scalar()
+    return value if value is not None else Decimal("0.00")
+
+
+def sync_balances(db: Session, user_ids: Iterable[int]) -> None:
+    """按流水刷新 users.balance 缓存"""
+    user_ids = list({user_id for user_id in user_ids if user_id})
+    if user_ids:
+        db.execute(
+            update(User).where(User.id.in_(user_ids)).values(balance=balance_expr(User.id))
+            .execution_options(synchronize_session=False)
+        )
+
+
+def rollup(db: Session) -> int:
+    """把上次汇总之后的流水累加进快照，返回涉及的用户数（由调用方提交事务）"""
+    high = db.query(func.max(WalletEntry.id)).scalar()
+    watermark = db.query(func.max(WalletSnapshot.last_entry_id)).scalar() or 0
+    if not high or high <= watermark:
+        return 0
+
+    rows = db.query(WalletEntry.user_id, func.sum(WalletEntry.amount)).filter(
+        WalletEntry.id > watermark,
+        WalletEntry.id <= high
+    ).group_by(WalletEntry.user_id).all()
+    if not rows:
+        return 0
+
+    stmt = sqlite_insert(WalletSnapshot)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[WalletSnapshot.user_id],
+        set_={
+            "balance": WalletSnapshot.balance + stmt.excluded.balance,
+            "last_entry_id": stmt.excluded.last_entry_id,
+            "updated_at": func.now()
+        }
+    )
+    db.execute(stmt, [
+        {"user_id": user_id, "balance": amount or 0, "last_entry_id": high}
+        for user_id, amount in rows
+    ])
+    return len(rows)
+
+
+def bootstrap(db: Session) -> int:
+    """为已有余额的用户写入期初流水（钱包流水为空时执行一次）"""
+    result = db.execute(insert(WalletEntry).from_select(
+        ["user_id", "amount", "entry_type", "description"],
+        select(User.id, User.balance, literal(OPENING), literal("期初余额")).where(
+            User.balance != None,
+            User.balance != 0
+        ).order_by(User.id)
+    ))
+    return result.rowcount
+
+
+def reconcile(db: Session, full: bool = False, limit: int = 100) -> Dict:
+    """对账：比较 users.balance 与流水余额
+
+    full=True 时直接汇总全部流水（同时校验快照），否则使用快照 + 尾部流水。
+    """
+    if full:
+        ledger = select(func.coalesce(func.sum(WalletEntry.amount), 0)).where(
+            WalletEntry.user_id == User.id
+        ).correlate(User).scalar_subquery()
+    else:
+        ledger = balance_expr(User.id)
+
+    # 余额与流水同为整数最小单位，可以直接比较
+    ledger_col = ledger.label("ledger_balance")
+    mismatches = db.execute(
+        select(User.id, User.username, User.balance, ledger_col).where(
+            func.coalesce(User.balance, 0) != ledger_col
+        ).order_by(User.id)
+    ).all()
+
+    return {
+        "full": full,
+        "users_checked": db.query(func.count(User.id)).scalar(),
+        "mismatched": len(mismatches),
+        "details": [
+            {
+                "user_id": row.id,
+                "username": row.username,
+                "cached_balance": float(row.balance or 0),
+                "ledger_balance": float(row.ledger_balance or 0),
+                "diff": float((row.balance or 0) - (row.ledger_balance or 0))
+            }
+            for row in mismatches[:limit]
+        ]
+    }
+
+
+class WalletRollupWorker:
+    """后台定期汇总钱包快照"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    def run_once(self) -> int:
+        db = SessionLocal()
+        try:
+            count = rollup(db)
+            db.commit()
+            return count
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                print(f"钱包快照汇总异常: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=settings.wallet_rollup_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        """启动后台任务"""
+        if self._task is None or self._task.done():
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台任务"""
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+
+
+# 全局任务实例
+wallet_rollup_worker = WalletRollupWorker()
@@ -0,0 +1,68 @@
+"""
+模板环境
+
+所有路由共用一个 Jinja2 环境，base.html 等公共模板只编译一次；编译结果写入文件系统
+字节码缓存，进程重启后直接加载。与用户无关、渲染开销大的片段可用 {% cache %} 标签缓存：
+
+    {% cache "profit_table", profit_version %} ... {% endcache %}
+
+缓存键为片段名加数据版本，数据变化后版本号改变，旧片段不再命中并自然过期。
+"""
+import os
+from typing import Any, Hashable
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+from app.config import settings
+from app.services.cache import TTLCache
+
+TEMPLATE_DIR = "app/templates"
+
+fragment_cache = TTLCache(ttl=settings.template_fragment_ttl, maxsize=settings.template_fragment_cache_size)
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache 名称, 版本 %}...{% endcache %}：按名称和数据版本缓存渲染结果"""
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(self.call_method("_render", args), [], [], body).set_lineno(lineno)
+
+    def _render(self, name: str, version: Hashable, caller) -> Any:
+        key = (name, version)
+        value = fragment_cache.get(key)
+        if value is None:
+            value = caller()
+            fragment_cache.set(key, value)
+        return value
+
+
+def _bytecode_cache():
+    """字节码缓存目录（配置为空时不启用）"""
+    if not settings.template_bytecode_cache_dir:
+        return None
+    os.makedirs(settings.template_bytecode_cache_dir, exist_ok=True)
+    return FileSystemBytecodeCache(settings.template_bytecode_cache_dir)
+
+
+def create_templates(directory: str = TEMPLATE_DIR) -> Jinja2Templates:
+    """创建模板环境"""
+    return Jinja2Templates(
+        directory=directory,
+        bytecode_cache=_bytecode_cache(),
+        extensions=[FragmentCacheExtension],
+    )
+
+
+# 全局共享的模板环境
+templates = create_templates()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+把已结算的旧订单及其返现、返佣记录移入归档库
+
+用法:
+    python archive_orders.py                    # 归档超过 archive_after_days 天的已结算订单
+    python archive_orders.py --days 90          # 指定天数
+    python archive_orders.py --pause 0.2        # 每批之间暂停，降低对线上写入的影响
+"""
+import sys
+import os
+import argparse
+import json
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal, Base, engine, archive_engines
+from app.services import archive
+
+# 导入所有模型以确保它们被注册
+import app.models
+
+def main():
+    """归档冷数据"""
+    parser = argparse.ArgumentParser(description="归档已结算的旧订单")
+    parser.add_argument("--days", type=int, default=None, help="归档超过多少天的订单（默认读取配置）")
+    parser.add_argument("--batch-size", type=int, default=None, help="每批归档的订单数")
+    parser.add_argument("--max-batches", type=int, default=None, help="本次最多处理的批数")
+    parser.add_argument("--pause", type=float, default=0.0, help="每批之间暂停的秒数")
+    args = parser.parse_args()
+    
+    if engine not in archive_engines:
+        print("❌ 未配置归档库 (archive_database_path)")
+        sys.exit(1)
+    
+    Base.metadata.create_all(bind=engine)
+    archive.create_archive_tables(engine)
+    
+    db = SessionLocal()
+    try:
+        report = archive.archive_settled(
+            db,
+            older_than_days=args.days,
+            batch_size=args.batch_size,
+            max_batches=args.max_batches,
+            pause=args.pause
+        )
+        print(json.dumps(report.to_dict(), ensure_ascii=False, indent=2))
+        if report.finished:
+            print("✅ 归档完成")
+        else:
+            print("⏸️ 已达到批数上限，再次运行继续归档")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ 归档失败: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,19 @@ TikTok API 管理后台 - FastAPI版本
 """
 from fastapi import FastAPI, Request, Depends, HTTPException, status
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from starlette.middleware.sessions import SessionMiddleware
 import uvicorn
 import os
 
 from app.routers import auth, dashboard, orders, admin, recharge, agent, agent_dashboard
 from app.database import init_db
+from app.services.commission_worker import commission_worker
+from app.services.wallet import wallet_rollup_worker
+from app.services.backup import backup_worker
+from app.services.api_keys import ApiKeySessionMiddleware
+from app.services.futoon_pay import get_futoon_client, close_futoon_client
+from app.services.payment_reconcile import payment_reconcile_worker
 from app.models.user import get_current_user
 
 # 导入所有模型以确保它们被注册
@@ -26,12 +30,11 @@ app = FastAPI(
     redoc_url=None  # 禁用ReDoc文档
 )
 
-# 添加SessionMiddleware
-app.add_middleware(SessionMiddleware, secret_key="your-secret-key-here-change-in-production")
+# 添加SessionMiddleware（携带API密钥的 /api/ 请求跳过会话）
+app.add_middleware(ApiKeySessionMiddleware, secret_key="your-secret-key-here-change-in-production")
 
-# 静态文件和模板
+# 静态文件
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
-templates = Jinja2Templates(directory="app/templates")
 
 # 安全
 security = HTTPBearer()
@@ -66,6 +69,20 @@ async def health_check():
 async def startup_event():
     """应用启动时初始化数据库"""
     await init_db()
+    commission_worker.start()
+    wallet_rollup_worker.start()
+    backup_worker.start()
+    get_futoon_client()  # 富通支付连接池随进程常驻
+    payment_reconcile_worker.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时停止后台任务"""
+    await commission_worker.stop()
+    await wallet_rollup_worker.stop()
+    await backup_worker.stop()
+    await payment_reconcile_worker.stop()
+    await close_futoon_client()
 
 if __name__ == "__main__":
     uvicorn.run(
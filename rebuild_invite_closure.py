@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+根据 users.inviter_id 重建邀请关系闭包表
+"""
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal, Base, engine
+from app.services import invite_graph
+
+# 导入所有模型以确保它们被注册
+import app.models
+
+def main():
+    """重建闭包表"""
+    Base.metadata.create_all(bind=engine)
+    
+    db = SessionLocal()
+    try:
+        rows = invite_graph.rebuild(db)
+        db.commit()
+        print(f"✅ 邀请关系闭包表重建完成，共 {rows} 行")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ 重建失败: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
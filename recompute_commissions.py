@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+按当前返佣配置和邀请关系重算历史返佣
+
+用法:
+    python recompute_commissions.py --dry-run       # 只输出差异报告
+    python recompute_commissions.py                 # 执行修正（中断后再次运行会从检查点继续）
+    python recompute_commissions.py --restart       # 忽略检查点从头开始
+"""
+import sys
+import os
+import argparse
+import json
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal, Base, engine
+from app.services.commission_recompute import recompute_commissions
+
+# 导入所有模型以确保它们被注册
+import app.models
+
+def main():
+    """重算返佣"""
+    parser = argparse.ArgumentParser(description="重算历史返佣")
+    parser.add_argument("--dry-run", action="store_true", help="只输出差异报告，不写入数据")
+    parser.add_argument("--restart", action="store_true", help="忽略检查点从头开始")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="每批处理的订单数")
+    parser.add_argument("--max-chunks", type=int, default=None, help="本次最多处理的批数")
+    args = parser.parse_args()
+    
+    Base.metadata.create_all(bind=engine)
+    
+    db = SessionLocal()
+    try:
+        report = recompute_commissions(
+            db,
+            chunk_size=args.chunk_size,
+            dry_run=args.dry_run,
+            restart=args.restart,
+            max_chunks=args.max_chunks
+        )
+        print(json.dumps(report.to_dict(), ensure_ascii=False, indent=2))
+        if report.finished:
+            print("✅ 返佣重算完成" + ("（仅报告，未写入）" if args.dry_run else ""))
+        else:
+            print(f"⏸️ 已处理到订单 {report.last_order_id}，再次运行将从检查点继续")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ 重算失败: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
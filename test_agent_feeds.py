@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+测试代理邀请用户、返佣记录列表的查询次数（防止N+1回归）
+"""
+import sys
+import os
+from datetime import datetime
+from decimal import Decimal
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.models.user import User
+from app.models.order import Order
+from app.models.commission import CommissionRecord
+from app.routers.agent_dashboard import get_invitee_page, get_commission_page
+from test_support import make_session, count_statements
+
+
+def _seed(db, invitee_count: int = 12):
+    """创建一个代理及其邀请用户、订单和返佣"""
+    agent = User(email="agent@example.com", username="agent", password_hash="x", is_agent=True, agent_level=1)
+    db.add(agent)
+    db.flush()
+    for i in range(invitee_count):
+        invitee = User(
+            email=f"user{i}@example.com",
+            username=f"user{i}",
+            password_hash="x",
+            inviter_id=agent.id,
+            created_at=datetime(2024, 1, 1, 10, 0, i // 3)
+        )
+        db.add(invitee)
+        db.flush()
+        for _ in range(i % 3):
+            order = Order(user_id=invitee.id, service_id=1, service_name="抖音点赞", link="https://example.com", quantity=100, charge=Decimal("10.00"))
+            db.add(order)
+            db.flush()
+            db.add(CommissionRecord(
+                agent_id=agent.id, consumer_id=invitee.id, order_id=order.id,
+                commission_type="direct", commission_rate=Decimal("0.05"),
+                order_amount=Decimal("10.00"), commission_amount=Decimal("0.50")
+            ))
+    db.commit()
+    return agent
+
+
+def test_invitee_page_uses_single_query():
+    """每页邀请用户只执行一条SQL"""
+    engine, db = make_session()
+    agent_id = _seed(db).id
+
+    statements = count_statements(engine)
+
+    page, next_cursor, has_more = get_invitee_page(db, agent_id, None, 5)
+    assert len(statements) == 1
+    assert len(page) == 5 and has_more
+
+    statements.clear()
+    page2, _, _ = get_invitee_page(db, agent_id, next_cursor, 5)
+    assert len(statements) == 1
+    assert not {row["id"] for row in page} & {row["id"] for row in page2}
+
+
+def test_invitee_page_stats_match_per_user_totals():
+    """聚合结果与逐个统计一致"""
+    engine, db = make_session()
+    agent = _seed(db)
+
+    page, _, _ = get_invitee_page(db, agent.id, None, 100)
+    assert len(page) == 12
+    for row in page:
+        order_count = db.query(Order).filter(Order.user_id == row["id"]).count()
+        assert row["total_orders"] == order_count
+        assert row["total_consumed"] == order_count * 10.0
+        assert row["total_commission"] == order_count * 0.5
+
+
+def test_commission_page_uses_single_joined_query():
+    """每页返佣记录只执行一条联表SQL，且包含消费者和订单信息"""
+    engine, db = make_session()
+    agent_id = _seed(db).id
+    db.expunge_all()
+
+    statements = count_statements(engine)
+
+    page, next_cursor, has_more = get_commission_page(db, agent_id, None, 5)
+    assert len(statements) == 1
+    assert len(page) == 5 and has_more
+    assert all(row["consumer"]["username"].startswith("user") for row in page)
+    assert all(row["order"]["service_name"] == "抖音点赞" for row in page)
+
+    statements.clear()
+    page2, _, _ = get_commission_page(db, agent_id, next_cursor, 100)
+    assert len(statements) == 1
+    assert len(page) + len(page2) == db.query(CommissionRecord).count()
+
+
+if __name__ == "__main__":
+    test_invitee_page_uses_single_query()
+    test_invitee_page_stats_match_per_user_totals()
+    test_commission_page_uses_single_joined_query()
+    print("✅ 代理列表测试通过")
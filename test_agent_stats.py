@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+测试代理统计快照的增量维护
+"""
+import sys
+import os
+import asyncio
+from decimal import Decimal
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.models.user import User
+from app.models.order import Order
+from app.services import agent_stats, invite_graph
+from app.services.commission_service import CommissionService
+from test_support import make_session, count_statements
+
+
+def _register(db, name, inviter=None, is_agent=False):
+    """模拟 create_user 的注册流程"""
+    user = User(email=f"{name}@example.com", username=name, password_hash="x",
+                inviter_id=inviter.id if inviter else None, is_agent=is_agent)
+    db.add(user)
+    db.flush()
+    invite_graph.add_user(db, user.id, user.inviter_id)
+    agent_stats.on_user_registered(db, user.id, user.inviter_id)
+    db.commit()
+    return user
+
+
+def _order(db, user, charge):
+    """模拟 submit_order 的下单流程"""
+    order = Order(user_id=user.id, service_id=1, service_name="抖音点赞", link="https://example.com", quantity=100, charge=Decimal(charge))
+    db.add(order)
+    db.flush()
+    agent_stats.on_order_created(db, order, user.inviter_id)
+    asyncio.run(CommissionService(db).calculate_commission(order))
+    return order
+
+
+def test_incremental_stats_match_rebuild():
+    """增量维护的快照与从明细重建的结果一致"""
+    engine, db = make_session()
+    top = _register(db, "top", is_agent=True)
+    agent = _register(db, "agent", top, is_agent=True)
+    buyer1 = _register(db, "buyer1", agent)
+    buyer2 = _register(db, "buyer2", agent)
+    _register(db, "idle", agent)
+    _order(db, buyer1, "100.00")
+    _order(db, buyer1, "50.00")
+    _order(db, buyer2, "20.00")
+
+    incremental = {uid: agent_stats.get_stats(db, uid) for uid in (top.id, agent.id)}
+    assert incremental[agent.id]["total_invitees"] == 3
+    assert incremental[agent.id]["active_invitees"] == 2
+    assert incremental[agent.id]["total_consumption"] == Decimal("170")
+    assert incremental[top.id]["total_commission"] > 0
+
+    agent_stats.rebuild(db)
+    db.commit()
+    for uid, stats in incremental.items():
+        rebuilt = agent_stats.get_stats(db, uid)
+        for key, value in stats.items():
+            assert Decimal(str(rebuilt[key])) == Decimal(str(value)), key
+
+
+def test_get_stats_is_single_lookup():
+    """读取统计只执行一次查询"""
+    engine, db = make_session()
+    agent_id = _register(db, "agent", is_agent=True).id
+
+    statements = count_statements(engine)
+
+    agent_stats.get_stats(db, agent_id)
+    assert len(statements) == 1
+
+
+if __name__ == "__main__":
+    test_incremental_stats_match_rebuild()
+    test_get_stats_is_single_lookup()
+    print("✅ 代理统计快照测试通过")
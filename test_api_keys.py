@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+测试API密钥认证、身份缓存及会话跳过
+"""
+import sys
+import os
+import asyncio
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.models.user import User, get_current_user
+from app.models.api_key import ApiKey
+from app.services import api_keys
+from test_support import make_engine, count_statements
+
+
+def _make_session(monkeypatch):
+    """创建内存数据库，并让密钥校验使用同一个库"""
+    engine = make_engine()
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(api_keys, "SessionLocal", Session)
+    api_keys.principal_cache.clear()
+    return engine, Session()
+
+
+def _request(path, key=None, session=None):
+    """构造带可选密钥请求头的请求"""
+    headers = [(b"x-api-key", key.encode())] if key else []
+    return Request({"type": "http", "method": "POST", "path": path, "headers": headers,
+                    "query_string": b"", "session": session or {}})
+
+
+def test_authenticate_caches_principal_and_revoke_invalidates(monkeypatch):
+    engine, db = _make_session(monkeypatch)
+    user = User(email="client@example.com", username="client", password_hash="x")
+    db.add(user)
+    db.flush()
+    record, key = api_keys.generate(db, user.id, "下单脚本")
+    db.commit()
+    user_id, record_id = user.id, record.id
+
+    assert key.startswith(f"tk_{record.prefix}_")
+    assert record.key_hash != key and len(record.key_hash) == 64
+
+    statements = count_statements(engine)
+
+    assert api_keys.authenticate(key).id == user_id
+    assert statements
+    db.expire_all()
+    assert db.get(ApiKey, record_id).last_used_at is not None
+
+    # 缓存命中：不再查库
+    statements.clear()
+    assert api_keys.authenticate(key).id == user_id
+    assert statements == []
+
+    # 前缀正确但密钥错误、格式错误都不通过
+    assert api_keys.authenticate(f"tk_{record.prefix}_wrong") is None
+    assert api_keys.authenticate("garbage") is None
+    # 格式不符的密钥不查库
+    statements.clear()
+    assert api_keys.authenticate("tk_bad_key") is None
+    assert statements == []
+    # 格式正确的错误密钥不缓存，不会挤掉有效身份
+    forged = key[:-1] + ("A" if key[-1] != "A" else "B")
+    assert api_keys.authenticate(forged) is None
+    assert api_keys.principal_cache.get(api_keys.hash_key(forged)) is None
+    assert api_keys.principal_cache.get(record.key_hash).id == user_id
+
+    assert api_keys.revoke(db, user_id, record_id)
+    db.commit()
+    assert api_keys.authenticate(key) is None
+    # 其他用户不能吊销
+    assert not api_keys.revoke(db, user_id + 1, record_id)
+
+
+def test_get_current_user_uses_key_only_on_api_paths(monkeypatch):
+    engine, db = _make_session(monkeypatch)
+    client_user = User(email="client@example.com", username="client", password_hash="x")
+    other = User(email="other@example.com", username="other", password_hash="x")
+    disabled = User(email="off@example.com", username="off", password_hash="x", status=0)
+    db.add_all([client_user, other, disabled])
+    db.flush()
+    _, key = api_keys.generate(db, client_user.id)
+    _, disabled_key = api_keys.generate(db, disabled.id)
+    db.commit()
+
+    # get_current_user 的会话分支使用 app.database.SessionLocal
+    import app.database as database
+    monkeypatch.setattr(database, "SessionLocal", api_keys.SessionLocal)
+    user = asyncio.run(get_current_user(_request("/api/api/orders/submit", key)))
+    assert user.id == client_user.id
+    assert asyncio.run(get_current_user(_request("/api/balance", "tk_bad_key"))) is None
+    assert asyncio.run(get_current_user(_request("/api/balance", disabled_key))) is None
+    # 非 /api/ 路径忽略密钥，仍按会话认证
+    user = asyncio.run(get_current_user(_request("/admin/dashboard", key, {"user_id": other.id})))
+    assert user.id == other.id
+
+
+def test_middleware_skips_session_for_api_key_requests():
+    async def endpoint(request):
+        request.session["touched"] = True
+        return JSONResponse({"ok": True})
+
+    app = Starlette(routes=[Route("/api/ping", endpoint), Route("/page", endpoint)])
+    app.add_middleware(api_keys.ApiKeySessionMiddleware, secret_key="test")
+    client = TestClient(app)
+
+    response = client.get("/api/ping", headers={"X-API-Key": "tk_x_y"})
+    assert response.status_code == 200
+    assert "set-cookie" not in response.headers
+
+    assert "set-cookie" in client.get("/api/ping").headers
+    assert "set-cookie" in client.get("/page", headers={"X-API-Key": "tk_x_y"}).headers
+
+
+if __name__ == "__main__":
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_authenticate_caches_principal_and_revoke_invalidates(monkeypatch)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_get_current_user_uses_key_only_on_api_paths(monkeypatch)
+    test_middleware_skips_session_for_api_key_requests()
+    print("✅ API密钥测试通过")
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+测试冷数据归档及合并读取
+"""
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, attach_archive
+from app.models.user import User
+from app.models.order import Order, CashbackRecord
+from app.models.commission import CommissionRecord, CommissionSettlement
+from app.models.agent_stats import AgentStats
+from app.routers.agent_dashboard import get_commission_page
+from app.services import archive, agent_stats, export, commission_settlement
+from app.services.commission_simulator import run_simulation
+from test_support import make_engine
+
+
+def _make_session():
+    """创建挂载内存归档库的内存数据库会话"""
+    engine = make_engine(archive=True)
+    Session = sessionmaker(bind=engine)
+    return engine, Session
+
+
+def _seed(db):
+    """代理 + 消费者，三个旧订单（两个已结算、一个返佣待支付）和一个新订单"""
+    agent = User(email="agent@example.com", username="agent", password_hash="x", is_agent=True)
+    db.add(agent)
+    db.flush()
+    consumer = User(email="c@example.com", username="c", password_hash="x", inviter_id=agent.id)
+    db.add(consumer)
+    db.flush()
+
+    old = datetime.utcnow() - timedelta(days=400)
+    orders = []
+    for days, status in ((0, "paid"), (1, "paid"), (2, "pending")):
+        orders.append((old + timedelta(days=days), status))
+    orders.append((datetime.utcnow() - timedelta(days=1), "pending"))
+
+    for created_at, commission_status in orders:
+        order = Order(user_id=consumer.id, service_id=1, service_name="点赞", link="l", quantity=1,
+                      charge=Decimal("10"), created_at=created_at, rolled_up_at=created_at)
+        db.add(order)
+        db.flush()
+        db.add(CashbackRecord(user_id=consumer.id, order_id=order.id, amount=Decimal("0.2"),
+                              rate=Decimal("0.02"), created_at=created_at))
+        db.add(CommissionRecord(agent_id=agent.id, consumer_id=consumer.id, order_id=order.id,
+                                commission_type="direct", commission_rate=Decimal("0.1"),
+                                order_amount=Decimal("10"), commission_amount=Decimal("1"),
+                                status=commission_status, created_at=created_at))
+    db.commit()
+    return agent, consumer
+
+
+def test_archive_moves_settled_rows_in_batches():
+    """只归档已结算的旧订单，分批提交，统计和重建包含归档数据"""
+    engine, Session = _make_session()
+    db = Session()
+    agent, consumer = _seed(db)
+    assert archive.get_watermark(db) is None
+
+    report = archive.archive_settled(db, older_than_days=180, batch_size=1)
+    assert report.finished
+    assert (report.batches, report.orders, report.cashback_records, report.commission_records) == (2, 2, 2, 2)
+    assert db.query(Order).count() == 2
+    assert db.execute(text("SELECT COUNT(*) FROM archive.orders")).scalar() == 2
+
+    assert archive.count(db, Order) == 4
+    assert archive.count(db, Order, user_id=consumer.id, status="pending") == 4
+    assert archive.reaches_archive(db)
+    assert not archive.reaches_archive(db, datetime.utcnow() - timedelta(days=30))
+
+    # 重建代理统计时合并归档库
+    agent_stats.rebuild(db)
+    db.commit()
+    stats = db.get(AgentStats, agent.id)
+    assert stats.total_commission == Decimal("4")
+    assert stats.total_consumption == Decimal("40")
+
+    # 再次运行没有可归档的数据
+    assert archive.archive_settled(db, older_than_days=180).orders == 0
+
+
+def test_reads_union_archive_only_when_range_reaches_it(monkeypatch):
+    """翻页和导出在范围触及归档时合并读取"""
+    engine, Session = _make_session()
+    db = Session()
+    agent, consumer = _seed(db)
+    archive.archive_settled(db, older_than_days=180)
+
+    page, next_cursor, has_more = get_commission_page(db, agent.id, None, 3)
+    assert [item["status"] for item in page] == ["pending", "pending", "paid"]
+    assert has_more
+    assert all(item["order"]["service_name"] == "点赞" for item in page)
+    page, next_cursor, has_more = get_commission_page(db, agent.id, next_cursor, 3)
+    assert len(page) == 1 and not has_more
+
+    monkeypatch.setattr(export, "ReadSessionLocal", Session)
+    recent = b"".join(export.stream("orders", "ndjson", start=datetime.utcnow() - timedelta(days=30)))
+    everything = b"".join(export.stream("orders", "ndjson"))
+    assert len(recent.splitlines()) == 1
+    assert len(everything.splitlines()) == 4
+
+
+def test_simulation_includes_archived_orders():
+    """返佣模拟的统计区间触及归档时包含已归档的订单"""
+    engine, Session = _make_session()
+    db = Session()
+    _seed(db)
+    archive.archive_settled(db, older_than_days=180)
+    assert db.query(Order).count() == 2
+
+    assert run_simulation(db)["order_count"] == 4
+    assert run_simulation(db, start=datetime.utcnow() - timedelta(days=30))["order_count"] == 1
+
+
+def test_settlement_with_archived_records_cannot_be_reversed():
+    """结算批次中的返佣被归档后拒绝撤销，不做部分撤销"""
+    engine, Session = _make_session()
+    db = Session()
+    agent, consumer = _seed(db)
+    batch = commission_settlement.settle(db, agent_id=agent.id)
+    db.commit()
+    assert batch.record_count == 2
+
+    archive.archive_settled(db, older_than_days=180)
+    assert db.execute(text(
+        "SELECT COUNT(*) FROM archive.commission_records WHERE settlement_batch_id = :id"
+    ), {"id": batch.id}).scalar() == 1
+
+    try:
+        commission_settlement.reverse(db, batch.id)
+        assert False, "应当拒绝撤销"
+    except ValueError:
+        db.rollback()
+    assert db.get(CommissionSettlement, batch.id).status == "settled"
+    assert db.query(CommissionRecord).filter(CommissionRecord.settlement_batch_id == batch.id).count() == 1
+
+
+def test_read_engine_sees_new_watermark_immediately():
+    """读库与写库是不同引擎，归档推进水位线后读库立即合并归档库"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        engines = []
+        for _ in range(2):
+            engine = create_engine(f"sqlite:///{os.path.join(tmpdir, 'shop.db')}")
+            attach_archive(engine, os.path.join(tmpdir, "archive.db"))
+            engines.append(engine)
+        writer, reader = engines
+        Base.metadata.create_all(bind=writer)
+        archive.create_archive_tables(writer)
+
+        db = sessionmaker(bind=writer)()
+        read_db = sessionmaker(bind=reader)()
+        _seed(db)
+        assert not archive.reaches_archive(read_db)
+        read_db.rollback()
+
+        archive.archive_settled(db, older_than_days=180)
+        assert archive.reaches_archive(read_db)
+        assert read_db.query(archive.history(read_db, Order)).count() == 4
+
+        db.close()
+        read_db.close()
+        for engine in engines:
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    test_archive_moves_settled_rows_in_batches()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_reads_union_archive_only_when_range_reaches_it(monkeypatch)
+    test_simulation_includes_archived_orders()
+    test_settlement_with_archived_records_cannot_be_reversed()
+    test_read_engine_sees_new_watermark_immediately()
+    print("✅ 冷数据归档测试通过")
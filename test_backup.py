@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+测试在线数据库备份和保留策略
+"""
+import sys
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import backup
+
+
+def _make_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.executemany("INSERT INTO items (name) VALUES (?)", [("x" * 200,)] * rows)
+    conn.commit()
+    conn.close()
+
+
+def _touch(backup_dir, created_at, stem="shop"):
+    name = f"{stem}_backup_{created_at.strftime('%Y%m%d%H%M%S')}.db"
+    open(os.path.join(backup_dir, name), "wb").close()
+    return name
+
+
+def test_online_backup_copies_and_checks_integrity():
+    """分步备份得到完整可用的副本"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = os.path.join(tmpdir, "shop.db")
+        _make_db(source, 2000)
+
+        backup_dir = os.path.join(tmpdir, "backups")
+        status = backup.run_backup(source, backup_dir, pages=8, sleep=0)
+        assert status["success"], status
+        assert status["integrity"] == "ok"
+        assert status["file"].startswith("shop_backup_")
+        assert os.listdir(backup_dir) == [status["file"]]
+
+        copy = sqlite3.connect(os.path.join(backup_dir, status["file"]))
+        assert copy.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 2000
+        copy.close()
+
+
+def test_archive_is_backed_up_with_the_same_timestamp():
+    """归档库与主库成对备份，保留策略按组删除"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = os.path.join(tmpdir, "shop.db")
+        archive_path = os.path.join(tmpdir, "shop_archive.db")
+        _make_db(source, 10)
+        _make_db(archive_path, 300)
+
+        backup_dir = os.path.join(tmpdir, "backups")
+        os.makedirs(backup_dir)
+        now = datetime.now()
+        status = backup.run_backup(source, backup_dir, pages=8, sleep=0, archive_path=archive_path)
+        assert status["success"], status
+
+        names = [item["file"] for item in status["files"]]
+        assert [item["integrity"] for item in status["files"]] == ["ok", "ok"]
+        assert names[0] == status["file"] and names[1].startswith("shop_archive_backup_")
+        assert names[0].rsplit("_", 1)[1] == names[1].rsplit("_", 1)[1]
+        assert sorted(os.listdir(backup_dir)) == sorted(names)
+
+        copy = sqlite3.connect(os.path.join(backup_dir, names[1]))
+        assert copy.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 300
+        copy.close()
+
+        # 两组备份各含两个文件，keep_last=1 只保留最新一组
+        _touch(backup_dir, now - timedelta(days=30), "shop")
+        _touch(backup_dir, now - timedelta(days=30), "shop_archive")
+        removed = backup.apply_retention(backup_dir, keep_last=1, keep_daily_days=0, now=now)
+        assert len(removed) == 2
+        assert sorted(os.listdir(backup_dir)) == sorted(names)
+
+
+def test_retention_keeps_recent_and_daily():
+    """保留最近几份，以及最近若干天内每天最新的一份"""
+    with tempfile.TemporaryDirectory() as backup_dir:
+        now = datetime(2025, 3, 10, 12, 0, 0)
+        recent = [_touch(backup_dir, now - timedelta(hours=hours)) for hours in (1, 2, 3)]
+        daily_newest = _touch(backup_dir, now - timedelta(days=3, hours=1))
+        daily_older = _touch(backup_dir, now - timedelta(days=3, hours=5))
+        expired = _touch(backup_dir, now - timedelta(days=40))
+        open(os.path.join(backup_dir, "other.db"), "wb").close()
+
+        removed = backup.apply_retention(backup_dir, keep_last=2, keep_daily_days=7, now=now)
+        assert sorted(removed) == sorted([recent[2], daily_older, expired])
+        assert sorted(os.listdir(backup_dir)) == sorted(recent[:2] + [daily_newest, "other.db"])
+
+
+if __name__ == "__main__":
+    test_online_backup_copies_and_checks_integrity()
+    test_archive_is_backed_up_with_the_same_timestamp()
+    test_retention_keeps_recent_and_daily()
+    print("✅ 在线备份测试通过")
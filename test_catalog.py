@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+测试服务目录缓存、版本号和 ETag/gzip 响应
+"""
+import sys
+import os
+import gzip
+import json
+import asyncio
+from decimal import Decimal
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from app.database import get_db
+from app.models.user import User
+from app.models.service_price import ServicePrice
+from app.routers import dashboard
+from app.services import catalog
+from app.services.appfuwu_client import appfuwu_client
+from test_support import make_engine
+
+
+def _setup(monkeypatch):
+    """内存数据库 + 模拟上游目录"""
+    engine = make_engine()
+    Session = sessionmaker(bind=engine)
+
+    calls = []
+
+    async def fake_services():
+        calls.append(1)
+        return {"douyin": [{"id": 1, "name": "点赞", "price": 2.0, "min_quantity": 1, "max_quantity": 10}],
+                "weibo": [{"id": 2, "name": "转发", "price": 3.0, "min_quantity": 1, "max_quantity": 10}]}
+
+    monkeypatch.setattr(appfuwu_client, "get_services_by_platform", fake_services)
+    catalog.invalidate()
+    catalog._payload_cache.clear()
+    return Session, calls
+
+
+def test_catalog_version_follows_prices_and_caches_upstream(monkeypatch):
+    Session, calls = _setup(monkeypatch)
+    db = Session()
+
+    first = asyncio.run(catalog.get_catalog(db))
+    again = asyncio.run(catalog.get_catalog(db))
+    assert again is first
+    assert len(calls) == 1
+
+    db.add(ServicePrice(service_id=1, service_name="抖音点赞", api_price=Decimal("2"), customer_price=Decimal("2.5")))
+    db.commit()
+    priced = asyncio.run(catalog.get_catalog(db))
+    assert priced.version != first.version
+    assert len(calls) == 1
+
+    services = json.loads(priced.body)["services"]
+    assert services["douyin"][0]["name"] == "抖音点赞"
+    assert services["douyin"][0]["price"] == 2.5
+    assert services["weibo"][0]["api_price"] == 3.0
+    assert gzip.decompress(priced.gzipped) == priced.body
+
+
+def test_catalog_endpoint_etag_and_gzip(monkeypatch):
+    Session, _ = _setup(monkeypatch)
+
+    async def fake_current_user(request):
+        return User(id=1, email="u@example.com", username="u")
+
+    def override_db():
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    monkeypatch.setattr(dashboard, "get_current_user", fake_current_user)
+    app = FastAPI()
+    app.include_router(dashboard.router, prefix="/admin")
+    app.dependency_overrides[get_db] = override_db
+    client = TestClient(app)
+
+    response = client.get("/admin/catalog", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["cache-control"] == "private, no-cache"
+    etag = response.headers["etag"]
+    version = response.json()["version"]
+    assert etag == f'"{version}"'
+
+    versioned = client.get(f"/admin/catalog?v={version}")
+    assert "immutable" in versioned.headers["cache-control"]
+
+    not_modified = client.get("/admin/catalog", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+    plain = client.get("/admin/catalog", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.json()["version"] == version
+
+    # q=0 表示拒绝该编码，* 覆盖未单独列出的编码
+    for accept_encoding in ("gzip;q=0", "br, gzip; q=0.0", "*;q=0", "*, gzip;q=0"):
+        refused = client.get("/admin/catalog", headers={"Accept-Encoding": accept_encoding})
+        assert "content-encoding" not in refused.headers, accept_encoding
+        assert refused.json()["version"] == version
+    for accept_encoding in ("gzip;q=0.5, identity", "*", "br;q=0, GZIP"):
+        zipped = client.get("/admin/catalog", headers={"Accept-Encoding": accept_encoding})
+        assert zipped.headers["content-encoding"] == "gzip", accept_encoding
+
+
+if __name__ == "__main__":
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_catalog_version_follows_prices_and_caches_upstream(monkeypatch)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_catalog_endpoint_etag_and_gzip(monkeypatch)
+    print("✅ 服务目录测试通过")
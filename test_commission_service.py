@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+测试返佣计算服务
+"""
+import sys
+import os
+import asyncio
+from decimal import Decimal
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.models.user import User
+from app.models.order import Order
+from app.models.commission import CommissionRecord, CommissionConfig, CommissionSettlement
+from app.models.outbox import OutboxEvent
+from app.services.commission_service import CommissionService
+from app.services.commission_worker import publish_order_created, process_batch
+from app.services.commission_rules import get_rate_table, invalidate_rate_table, LevelRule
+from app.services.commission_simulator import run_simulation, run_simulation_in_thread
+from app.services.commission_recompute import recompute_commissions, load_checkpoint
+from app.services import commission_settlement, commission_simulator
+from test_support import make_session, count_statements
+
+
+def _make_session():
+    """创建内存数据库会话，并清空费率表缓存"""
+    invalidate_rate_table()
+    return make_session()
+
+
+def _seed_chain(db, depth: int = 5):
+    """创建一条邀请链：users[0] 邀请 users[1] ... 最后一个为消费者"""
+    users = []
+    inviter_id = None
+    for i in range(depth):
+        user = User(
+            email=f"user{i}@example.com", username=f"user{i}", password_hash="x",
+            inviter_id=inviter_id, is_agent=i != 2, agent_level=1 if i != 2 else 0
+        )
+        db.add(user)
+        db.flush()
+        users.append(user)
+        inviter_id = user.id
+    db.commit()
+    return users
+
+
+def test_invite_chain_is_one_query_and_ordered():
+    """邀请链一次查询返回，由近到远排序"""
+    engine, db = _make_session()
+    users = _seed_chain(db)
+    ids = [u.id for u in users]
+    get_rate_table(db)  # 预先编译费率表，只统计邀请链查询
+
+    statements = count_statements(engine)
+
+    chain = CommissionService(db)._get_invite_chain(ids[-1])
+    assert len(statements) == 1
+    assert [row.id for row in chain] == [ids[3], ids[2], ids[1]]
+    assert [row.is_agent for row in chain] == [True, False, True]
+
+
+def test_invite_chain_honours_configured_max_levels():
+    """邀请链层级受返佣配置的 max_levels 限制"""
+    engine, db = _make_session()
+    users = _seed_chain(db)
+    db.add(CommissionConfig(agent_level=1, direct_rate=Decimal("0.1"), indirect_rate=Decimal("0.05"), max_levels=2))
+    db.commit()
+
+    chain = CommissionService(db)._get_invite_chain(users[-1].id)
+    assert [row.id for row in chain] == [users[3].id, users[2].id]
+
+    chain = CommissionService(db)._get_invite_chain(users[-1].id, max_levels=4)
+    assert len(chain) == 4
+
+
+def _order(db, user, charge="100.00"):
+    order = Order(user_id=user.id, service_id=1, service_name="抖音点赞", link="https://example.com", quantity=100, charge=Decimal(charge))
+    db.add(order)
+    db.flush()
+    return order
+
+
+def test_calculate_commission_credits_agents_in_chain():
+    """只为链上的代理生成返佣并入账"""
+    engine, db = _make_session()
+    users = _seed_chain(db)
+    order = _order(db, users[-1])
+    db.commit()
+
+    rows = asyncio.run(CommissionService(db).calculate_commission(order))
+    db.commit()
+    assert [r["agent_id"] for r in rows] == [users[3].id, users[1].id]
+
+    db.expire_all()
+    assert db.query(CommissionRecord).count() == 2
+    direct_agent = db.get(User, users[3].id)
+    assert Decimal(str(direct_agent.total_direct_commission)) > 0
+    assert Decimal(str(direct_agent.balance)) == Decimal(str(direct_agent.total_commission))
+
+
+def test_outbox_worker_is_idempotent():
+    """发件箱事件批量处理，重复处理不会重复返佣"""
+    engine, db = _make_session()
+    users = _seed_chain(db)
+    for _ in range(3):
+        publish_order_created(db, _order(db, users[-1]))
+    db.commit()
+
+    assert process_batch(db) == 3
+    assert db.query(CommissionRecord).count() == 6
+    assert db.query(OutboxEvent).filter(OutboxEvent.status == "done").count() == 3
+
+    # 模拟事件被重新投递
+    db.query(OutboxEvent).update({OutboxEvent.status: "pending"})
+    db.commit()
+    process_batch(db)
+    db.expire_all()
+    assert db.query(CommissionRecord).count() == 6
+    direct_agent = db.get(User, users[3].id)
+    assert Decimal(str(direct_agent.total_commission)) == Decimal("15")
+
+
+def test_rate_table_prefers_agent_overrides_then_level_config():
+    """个人比例优先，其次代理等级配置，查费率不访问数据库"""
+    engine, db = _make_session()
+    users = _seed_chain(db)
+    db.add(CommissionConfig(agent_level=1, direct_rate=Decimal("0.1"), indirect_rate=Decimal("0.05"), max_levels=3))
+    users[3].direct_commission_rate = Decimal("0.2")
+    db.commit()
+    chain_ids = [users[3].id, users[2].id, users[1].id, users[0].id]
+
+    table = get_rate_table(db)
+    statements = count_statements(engine)
+
+    rates = table.rates_for_chain(chain_ids)
+    assert get_rate_table(db) is table
+    assert statements == []
+    assert rates == [
+        (users[3].id, "direct", Decimal("0.2")),
+        (users[1].id, "indirect", Decimal("0.05")),
+    ]
+
+    # 修改配置后失效缓存，新的比例生效
+    users[3].direct_commission_rate = Decimal("0")
+    db.commit()
+    invalidate_rate_table()
+    assert get_rate_table(db).rates_for_chain(chain_ids)[0] == (users[3].id, "direct", Decimal("0.1"))
+
+
+def test_simulation_matches_row_calculation():
+    """向量化模拟结果与逐单计算一致，且不写返佣记录"""
+    engine, db = _make_session()
+    users = _seed_chain(db)
+    orders = [_order(db, users[-1], "100.00"), _order(db, users[3], "50.00")]
+    db.commit()
+
+    expected = {}
+    for row in CommissionService(db).build_commission_rows(orders):
+        expected[row["agent_id"]] = expected.get(row["agent_id"], 0) + float(row["commission_amount"])
+
+    result = run_simulation(db, levels={1: LevelRule(Decimal("0.1"), Decimal("0.02"), 3)})
+    assert result["order_count"] == 2
+    assert abs(result["total_current"] - sum(expected.values())) < 1e-6
+    # 直接返佣比例 0.05 -> 0.1，只影响是代理的直接上级
+    assert result["agents"] == [{"agent_id": users[3].id, "current": expected[users[3].id], "proposed": 10.0, "delta": 5.0}]
+    assert db.query(CommissionRecord).count() == 0
+
+
+def test_simulation_thread_opens_its_own_session(monkeypatch):
+    """线程池中的模拟使用独立会话，不借用请求的会话"""
+    engine, db = _make_session()
+    users = _seed_chain(db)
+    _order(db, users[-1], "100.00")
+    db.commit()
+    db.close()
+
+    sessions = []
+
+    def read_session():
+        session = sessionmaker(bind=engine)()
+        sessions.append(session)
+        return session
+
+    monkeypatch.setattr(commission_simulator, "ReadSessionLocal", read_session)
+    levels = {1: LevelRule(Decimal("0.1"), Decimal("0.02"), 3)}
+    result = asyncio.run(asyncio.to_thread(run_simulation_in_thread, levels))
+    assert len(sessions) == 1
+    assert result["order_count"] == 1
+    assert result["total_delta"] == 5.0
+
+
+def test_recompute_corrects_drift_and_resumes():
+    """修正返佣比例后重算历史返佣和统计，支持试运行和断点续跑"""
+    engine, db = _make_session()
+    users = _seed_chain(db)
+    for _ in range(3):
+        publish_order_created(db, _order(db, users[-1]))
+    db.commit()
+    process_batch(db)
+
+    # 返佣比例被修正后历史返佣需要重算；另外代理统计被改乱
+    db.add(CommissionConfig(agent_level=1, direct_rate=Decimal("0.1"), indirect_rate=Decimal("0.05"), max_levels=3))
+    db.get(User, users[1].id).total_indirect_commission = Decimal("999")
+    db.commit()
+    invalidate_rate_table()
+
+    report = recompute_commissions(db, dry_run=True)
+    assert (report.missing, report.changed, report.finished) == (0, 6, True)
+    assert report.to_dict()["total_delta"] == 24.0
+    assert db.query(CommissionRecord).filter(CommissionRecord.commission_rate == Decimal("0.1")).count() == 0
+
+    # 每批一个订单，只跑一批后中断
+    report = recompute_commissions(db, chunk_size=1, max_chunks=1)
+    assert not report.finished
+    assert load_checkpoint(db) == report.last_order_id
+
+    report = recompute_commissions(db, chunk_size=1)
+    assert report.finished and report.start_after > 0
+    assert report.totals_fixed == 1
+    assert load_checkpoint(db) == 0
+
+    db.expire_all()
+    assert db.query(CommissionRecord).count() == 6
+    for agent, expected in ((users[3], Decimal("30")), (users[1], Decimal("15"))):
+        agent = db.get(User, agent.id)
+        assert Decimal(str(agent.total_commission)) == expected
+        assert Decimal(str(agent.balance)) == expected
+    assert Decimal(str(db.get(User, users[1].id).total_indirect_commission)) == Decimal("15")
+
+    # 再次运行没有差异
+    report = recompute_commissions(db)
+    assert (report.missing, report.changed, report.cancelled, report.totals_fixed) == (0, 0, 0, 0)
+
+
+def test_settlement_is_one_update_and_reversible():
+    """按代理批量结算为一条 UPDATE，生成批次且可撤销"""
+    engine, db = _make_session()
+    users = _seed_chain(db)
+    for _ in range(3):
+        publish_order_created(db, _order(db, users[-1]))
+    db.commit()
+    process_batch(db)
+    agent_id = users[3].id
+
+    updates = count_statements(engine, "UPDATE commission_records")
+
+    batch = commission_settlement.settle(db, agent_id=agent_id)
+    db.commit()
+    assert len(updates) == 1
+    assert (batch.record_count, Decimal(str(batch.total_amount))) == (3, Decimal("15"))
+    assert db.query(CommissionRecord).filter(CommissionRecord.status == "pending").count() == 3
+
+    # 已结算的不会重复结算
+    try:
+        commission_settlement.settle(db, agent_id=agent_id)
+        assert False, "应当没有待结算的返佣"
+    except ValueError:
+        db.rollback()
+    assert db.query(CommissionSettlement).count() == 1
+
+    commission_settlement.reverse(db, batch.id)
+    db.commit()
+    assert db.query(CommissionRecord).filter(CommissionRecord.status == "pending").count() == 6
+    assert db.get(CommissionSettlement, batch.id).status == "reversed"
+
+    # 单条支付也走结算批次
+    record_id = db.query(CommissionRecord.id).first()[0]
+    assert CommissionService(db).pay_commission(record_id)
+    assert db.get(CommissionRecord, record_id).settlement_batch_id is not None
+
+
+if __name__ == "__main__":
+    test_invite_chain_is_one_query_and_ordered()
+    test_invite_chain_honours_configured_max_levels()
+    test_calculate_commission_credits_agents_in_chain()
+    test_outbox_worker_is_idempotent()
+    test_rate_table_prefers_agent_overrides_then_level_config()
+    test_simulation_matches_row_calculation()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_simulation_thread_opens_its_own_session(monkeypatch)
+    test_recompute_corrects_drift_and_resumes()
+    test_settlement_is_one_update_and_reversible()
+    print("✅ 返佣服务测试通过")
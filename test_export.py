@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+测试流式数据导出
+"""
+import sys
+import os
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.models.user import User
+from app.models.order import Order
+from app.services import export
+from test_support import make_engine
+
+
+def _make_session(monkeypatch):
+    """创建内存数据库，导出使用同一个引擎"""
+    engine = make_engine()
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(export, "ReadSessionLocal", Session)
+    return engine, Session()
+
+
+def _seed(db, count):
+    alice = User(email="a@example.com", username="a", password_hash="x")
+    bob = User(email="b@example.com", username="b", password_hash="x")
+    db.add_all([alice, bob])
+    db.flush()
+    for i in range(count):
+        db.add(Order(user_id=alice.id if i % 2 else bob.id, service_id=1, service_name="点赞, 评论", link="l",
+                     quantity=1, charge=Decimal("0.1"), created_at=datetime(2024, 1, 1 + i % 3)))
+    db.commit()
+    return alice, bob
+
+
+def test_csv_streams_in_chunks(monkeypatch):
+    """CSV 先输出表头，之后按批输出，字段正确转义"""
+    engine, db = _make_session(monkeypatch)
+    _seed(db, export.FETCH_SIZE * 2 + 5)
+
+    chunks = list(export.stream("orders", "csv"))
+    assert len(chunks) == 4
+    text = b"".join(chunks).decode("utf-8").lstrip("\ufeff")
+    rows = list(csv.DictReader(io.StringIO(text)))
+    assert len(rows) == export.FETCH_SIZE * 2 + 5
+    assert rows[0]["service_name"] == "点赞, 评论"
+    assert rows[0]["charge"] == "0.1000"
+
+
+def test_ndjson_filters_by_date_and_user(monkeypatch):
+    """NDJSON 按日期范围和用户筛选"""
+    engine, db = _make_session(monkeypatch)
+    alice, bob = _seed(db, 30)
+
+    body = b"".join(export.stream(
+        "orders", "ndjson", start=datetime(2024, 1, 2), end=datetime(2024, 1, 3), user_id=alice.id
+    ))
+    rows = [json.loads(line) for line in body.decode("utf-8").splitlines()]
+    assert rows
+    assert all(row["user_id"] == alice.id and row["created_at"].startswith("2024-01-02") for row in rows)
+    assert [row["id"] for row in rows] == sorted(row["id"] for row in rows)
+
+
+if __name__ == "__main__":
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_csv_streams_in_chunks(monkeypatch)
+        test_ndjson_filters_by_date_and_user(monkeypatch)
+    print("✅ 数据导出测试通过")
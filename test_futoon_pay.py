@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+测试富通支付异步客户端：共享连接池、签名下单和调用截止时间
+"""
+import sys
+import os
+import asyncio
+from urllib.parse import parse_qs
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+from app.services.futoon_pay import FutoonPay, FutoonPayConfig
+
+
+def _client(handler):
+    """用模拟传输构造客户端"""
+    config = FutoonPayConfig(pid="1000", key="secret", api_url="https://pay.test/mapi.php",
+                             query_url="https://pay.test/api.php")
+    return FutoonPay(config, http=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+
+def test_create_and_query_share_one_client():
+    seen = []
+
+    async def handler(request):
+        seen.append(request)
+        if request.url.path == "/mapi.php":
+            return httpx.Response(200, json={"code": 1, "trade_no": "T1", "payurl": "https://pay.test/p"})
+        return httpx.Response(200, json={"code": 1, "status": 1, "out_trade_no": "FT1"})
+
+    async def run():
+        fp = _client(handler)
+        try:
+            created = await fp.create_order(out_trade_no="FT1", name="充值", money="10.00", payment_type="alipay",
+                                            notify_url="https://x/n", return_url="https://x/r", client_ip="1.2.3.4",
+                                            param="7")
+            queried = await fp.query_order("FT1")
+            unsupported = await fp.create_order(out_trade_no="FT2", name="充值", money="1", payment_type="bank",
+                                                notify_url="n", return_url="r", client_ip="1.2.3.4")
+        finally:
+            await fp.aclose()
+        return fp, created, queried, unsupported
+
+    fp, created, queried, unsupported = asyncio.run(run())
+    assert created["success"] and created["trade_no"] == "T1"
+    assert queried["success"] and queried["order_info"]["out_trade_no"] == "FT1"
+    assert not unsupported["success"]
+    assert len(seen) == 2
+
+    form = {k: v[0] for k, v in parse_qs(seen[0].content.decode()).items()}
+    assert form["type"] == "alipay" and form["param"] == "7"
+    assert fp.verify_notify(form)
+    assert seen[1].url.params["act"] == "order"
+
+
+def test_slow_gateway_hits_deadline_without_blocking_loop():
+    async def handler(request):
+        await asyncio.sleep(5)
+        return httpx.Response(200, json={"code": 1})
+
+    async def run():
+        fp = _client(handler)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            result = await fp.query_order("FT1", timeout=0.2)
+        finally:
+            task.cancel()
+            await fp.aclose()
+        return result, loop.time() - started, ticks
+
+    result, elapsed, ticks = asyncio.run(run())
+    assert not result["success"] and "超时" in result["message"]
+    assert elapsed < 1
+    # 等待网关期间事件循环仍在处理其他任务
+    assert ticks >= 5
+
+
+if __name__ == "__main__":
+    test_create_and_query_share_one_client()
+    test_slow_gateway_hits_deadline_without_blocking_loop()
+    print("✅ 富通支付客户端测试通过")
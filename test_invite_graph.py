@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+测试邀请关系闭包表
+"""
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from app.models.user import User
+from app.models.invite_closure import InviteClosure
+from app.services import invite_graph
+from test_support import make_session
+
+
+def _add(db, name, inviter=None):
+    """注册用户并维护闭包表"""
+    user = User(email=f"{name}@example.com", username=name, password_hash="x", inviter_id=inviter.id if inviter else None)
+    db.add(user)
+    db.flush()
+    invite_graph.add_user(db, user.id, user.inviter_id)
+    return user
+
+
+def _closure(db):
+    return sorted((r.ancestor_id, r.descendant_id, r.depth) for r in db.query(InviteClosure).all())
+
+
+def _seed(db):
+    """a -> b -> c -> d，a -> e"""
+    a = _add(db, "a")
+    b = _add(db, "b", a)
+    c = _add(db, "c", b)
+    d = _add(db, "d", c)
+    e = _add(db, "e", a)
+    db.commit()
+    return a, b, c, d, e
+
+
+def test_incremental_closure_matches_rebuild():
+    """增量维护结果与全量重建一致"""
+    _, db = make_session()
+    _seed(db)
+    incremental = _closure(db)
+    invite_graph.rebuild(db)
+    assert _closure(db) == incremental
+
+
+def test_subtree_counts_and_ancestors():
+    """子树、按层级计数、祖先链"""
+    _, db = make_session()
+    a, b, c, d, e = _seed(db)
+
+    assert {u.id for u, _ in invite_graph.get_subtree(db, b.id)} == {b.id, c.id, d.id}
+    assert invite_graph.get_descendant_counts(db, a.id) == {1: 2, 2: 1, 3: 1}
+    assert [u.id for u, _ in invite_graph.get_ancestors(db, d.id)] == [c.id, b.id, a.id]
+
+    tree = invite_graph.build_tree(invite_graph.get_subtree(db, a.id, max_depth=2), a.id)
+    assert tree["children_count"] == 2
+    assert [child["user"].id for child in tree["children"][0]["children"]] == [c.id]
+
+
+def test_move_subtree_and_reject_cycles():
+    """修改邀请人后子树随之移动，不允许成环"""
+    _, db = make_session()
+    a, b, c, d, e = _seed(db)
+
+    invite_graph.move_subtree(db, c.id, e.id)
+    db.commit()
+    db.expire_all()
+    assert db.get(User, c.id).inviter_id == e.id
+    assert [u.id for u, _ in invite_graph.get_ancestors(db, d.id)] == [c.id, e.id, a.id]
+
+    moved = _closure(db)
+    invite_graph.rebuild(db)
+    assert _closure(db) == moved
+
+    with pytest.raises(ValueError):
+        invite_graph.move_subtree(db, a.id, d.id)
+
+
+if __name__ == "__main__":
+    test_incremental_closure_matches_rebuild()
+    test_subtree_counts_and_ancestors()
+    test_move_subtree_and_reject_cycles()
+    print("✅ 邀请关系闭包表测试通过")
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+测试整数最小单位金额类型
+"""
+import sys
+import os
+from decimal import Decimal
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import func, text
+
+from app.models.user import User
+from app.models.order import Order
+from app.models.money import to_minor, from_minor, quantize
+from test_support import make_session
+
+
+def test_conversions_round_half_up():
+    """金额与最小单位互转，四舍五入"""
+    assert to_minor(Decimal("12.345")) == 1235
+    assert to_minor(0.1 + 0.2) == 30
+    assert to_minor("1.23456", 4) == 12346
+    assert to_minor(-Decimal("0.005")) == -1
+    assert from_minor(1235) == Decimal("12.35")
+    assert from_minor(12346, 4) == Decimal("1.2346")
+    assert quantize(None) == Decimal("0.00")
+
+
+def test_money_columns_store_integers_and_sum_exactly():
+    """金额列存整数，SQL 聚合和运算结果精确"""
+    engine, db = make_session()
+    user = User(email="a@example.com", username="a", password_hash="x", balance=Decimal("10.10"))
+    db.add(user)
+    db.flush()
+    for _ in range(10):
+        db.add(Order(user_id=user.id, service_id=1, service_name="s", link="l", quantity=1, charge=Decimal("0.1")))
+    db.commit()
+
+    raw = db.execute(text("SELECT balance, typeof(balance) FROM users")).one()
+    assert tuple(raw) == (101000, "integer")
+    assert db.query(func.sum(Order.charge)).scalar() == Decimal("1")
+
+    db.query(User).filter(User.id == user.id).update({User.balance: User.balance - Decimal("0.2")})
+    db.commit()
+    db.expire_all()
+    assert db.get(User, user.id).balance == Decimal("9.90")
+    assert db.query(User).filter(User.balance > Decimal("9.89")).count() == 1
+
+
+if __name__ == "__main__":
+    test_conversions_round_half_up()
+    test_money_columns_store_integers_and_sum_exactly()
+    print("✅ 金额类型测试通过")
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+测试密码哈希线程池和准入控制
+"""
+import sys
+import os
+import asyncio
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from passlib.context import CryptContext
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.services.passwords import PasswordHasher, PasswordHasherBusy, admission_limit
+
+
+class _SlowContext:
+    """模拟耗时的哈希计算，记录最大并发数"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.running = 0
+        self.peak = 0
+        self.threads = set()
+        self._lock = threading.Lock()
+
+    def hash(self, password):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            self.threads.add(threading.current_thread().name)
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+        return f"hashed:{password}"
+
+
+def _sha_context(rounds):
+    return CryptContext(
+        schemes=["sha256_crypt"],
+        sha256_crypt__default_rounds=rounds,
+        sha256_crypt__min_rounds=rounds,
+        sha256_crypt__max_rounds=rounds
+    )
+
+
+def test_hashing_runs_off_loop_with_bounded_concurrency():
+    """哈希在线程池中执行，并发数不超过上限，超出排队上限时拒绝"""
+    context = _SlowContext(0.05)
+    hasher = PasswordHasher(context, max_workers=2, max_pending=3, queue_timeout=5)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        tick_task = asyncio.create_task(ticker())
+        results = await asyncio.gather(*[hasher.hash(str(i)) for i in range(8)], return_exceptions=True)
+        tick_task.cancel()
+        return results, ticks
+
+    results, ticks = asyncio.run(scenario())
+    hashed = [result for result in results if isinstance(result, str)]
+    busy = [result for result in results if isinstance(result, PasswordHasherBusy)]
+    # 2 个立即执行 + 3 个排队，其余被拒绝
+    assert len(hashed) == 5 and len(busy) == 3
+    assert context.peak == 2
+    assert all(name.startswith("password-hash") for name in context.threads)
+    # 计算期间事件循环没有被阻塞
+    assert ticks > 10
+
+
+def test_queue_timeout_rejects():
+    """排队超时返回繁忙"""
+    hasher = PasswordHasher(_SlowContext(0.2), max_workers=1, max_pending=10, queue_timeout=0.05)
+
+    async def scenario():
+        return await asyncio.gather(hasher.hash("a"), hasher.hash("b"), return_exceptions=True)
+
+    first, second = asyncio.run(scenario())
+    assert first == "hashed:a"
+    assert isinstance(second, PasswordHasherBusy)
+
+
+def test_rehash_when_cost_factor_changes():
+    """成本因子变化后，校验通过时返回新哈希"""
+    old_hash = _sha_context(5000).hash("secret")
+    hasher = PasswordHasher(_sha_context(6000), max_workers=1, max_pending=4, queue_timeout=5)
+
+    valid, new_hash = asyncio.run(hasher.verify_and_update("secret", old_hash))
+    assert valid and new_hash and "rounds=6000" in new_hash
+    assert asyncio.run(hasher.verify_and_update("secret", new_hash)) == (True, None)
+    assert asyncio.run(hasher.verify("wrong", new_hash)) is False
+
+
+class _SlowVerifyContext:
+    """模拟耗时的密码校验"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def verify_and_update(self, password, password_hash):
+        time.sleep(self.delay)
+        return password == password_hash, None
+
+
+def test_concurrent_logins_do_not_hold_pool_connections(tmp_path, monkeypatch):
+    """等待哈希期间不占用连接：并发登录数远超连接池容量时事件循环也不会卡在借连接上"""
+    import app.database as database
+    from app.models import user as user_model
+    from app.models.user import User, authenticate_user
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'users.db'}", connect_args={"check_same_thread": False},
+                           pool_size=2, max_overflow=0, pool_timeout=1)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    db.add_all([User(email=f"u{i}@example.com", username=f"u{i}", password_hash=f"pw{i}") for i in range(12)])
+    db.commit()
+    db.close()
+
+    monkeypatch.setattr(database, "SessionLocal", Session)
+    monkeypatch.setattr(user_model, "password_hasher",
+                        PasswordHasher(_SlowVerifyContext(0.05), max_workers=1, max_pending=16, queue_timeout=5))
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        results = await asyncio.gather(
+            *(authenticate_user(f"u{i}@example.com", f"pw{i}") for i in range(12)),
+            authenticate_user("u0@example.com", "wrong"),
+            return_exceptions=True
+        )
+        elapsed = loop.time() - started
+        task.cancel()
+        return results, elapsed, ticks
+
+    results, elapsed, ticks = asyncio.run(scenario())
+    assert [getattr(result, "email", result) for result in results[:12]] == [f"u{i}@example.com" for i in range(12)]
+    assert results[12] is None
+    # 13 次校验串行约 0.65 秒；事件循环在此期间持续运行
+    assert elapsed < 3
+    assert ticks >= elapsed / 0.01 * 0.5
+
+
+def test_admission_limit_respects_pool_capacity():
+    """排队上限不超过连接池容量减去哈希线程数"""
+    assert admission_limit(64, 4, 15) == 11
+    assert admission_limit(8, 4, 15) == 8
+    assert admission_limit(8, 20, 15) == 0
+
+
+if __name__ == "__main__":
+    test_hashing_runs_off_loop_with_bounded_concurrency()
+    test_queue_timeout_rejects()
+    test_rehash_when_cost_factor_changes()
+    with tempfile.TemporaryDirectory() as tmpdir, pytest.MonkeyPatch.context() as monkeypatch:
+        test_concurrent_logins_do_not_hold_pool_connections(Path(tmpdir), monkeypatch)
+    test_admission_limit_respects_pool_capacity()
+    print("✅ 密码哈希测试通过")
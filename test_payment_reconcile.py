@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+测试支付对账：并发上限、与回调共用的幂等入账和过期处理
+"""
+import sys
+import os
+import asyncio
+import tempfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models.user import User
+from app.models.payment_intent import PaymentIntent
+from app.models.recharge_record import RechargeRecord
+from app.services import payments, payment_reconcile, wallet
+from app.services.futoon_pay import FutoonPay, FutoonPayConfig
+
+
+def _make_session(path, monkeypatch):
+    """创建临时文件数据库，并让对账使用同一个库（对账在多个线程中各自开会话，不能共用一个连接）"""
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(payment_reconcile, "SessionLocal", Session)
+    return Session
+
+
+def test_reconcile_settles_expires_and_bounds_concurrency(tmp_path, monkeypatch):
+    Session = _make_session(tmp_path / "payments.db", monkeypatch)
+    db = Session()
+    user = User(email="payer@example.com", username="payer", password_hash="x")
+    db.add(user)
+    db.flush()
+    user_id = user.id
+
+    now = datetime(2026, 1, 2, 12, 0, 0)
+    ages = {
+        "PAID": timedelta(minutes=30),      # 网关已支付，回调丢失
+        "RACE": timedelta(minutes=30),      # 查询期间回调先到
+        "OLD": timedelta(hours=30),         # 网关无此订单且已过期
+        "WAIT": timedelta(hours=2),         # 未支付、未过期
+        "FRESH": timedelta(minutes=1),      # 刚创建，不查询
+    }
+    for no in ages:
+        payments.create_intent(db, no, user_id, Decimal("20"), "wechat")
+    db.flush()
+    for no, age in ages.items():
+        db.query(PaymentIntent).filter_by(out_trade_no=no).update({"created_at": now - age})
+    for i in range(8):
+        payments.create_intent(db, f"BULK{i}", user_id, Decimal("1"), "wechat")
+        db.query(PaymentIntent).filter_by(out_trade_no=f"BULK{i}").update({"created_at": now - timedelta(hours=1)})
+    db.commit()
+
+    running = 0
+    peak = 0
+    queried = []
+
+    async def handler(request):
+        nonlocal running, peak
+        no = request.url.params["out_trade_no"]
+        queried.append(no)
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        if no == "RACE":
+            session = Session()
+            payments.settle(session, no, Decimal("20"), "GW-RACE")
+            session.commit()
+            session.close()
+        if no in ("PAID", "RACE"):
+            return httpx.Response(200, json={"code": 1, "status": 1, "money": "20.00", "trade_no": f"GW-{no}"})
+        if no == "OLD":
+            return httpx.Response(200, json={"code": -1, "msg": "订单不存在"})
+        return httpx.Response(200, json={"code": 1, "status": 0, "money": "1.00"})
+
+    client = FutoonPay(FutoonPayConfig(pid="1", key="k"), http=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async def run():
+        try:
+            return await payment_reconcile.reconcile(client, now=now, min_age_seconds=300, expire_hours=24,
+                                                     batch_size=100, concurrency=3, rate=0)
+        finally:
+            await client.aclose()
+
+    report = asyncio.run(run())
+
+    assert "FRESH" not in queried
+    assert report.checked == 12
+    assert peak <= 3
+    assert report.credited == 1 and report.already_paid == 1
+    assert report.expired == 1 and report.still_pending == 9
+    assert report.errors == []
+
+    db.expire_all()
+    status = dict(db.query(PaymentIntent.out_trade_no, PaymentIntent.status).all())
+    assert status["PAID"] == status["RACE"] == payments.PAID
+    assert status["OLD"] == payments.EXPIRED
+    assert status["WAIT"] == status["FRESH"] == payments.PENDING
+    assert db.query(RechargeRecord).count() == 2
+    assert wallet.get_balance(db, user_id) == Decimal("40")
+
+    payment_reconcile.save_report(report)
+    assert payment_reconcile.load_report(db)["credited"] == 1
+
+
+def test_rate_limiter_spaces_requests():
+    async def run():
+        limiter = payment_reconcile.RateLimiter(50)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await asyncio.gather(*(limiter.wait() for _ in range(6)))
+        return loop.time() - started
+
+    # 6 次请求按 20ms 间隔放行，至少耗时 100ms
+    assert asyncio.run(run()) >= 0.09
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmpdir, pytest.MonkeyPatch.context() as monkeypatch:
+        test_reconcile_settles_expires_and_bounds_concurrency(Path(tmpdir), monkeypatch)
+    test_rate_limiter_spaces_requests()
+    print("✅ 支付对账测试通过")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+测试支付订单的幂等入账和富通回调
+"""
+import sys
+import os
+from decimal import Decimal
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from app.database import get_db
+from app.models.user import User
+from app.models.payment_intent import PaymentIntent
+from app.models.recharge_record import RechargeRecord
+from app.routers import recharge
+from app.services import payments, wallet
+from app.services.futoon_pay import get_futoon_client
+from test_support import make_engine
+
+
+def _make_session():
+    """创建内存数据库会话"""
+    engine = make_engine()
+    return sessionmaker(bind=engine)
+
+
+def _seed(db):
+    user = User(email="payer@example.com", username="payer", password_hash="x")
+    db.add(user)
+    db.flush()
+    payments.create_intent(db, "FT1", user.id, Decimal("50.00"), "alipay")
+    db.commit()
+    return user.id
+
+
+def test_settle_credits_exactly_once():
+    Session = _make_session()
+    db = Session()
+    user_id = _seed(db)
+
+    assert payments.settle(db, "FT1", Decimal("49.00")) == payments.AMOUNT_MISMATCH
+    assert payments.settle(db, "FT404", Decimal("50")) == payments.UNKNOWN
+
+    # 下单失败后仍收到到账确认，照常入账
+    payments.mark_failed(db, "FT1")
+    db.commit()
+    assert payments.settle(db, "FT1", Decimal("50"), "T100") == payments.CREDITED
+    db.commit()
+    for _ in range(3):
+        assert payments.settle(db, "FT1", Decimal("50.00"), "T100") == payments.ALREADY_PAID
+        db.commit()
+
+    intent = db.query(PaymentIntent).filter_by(out_trade_no="FT1").one()
+    assert intent.status == payments.PAID and intent.trade_no == "T100"
+    assert db.query(RechargeRecord).count() == 1
+    assert intent.recharge_record_id == db.query(RechargeRecord.id).scalar()
+    assert wallet.get_balance(db, user_id) == Decimal("50")
+
+
+def test_notify_verifies_signature_and_ignores_retries():
+    Session = _make_session()
+    db = Session()
+    user_id = _seed(db)
+
+    def override_db():
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app = FastAPI()
+    app.include_router(recharge.router)
+    app.dependency_overrides[get_db] = override_db
+    client = TestClient(app)
+
+    fp = get_futoon_client()
+    params = {"out_trade_no": "FT1", "trade_no": "T1", "trade_status": "TRADE_SUCCESS", "money": "50.00",
+              "type": "alipay", "param": "999"}
+    forged = dict(params, sign="0" * 32)
+    assert client.get("/api/recharge/futoon/notify", params=forged).json() == {"status": "fail"}
+
+    params["sign"] = fp.generate_sign(params)
+    params["sign_type"] = "MD5"
+    for _ in range(5):
+        assert client.get("/api/recharge/futoon/notify", params=params).json() == {"status": "success"}
+
+    db.expire_all()
+    assert db.query(RechargeRecord).count() == 1
+    # 入账给下单用户，不信任回调里的 param
+    assert wallet.get_balance(db, user_id) == Decimal("50")
+    assert db.get(User, user_id).balance == Decimal("50")
+
+
+if __name__ == "__main__":
+    test_settle_credits_exactly_once()
+    test_notify_verifies_signature_and_ignores_retries()
+    print("✅ 支付入账测试通过")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+测试报表只读引擎
+"""
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, create_read_engine
+from app.models.user import User
+
+
+def _make_engines(tmpdir):
+    """文件数据库（WAL）+ 只读引擎"""
+    url = f"sqlite:///{os.path.join(tmpdir, 'test.db')}"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine), sessionmaker(bind=create_read_engine(url, pool_size=2))
+
+
+def _add_user(Session, name):
+    db = Session()
+    db.add(User(email=f"{name}@example.com", username=name, password_hash="x"))
+    db.commit()
+    db.close()
+
+
+def test_read_session_rejects_writes():
+    """只读连接不能写入"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        Session, ReadSession = _make_engines(tmpdir)
+        _add_user(Session, "alice")
+
+        db = ReadSession()
+        assert db.query(User).count() == 1
+        with pytest.raises(OperationalError):
+            db.execute(text("UPDATE users SET username = 'bob'"))
+        db.close()
+
+
+def test_read_session_sees_stable_snapshot_without_blocking_writer():
+    """只读会话内读取同一个快照，写入方不被阻塞"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        Session, ReadSession = _make_engines(tmpdir)
+        _add_user(Session, "alice")
+
+        reader = ReadSession()
+        assert reader.query(User).count() == 1
+        # 读事务未结束时写入照常提交
+        _add_user(Session, "bob")
+        assert reader.query(User).count() == 1
+        reader.close()
+
+        reader = ReadSession()
+        assert reader.query(User).count() == 2
+        reader.close()
+
+
+if __name__ == "__main__":
+    test_read_session_rejects_writes()
+    test_read_session_sees_stable_snapshot_without_blocking_writer()
+    print("✅ 只读引擎测试通过")
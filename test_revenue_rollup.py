@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+测试经营汇总和汇率
+"""
+import sys
+import os
+from datetime import datetime
+from decimal import Decimal
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.models.user import User
+from app.models.order import Order, CashbackRecord
+from app.models.commission import CommissionRecord
+from app.models.service_price import ServicePrice
+from app.models.revenue_rollup import RevenueRollup
+from app.models.commission import CommissionConfig
+from app.services import fx, revenue_rollup, commission_settlement
+from app.services.commission_worker import publish_order_created, process_batch
+from app.services.commission_recompute import recompute_commissions
+from app.services.commission_rules import invalidate_rate_table
+from test_support import make_session
+
+
+def _setup(db):
+    """一个代理、一个消费者、一个服务（成本 $0.01/件，售价 ¥0.1/件）"""
+    agent = User(email="agent@example.com", username="agent", password_hash="x")
+    consumer = User(email="c@example.com", username="c", password_hash="x")
+    db.add_all([agent, consumer])
+    db.add(ServicePrice(service_id=7, service_name="点赞", api_price=Decimal("0.01"), customer_price=Decimal("0.1")))
+    db.flush()
+    return agent, consumer
+
+
+def _order(db, consumer, agent, created_at, commission="1", unit_cost=None):
+    order = Order(user_id=consumer.id, service_id=7, service_name="点赞", link="l",
+                  quantity=100, charge=Decimal("10"), upstream_unit_cost=unit_cost, created_at=created_at)
+    db.add(order)
+    db.flush()
+    db.add(CashbackRecord(user_id=consumer.id, order_id=order.id, amount=Decimal("0.2"), rate=Decimal("0.02")))
+    db.add(CommissionRecord(agent_id=agent.id, consumer_id=consumer.id, order_id=order.id, commission_type="direct",
+                            commission_rate=Decimal("0.1"), order_amount=Decimal("10"),
+                            commission_amount=Decimal(commission)))
+    db.flush()
+    return order
+
+
+def test_fx_rate_history():
+    """汇率按生效时间取值，表为空时使用默认汇率"""
+    engine, db = make_session()
+    assert fx.get_rate(db) == fx.DEFAULT_USD_CNY
+
+    fx.set_rate(db, Decimal("7.0"), datetime(2024, 1, 1))
+    fx.set_rate(db, Decimal("7.2"), datetime(2024, 6, 1))
+    db.commit()
+    assert fx.get_rate(db) == Decimal("7.2")
+    assert fx.get_rate(db, datetime(2024, 3, 1)) == Decimal("7.0")
+    # 早于第一条汇率时使用最早的汇率
+    assert fx.get_rate(db, datetime(2023, 1, 1)) == Decimal("7.0")
+    history = fx.load_history(db)
+    assert fx.rate_at(history, datetime(2024, 6, 1)) == Decimal("7.2")
+
+
+def test_record_orders_is_incremental_and_idempotent():
+    """订单按小时/天、按服务/代理累加，重复计入会被跳过，重建结果一致"""
+    engine, db = make_session()
+    agent, consumer = _setup(db)
+    fx.set_rate(db, Decimal("7"), datetime(2024, 1, 1))
+    first = _order(db, consumer, agent, datetime(2024, 5, 1, 10, 15))
+    second = _order(db, consumer, agent, datetime(2024, 5, 1, 11, 40), commission="0.5")
+    third = _order(db, consumer, agent, datetime(2024, 5, 3, 9, 0))
+    db.commit()
+
+    assert revenue_rollup.record_orders(db, [first.id, second.id]) == 2
+    assert revenue_rollup.record_orders(db, [first.id, second.id, third.id]) == 1
+    db.commit()
+
+    data = revenue_rollup.query(db, datetime(2024, 5, 1), datetime(2024, 5, 2))
+    assert data["granularity"] == revenue_rollup.HOUR
+    assert len(data["series"]) == 2
+    totals = data["totals"]
+    assert totals["order_count"] == 2
+    assert totals["revenue"] == 20
+    # 成本 = 0.01 * 100 * 7 = 7 元/单
+    assert totals["upstream_cost"] == 14
+    assert totals["cashback"] == 0.4
+    assert totals["commission"] == 1.5
+    assert totals["profit"] == 20 - 14 - 0.4 - 1.5
+    assert data["agents"][0]["agent_id"] == agent.id
+    assert data["agents"][0]["commission"] == 1.5
+
+    month = revenue_rollup.query(db, datetime(2024, 5, 1), datetime(2024, 6, 1))
+    assert month["granularity"] == revenue_rollup.DAY
+    assert month["totals"]["order_count"] == 3
+    assert month["services"][0]["service_name"] == "点赞"
+
+    before = sorted(
+        (r.granularity, r.dimension, r.dimension_id, r.bucket_start, r.order_count, r.revenue, r.commission)
+        for r in db.query(RevenueRollup)
+    )
+    assert revenue_rollup.rebuild(db) == 3
+    db.commit()
+    after = sorted(
+        (r.granularity, r.dimension, r.dimension_id, r.bucket_start, r.order_count, r.revenue, r.commission)
+        for r in db.query(RevenueRollup)
+    )
+    assert before == after
+
+
+def test_upstream_cost_uses_price_at_order_time():
+    """成本按下单时的API单价快照计算，之后调价不影响汇总和重建；无快照的旧订单按当前价估算"""
+    engine, db = make_session()
+    agent, consumer = _setup(db)
+    fx.set_rate(db, Decimal("7"), datetime(2024, 1, 1))
+    snapshot = _order(db, consumer, agent, datetime(2024, 5, 1, 10, 0), unit_cost=Decimal("0.02"))
+    legacy = _order(db, consumer, agent, datetime(2024, 5, 2, 10, 0))
+    db.commit()
+
+    db.query(ServicePrice).filter(ServicePrice.service_id == 7).update({ServicePrice.api_price: Decimal("0.05")})
+    revenue_rollup.record_orders(db, [snapshot.id, legacy.id])
+    db.commit()
+
+    def cost(day):
+        return revenue_rollup.query(db, datetime(2024, 5, day), datetime(2024, 5, day + 1))["totals"]["upstream_cost"]
+
+    # 0.02 * 100 * 7 = 14；旧订单 0.05 * 100 * 7 = 35
+    assert cost(1) == 14
+    assert cost(2) == 35
+
+    db.query(ServicePrice).filter(ServicePrice.service_id == 7).update({ServicePrice.api_price: Decimal("0.5")})
+    revenue_rollup.rebuild(db)
+    db.commit()
+    assert cost(1) == 14
+
+
+def _rollup_rows(db):
+    return sorted(
+        (r.granularity, r.dimension, r.dimension_id, r.bucket_start, r.order_count, r.revenue, r.commission)
+        for r in db.query(RevenueRollup)
+    )
+
+
+def _rebuilt_rows(db):
+    """重建后的汇总行（回滚，不影响当前数据）"""
+    revenue_rollup.rebuild(db)
+    rows = _rollup_rows(db)
+    db.rollback()
+    return rows
+
+
+def test_rollups_follow_worker_recompute_and_reversal():
+    """重建跳过待处理的订单；返佣重算和撤销结算后汇总与重建结果一致"""
+    engine, db = make_session()
+    invalidate_rate_table()
+    agent = User(email="agent@example.com", username="agent", password_hash="x", is_agent=True, agent_level=1)
+    db.add(agent)
+    db.flush()
+    consumer = User(email="c@example.com", username="c", password_hash="x", inviter_id=agent.id)
+    db.add(consumer)
+    db.add(ServicePrice(service_id=7, service_name="点赞", api_price=Decimal("0.01"), customer_price=Decimal("0.1")))
+    db.flush()
+
+    def order():
+        record = Order(user_id=consumer.id, service_id=7, service_name="点赞", link="l", quantity=100,
+                       charge=Decimal("10"), created_at=datetime(2024, 5, 1, 10, 0))
+        db.add(record)
+        db.flush()
+        publish_order_created(db, record)
+        return record
+
+    order()
+    db.commit()
+    process_batch(db)
+
+    # 第二个订单的返佣事件尚未处理时重建，之后返佣任务仍能把它计入汇总
+    order()
+    db.commit()
+    revenue_rollup.rebuild(db)
+    db.commit()
+    process_batch(db)
+    rows = _rollup_rows(db)
+    assert [row[4:] for row in rows if row[:2] == ("day", "agent")] == [(2, Decimal("20"), Decimal("1"))]
+    assert rows == _rebuilt_rows(db)
+
+    # 修改返佣比例后重算，汇总随之调整
+    db.add(CommissionConfig(agent_level=1, direct_rate=Decimal("0.2"), indirect_rate=Decimal("0.01")))
+    db.commit()
+    recompute_commissions(db, restart=True)
+    rows = _rollup_rows(db)
+    assert [row[4:] for row in rows if row[:2] == ("day", "agent")] == [(2, Decimal("20"), Decimal("4"))]
+    assert rows == _rebuilt_rows(db)
+
+    # 结算和撤销只改变支付状态，汇总不变
+    batch = commission_settlement.settle(db, agent_id=agent.id)
+    commission_settlement.reverse(db, batch.id)
+    db.commit()
+    assert _rollup_rows(db) == rows
+
+
+if __name__ == "__main__":
+    test_fx_rate_history()
+    test_record_orders_is_incremental_and_idempotent()
+    test_upstream_cost_uses_price_at_order_time()
+    test_rollups_follow_worker_recompute_and_reversal()
+    print("✅ 经营汇总测试通过")
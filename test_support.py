@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+测试公用工具：内存数据库和 SQL 语句计数
+"""
+import sys
+import os
+from typing import List, Optional, Tuple
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base, attach_archive
+
+
+def make_engine(archive: bool = False) -> Engine:
+    """创建已建好全部表的内存数据库引擎（所有会话共用一个连接）
+
+    archive=True 时挂载内存归档库并建好归档表。
+    """
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    if archive:
+        attach_archive(engine, ":memory:")
+    Base.metadata.create_all(bind=engine)
+    if archive:
+        from app.services.archive import create_archive_tables
+        create_archive_tables(engine)
+    return engine
+
+
+def make_session(archive: bool = False) -> Tuple[Engine, Session]:
+    """创建内存数据库会话，返回 (引擎, 会话)"""
+    engine = make_engine(archive)
+    return engine, sessionmaker(bind=engine)()
+
+
+def count_statements(engine: Engine, prefix: Optional[str] = None) -> List[str]:
+    """记录引擎此后执行的 SQL 语句，返回持续追加的列表
+
+    prefix 不为空时只记录以它开头的语句（如 "UPDATE commission_records"）。
+    """
+    statements: List[str] = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if prefix is None or statement.startswith(prefix):
+            statements.append(statement)
+
+    return statements
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+测试共享模板环境的字节码缓存和片段缓存
+"""
+import sys
+import os
+import tempfile
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import templating
+from app.routers import admin, agent, agent_dashboard, auth, dashboard, recharge
+
+
+def test_routers_share_one_environment_with_bytecode_cache():
+    env = templating.templates.env
+    for module in (admin, agent, agent_dashboard, auth, dashboard, recharge):
+        assert module.templates.env is env
+    assert env.bytecode_cache is not None
+    assert env.get_template("base.html") is env.get_template("base.html")
+
+
+def test_fragment_cache_renders_once_per_version(tmp_path):
+    (tmp_path / "page.html").write_text(
+        '{% cache "table", version %}{% for row in rows() %}<td>{{ row }}</td>{% endfor %}{% endcache %}'
+        '<p>{{ user }}</p>',
+        encoding="utf-8",
+    )
+    env = templating.create_templates(str(tmp_path)).env
+    templating.fragment_cache.clear()
+    calls = []
+
+    def rows():
+        calls.append(1)
+        return ["<a>", "b"]
+
+    page = env.get_template("page.html")
+    assert page.render(version=1, rows=rows, user="甲") == "<td>&lt;a&gt;</td><td>b</td><p>甲</p>"
+    assert page.render(version=1, rows=rows, user="乙") == "<td>&lt;a&gt;</td><td>b</td><p>乙</p>"
+    assert len(calls) == 1
+
+    # 数据版本变化后重新渲染
+    assert page.render(version=2, rows=lambda: ["c"], user="乙") == "<td>c</td><p>乙</p>"
+    assert len(calls) == 1
+
+
+if __name__ == "__main__":
+    test_routers_share_one_environment_with_bytecode_cache()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        test_fragment_cache_renders_once_per_version(Path(tmpdir))
+    print("✅ 模板缓存测试通过")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+测试钱包流水、余额快照和对账
+"""
+import sys
+import os
+import asyncio
+from decimal import Decimal
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy import func
+
+from app.models.user import User
+from app.models.order import Order, CashbackRecord
+from app.models.service_price import ServicePrice
+from app.models.wallet import WalletEntry, WalletSnapshot
+from app.routers import orders
+from app.services import wallet
+from app.services.commission_service import CommissionService
+from test_support import make_session
+
+
+def _user(db, name, balance="0"):
+    user = User(email=f"{name}@example.com", username=name, password_hash="x", balance=Decimal(balance))
+    db.add(user)
+    db.commit()
+    return user
+
+
+def test_balance_is_snapshot_plus_tail():
+    """余额 = 快照 + 之后的流水，汇总后只读尾部"""
+    engine, db = make_session()
+    alice = _user(db, "alice", "100")
+    bob = _user(db, "bob")
+
+    # 期初流水
+    assert wallet.bootstrap(db) == 1
+    wallet.post(db, alice.id, Decimal("-30"), wallet.ORDER, 1)
+    wallet.post(db, alice.id, Decimal("0.6"), wallet.CASHBACK, 1)
+    wallet.post(db, bob.id, Decimal("5"), wallet.COMMISSION)
+    db.commit()
+    assert wallet.get_balance(db, alice.id) == Decimal("70.6")
+
+    assert wallet.rollup(db) == 2
+    db.commit()
+    snapshot = db.get(WalletSnapshot, alice.id)
+    assert Decimal(str(snapshot.balance)) == Decimal("70.6")
+    assert wallet.rollup(db) == 0
+
+    wallet.post(db, alice.id, Decimal("10"), wallet.RECHARGE)
+    db.commit()
+    assert wallet.get_balance(db, alice.id) == Decimal("80.6")
+    assert wallet.get_balance(db, bob.id) == Decimal("5")
+
+    # 再次汇总只累加新流水
+    wallet.rollup(db)
+    db.commit()
+    db.expire_all()
+    assert Decimal(str(db.get(WalletSnapshot, alice.id).balance)) == Decimal("80.6")
+    assert Decimal(str(db.get(WalletSnapshot, bob.id).balance)) == Decimal("5")
+    assert db.query(WalletEntry).count() == 5
+
+
+def test_sync_and_reconcile():
+    """写流水后刷新余额缓存；对账能发现被直接改写的余额"""
+    engine, db = make_session()
+    alice = _user(db, "alice")
+    bob = _user(db, "bob")
+
+    wallet.post(db, alice.id, Decimal("50"), wallet.RECHARGE)
+    wallet.post(db, bob.id, Decimal("20"), wallet.ADMIN_RECHARGE)
+    wallet.sync_balances(db, [alice.id, bob.id])
+    db.commit()
+    db.expire_all()
+    assert Decimal(str(db.get(User, alice.id).balance)) == Decimal("50")
+    assert wallet.reconcile(db)["mismatched"] == 0
+
+    # 绕过流水直接改余额
+    db.get(User, bob.id).balance = Decimal("999")
+    db.commit()
+    wallet.rollup(db)
+    db.commit()
+    for full in (False, True):
+        report = wallet.reconcile(db, full=full)
+        assert report["mismatched"] == 1
+        assert report["details"][0]["user_id"] == bob.id
+        assert report["details"][0]["ledger_balance"] == 20.0
+
+
+def test_sub_cent_orders_and_commissions_are_debited_exactly(monkeypatch):
+    """不足一分的订单扣款、返现和返佣按4位小数记账，余额与订单金额、累计返佣一致"""
+    engine, db = make_session()
+    buyer = _user(db, "buyer")
+    agent = _user(db, "agent")
+    db.add(ServicePrice(service_id=7, service_name="点赞", api_price=Decimal("0.001"), customer_price=Decimal("0.0049")))
+    wallet.post(db, buyer.id, Decimal("1"), wallet.RECHARGE)
+    wallet.sync_balances(db, [buyer.id])
+    db.commit()
+
+    async def current_user(request):
+        return buyer
+
+    async def submit(**kwargs):
+        return {"success": True, "order_id": 1}
+
+    monkeypatch.setattr(orders, "get_current_user", current_user)
+    monkeypatch.setattr(orders.appfuwu_client, "submit_order", submit)
+    for _ in range(100):
+        asyncio.run(orders.submit_order(orders.OrderRequest(service_id=7, link="l", quantity=1), None, db))
+
+    charged = db.query(func.sum(Order.charge)).scalar()
+    cashback = db.query(func.sum(CashbackRecord.amount)).scalar()
+    assert charged == Decimal("0.49")
+    assert wallet.get_balance(db, buyer.id) == Decimal("1") - charged + cashback
+    db.expire_all()
+    assert db.get(User, buyer.id).balance == wallet.get_balance(db, buyer.id)
+    assert db.get(User, buyer.id).total_consumed == charged
+
+    CommissionService(db).credit_agents({agent.id: {"direct": Decimal("0.0049"), "indirect": Decimal("0.0002")}})
+    db.commit()
+    db.expire_all()
+    assert wallet.get_balance(db, agent.id) == db.get(User, agent.id).total_commission == Decimal("0.0051")
+    assert wallet.reconcile(db, full=True)["mismatched"] == 0
+
+
+if __name__ == "__main__":
+    test_balance_is_snapshot_plus_tail()
+    test_sync_and_reconcile()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_sub_cent_orders_and_commissions_are_debited_exactly(monkeypatch)
+    print("✅ 钱包测试通过")